@@ -0,0 +1,137 @@
+"""
+Import time benchmark.
+
+Imports each module in a fresh interpreter, as a container cold
+start or a CLI invocation does, and reports the median import time
+along with the heavy dependencies it loaded. Modules of both
+services are measured, each from the directory of its package.
+
+    python -m benchmarks.bench_import --runs 10
+
+Results can be saved with --output and compared against a previous
+run with --baseline, failing when imports get slower beyond
+--tolerance or load a heavy dependency they did not load before.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Directory each package is imported from
+SOURCES = {
+    "catalog_connector": ROOT,
+    "platform_registry": os.path.join(os.path.dirname(ROOT), "platform-registry"),
+}
+MODULES = (
+    "catalog_connector.main",
+    "catalog_connector.bulk_load",
+    "catalog_connector.export",
+    "platform_registry.registry",
+    "platform_registry.main",
+)
+# Dependencies that only some code paths need
+HEAVY = (
+    "pandas",
+    "pyangbind",
+    "catalog_connector.models.yang.yang_catalog",
+    "ncclient",
+    "pygnmi",
+    "grpc",
+)
+RUNS = 5
+# Allowed relative regression against the baseline
+TOLERANCE = 0.2
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = {heavy!r}
+print(json.dumps({{
+    "seconds": seconds,
+    "heavy": [name for name in heavy if name in sys.modules],
+}}))
+"""
+
+
+def measure(module: str, runs: int = RUNS) -> dict:
+    """
+    Median import time of module over runs fresh interpreters.
+    """
+    script = SCRIPT.format(module=module, heavy=HEAVY)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=SOURCES.get(module.split(".")[0]),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {
+        "module": module,
+        "import_ms": round(statistics.median(s["seconds"] for s in samples) * 1000, 1),
+        "heavy": samples[-1]["heavy"],
+    }
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """
+    List regressions of results against baseline, matched by module.
+    """
+    regressions = []
+    previous = {result["module"]: result for result in baseline}
+    for result in results:
+        before = previous.get(result["module"])
+        if not before:
+            continue
+        if result["import_ms"] > before["import_ms"] * (1 + tolerance):
+            regressions.append(
+                "{0}: {1} ms, was {2}".format(
+                    result["module"], result["import_ms"], before["import_ms"]
+                )
+            )
+        loaded = sorted(set(result["heavy"]) - set(before["heavy"]))
+        if loaded:
+            regressions.append(
+                "{0}: now loads {1}".format(result["module"], ", ".join(loaded))
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--output", help="Save results to this JSON file.")
+    parser.add_argument("--baseline", help="JSON results of a previous run.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = []
+    print("{0:<36} {1:>10}  {2}".format("module", "import ms", "heavy"))
+    for module in args.modules:
+        result = measure(module, args.runs)
+        results.append(result)
+        print(
+            "{module:<36} {import_ms:>10}  {0}".format(
+                ", ".join(result["heavy"]) or "-", **result
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION {0}".format(regression))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,199 @@
+"""
+End-to-end synchronization benchmark.
+
+Runs catalog_connector.main.main over synthetic catalogs against an
+in-process NGSI-LD broker stand-in, one fresh process per catalog
+size so that peak RSS is measured independently, and reports
+modules per second, peak RSS and request counts.
+
+    python -m benchmarks.bench_sync --sizes 1000 10000 --fast-path
+
+Results can be saved with --output and compared against a previous
+run with --baseline, failing when throughput drops or memory grows
+beyond --tolerance.
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+from typing import List
+
+from benchmarks.synthetic_catalog import generate_catalog
+from catalog_connector.clients.ngsi_ld import NGSILDAPI
+
+SIZES = (1000, 10000, 100000)
+# Allowed relative regression against the baseline
+TOLERANCE = 0.2
+
+
+class BrokerResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+
+
+class InProcessBroker(NGSILDAPI):
+    """
+    NGSI-LD broker stand-in taking batch upserts in memory.
+    Request bodies are encoded as the HTTP client would do.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        self.bytes = 0
+        self.entities = {}
+
+    def batchEntityUpsert(self, entities: list, options: str = "update"):
+        self.requests += 1
+        self.bytes += len(json.dumps(entities).encode("utf-8"))
+        for entity in entities:
+            self.entities[entity["id"]] = entity
+        if self.latency:
+            time.sleep(self.latency)
+        return BrokerResponse(204)
+
+
+class SyntheticCatalogAPI:
+    """
+    YANG Catalog API stand-in serving a generated catalog.
+    """
+
+    def __init__(self, catalog: dict):
+        self.body = json.dumps(catalog).encode("utf-8")
+
+    def get_whole_catalog(self) -> dict:
+        return json.loads(self.body)
+
+    def open_whole_catalog(self):
+        return io.BytesIO(self.body)
+
+
+def run(size: int, options: dict) -> dict:
+    from catalog_connector.main import main
+
+    catalog_api = SyntheticCatalogAPI(generate_catalog(size, options["seed"]))
+    broker = InProcessBroker(options["latency"])
+    start = time.perf_counter()
+    main(
+        broker,
+        False,
+        stream=options["stream"],
+        fast=options["fast"],
+        yangcatalog_api=catalog_api,
+        workers=options["workers"],
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "modules": size,
+        "seconds": round(elapsed, 3),
+        "modules_per_second": round(size / elapsed, 1),
+        # Kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "requests": broker.requests,
+        "request_bytes": broker.bytes,
+        "entities": len(broker.entities),
+    }
+
+
+def run_isolated(size: int, options: dict) -> dict:
+    # Fresh process so that peak RSS only accounts this run
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run, (size, options))
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """
+    List regressions of results against baseline, matched by size.
+    """
+    regressions = []
+    previous = {result["modules"]: result for result in baseline}
+    for result in results:
+        before = previous.get(result["modules"])
+        if not before:
+            continue
+        minimum = before["modules_per_second"] * (1 - tolerance)
+        if result["modules_per_second"] < minimum:
+            regressions.append(
+                "{0} modules: {1} modules/s, was {2}".format(
+                    result["modules"],
+                    result["modules_per_second"],
+                    before["modules_per_second"],
+                )
+            )
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                "{0} modules: peak RSS {1} MB, was {2}".format(
+                    result["modules"], result["peak_rss_mb"], before["peak_rss_mb"]
+                )
+            )
+        if result["requests"] > before["requests"] * (1 + tolerance):
+            regressions.append(
+                "{0} modules: {1} requests, was {2}".format(
+                    result["modules"], result["requests"], before["requests"]
+                )
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fast-path", dest="fast", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Simulated broker latency per request, in seconds.",
+    )
+    parser.add_argument("--output", help="Save results to this JSON file.")
+    parser.add_argument("--baseline", help="JSON results of a previous run.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    options = {
+        "seed": args.seed,
+        "fast": args.fast,
+        "stream": args.stream,
+        "workers": args.workers,
+        "latency": args.latency,
+    }
+    results = []
+    print(
+        "{0:>8} {1:>9} {2:>10} {3:>9} {4:>9} {5:>12}".format(
+            "modules", "seconds", "modules/s", "rss MB", "requests", "bytes"
+        )
+    )
+    for size in args.sizes:
+        result = run_isolated(size, options)
+        results.append(result)
+        print(
+            "{modules:>8} {seconds:>9} {modules_per_second:>10} "
+            "{peak_rss_mb:>9} {requests:>9} {request_bytes:>12}".format(**result)
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"options": options, "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["options"] != options:
+            print("WARNING baseline was run with {0}".format(baseline["options"]))
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION {0}".format(regression))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,144 @@
+import json
+import random
+from typing import List
+
+ORGANIZATIONS = ("ietf", "ieee", "openconfig", "cisco", "juniper", "nokia", "huawei")
+WORKING_GROUPS = ("netmod", "netconf", "opsawg", "rtgwg", "teas", "i2rs")
+MATURITY_LEVELS = ("ratified", "adopted", "initial", "not-applicable")
+
+# Share of dependencies naming modules absent from the catalog
+GHOST_RATIO = 0.05
+# Median length of description leafs, in characters
+DESCRIPTION_MEDIAN = 600
+
+WORDS = (
+    "This module contains a collection of YANG definitions for managing "
+    "network devices interfaces routing policies and their operational state "
+    "as defined in the corresponding RFC including configuration data nodes"
+).split()
+
+
+def _revision(rng: random.Random) -> str:
+    return "{0}-{1:02d}-{2:02d}".format(
+        rng.randint(2010, 2023), rng.randint(1, 12), rng.randint(1, 28)
+    )
+
+
+def _text(rng: random.Random, median: int) -> str:
+    # Lengths follow a log-normal distribution, with a long
+    # tail of a few very big descriptions as in YANG Catalog
+    length = int(rng.lognormvariate(0, 1) * median)
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def generate_catalog(
+    size: int,
+    seed: int = 0,
+    ghost_ratio: float = GHOST_RATIO,
+    description_median: int = DESCRIPTION_MEDIAN,
+) -> dict:
+    """
+    Generate a YANG Catalog dump of the given number of modules.
+
+    Module names get one to three revisions, and about a tenth
+    of the modules are submodules. Dependencies are drawn with
+    a Zipf-like popularity, so that a few base modules (the
+    ietf-yang-types of the catalog) are imported by most modules,
+    and reference their targets by revision, by schema URL or by
+    name only. A share of them point to modules that are not in
+    the catalog. Dependents are the reverse of the dependencies.
+    """
+    rng = random.Random(seed)
+    modules: List[dict] = []
+    while len(modules) < size:
+        name = "{0}-module-{1}".format(rng.choice(ORGANIZATIONS), len(modules))
+        organization = name.split("-")[0]
+        module_type = "submodule" if rng.random() < 0.1 else "module"
+        for revision in sorted({_revision(rng) for _ in range(rng.randint(1, 3))}):
+            if len(modules) >= size:
+                break
+            module = {
+                "name": name,
+                "revision": revision,
+                "organization": organization,
+                "namespace": "urn:{0}:params:xml:ns:yang:{1}".format(
+                    organization, name
+                ),
+                "module-type": module_type,
+                "schema": "https://raw.githubusercontent.com/YangModels/yang/"
+                "main/standard/{0}@{1}.yang".format(name, revision),
+                "prefix": name.split("-")[-1],
+                "yang-version": rng.choice(("1.0", "1.1")),
+                "maturity-level": rng.choice(MATURITY_LEVELS),
+                "compilation-status": rng.choice(
+                    ("passed", "passed-with-warnings", "failed")
+                ),
+                "description": _text(rng, description_median),
+                "contact": _text(rng, description_median // 4),
+                "reference": "https://datatracker.ietf.org/doc/{0}".format(name),
+                "author-email": "{0}@example.org".format(organization),
+                "expired": rng.choice((True, False, "not-applicable")),
+            }
+            if organization == "ietf":
+                module["ietf"] = {"ietf-wg": rng.choice(WORKING_GROUPS)}
+            if module_type == "submodule" and modules:
+                module["belongs-to"] = rng.choice(modules)["name"]
+            modules.append(module)
+
+    dependents = {}
+    for index, module in enumerate(modules):
+        dependencies = {}
+        for _ in range(min(int(rng.paretovariate(1.5)) + 1, 40)):
+            if rng.random() < ghost_ratio:
+                ghost = "ghost-module-{0}".format(rng.randrange(size))
+                dependency = {
+                    "name": ghost,
+                    "schema": "https://example.org/{0}@2015-02-03.yang".format(ghost),
+                }
+            else:
+                # Low indexes are picked far more often
+                target = modules[int(len(modules) * rng.random() ** 3)]
+                if target is module:
+                    continue
+                dependency = {"name": target["name"]}
+                kind = rng.random()
+                if kind < 0.4:
+                    dependency["revision"] = target["revision"]
+                elif kind < 0.8:
+                    dependency["schema"] = target["schema"]
+                dependents.setdefault(id(target), []).append(
+                    {
+                        "name": module["name"],
+                        "revision": module["revision"],
+                        "schema": module["schema"],
+                    }
+                )
+            dependencies[dependency["name"]] = dependency
+        if dependencies:
+            module["dependencies"] = list(dependencies.values())
+    for module in modules:
+        if id(module) in dependents:
+            # Keep the first entry per name, as pyangbind merges them
+            unique = {}
+            for dependent in dependents[id(module)]:
+                unique.setdefault(dependent["name"], dependent)
+            module["dependents"] = list(unique.values())
+    return {"yang-catalog:catalog": {"modules": {"module": modules}}}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic YANG Catalog.")
+    parser.add_argument("size", type=int, help="Number of modules.")
+    parser.add_argument("output", help="Output JSON file.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.output, "w") as f:
+        json.dump(generate_catalog(args.size, args.seed), f)
@@ -0,0 +1,111 @@
+import logging
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from catalog_connector.clients.ngsi_ld import (
+    MAX_BATCH_BYTES,
+    MAX_BATCH_ENTITIES,
+    entity_size,
+)
+
+logger = logging.getLogger(__name__)
+
+# Initial number of entities per upsert batch
+INITIAL_BATCH_ENTITIES = 20
+# Broker latency above which batches are shrunk, in seconds
+TARGET_LATENCY = 2.0
+
+# Replies meaning that the request body was too big
+PAYLOAD_TOO_LARGE_STATUS = (413,)
+
+
+class AdaptiveBatcher:
+    """
+    Groups serialized entities into upsert batches bounded by
+    payload bytes and entity count.
+
+    The entity count target follows an additive-increase,
+    multiplicative-decrease policy driven by the broker replies:
+    it grows by one entity after every fast, successful batch,
+    and it is shrunk when the broker is slow or fails. Requests
+    rejected for being too big also halve the bytes target, which
+    grows back by min_bytes after every fast, successful batch.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_BATCH_BYTES,
+        max_entities: int = MAX_BATCH_ENTITIES,
+        initial_entities: int = INITIAL_BATCH_ENTITIES,
+        target_latency: float = TARGET_LATENCY,
+        min_bytes: int = 16 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entities = max(1, max_entities)
+        self.min_bytes = min(min_bytes, max_bytes)
+        self.target_latency = target_latency
+        self.bytes_target = max_bytes
+        self.entities_target = max(1, min(initial_entities, self.max_entities))
+        self.sent_entities = 0
+        self.sent_bytes = 0
+        self.busy_time = 0.0
+
+    def batches(self, entities: Iterable[dict]) -> Iterator[Tuple[List[dict], int]]:
+        """
+        Lazily group entities into batches using the current targets.
+        Yields each batch along with its payload size in bytes.
+        """
+        batch = []
+        batch_bytes = 2
+        for entity in entities:
+            size = entity_size(entity) + 2
+            if batch and (
+                batch_bytes + size > self.bytes_target
+                or len(batch) >= self.entities_target
+            ):
+                yield batch, batch_bytes
+                batch = []
+                batch_bytes = 2
+            if size > self.bytes_target:
+                logger.warning(
+                    "Entity {0} of {1} bytes exceeds batch size target".format(
+                        entity.get("id"), size
+                    )
+                )
+            batch.append(entity)
+            batch_bytes += size
+        if batch:
+            yield batch, batch_bytes
+
+    def record(self, entities: int, size: int, latency: float, status: Optional[int]):
+        """
+        Adjust targets from the outcome of a batch upsert.
+        Status is None when the request could not be completed.
+        """
+        if status is None or status >= 500 or status in PAYLOAD_TOO_LARGE_STATUS:
+            self.entities_target = max(1, self.entities_target // 2)
+            if status in PAYLOAD_TOO_LARGE_STATUS:
+                self.bytes_target = max(self.min_bytes, self.bytes_target // 2)
+            logger.info(
+                "Shrinking batches to {0} entities and {1} bytes".format(
+                    self.entities_target, self.bytes_target
+                )
+            )
+            return
+        self.sent_entities += entities
+        self.sent_bytes += size
+        self.busy_time += latency
+        if latency > self.target_latency:
+            self.entities_target = max(1, int(self.entities_target * 0.75))
+            return
+        if entities >= self.entities_target:
+            # Only grow when the batch actually reached the target
+            self.entities_target = min(self.max_entities, self.entities_target + 1)
+        self.bytes_target = min(self.max_bytes, self.bytes_target + self.min_bytes)
+
+    def throughput(self) -> float:
+        """
+        Entities upserted per second of broker time.
+        """
+        if not self.busy_time:
+            return 0.0
+        return self.sent_entities / self.busy_time
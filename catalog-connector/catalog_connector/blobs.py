@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from catalog_connector.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Text attributes that can be moved out of module entities
+OFFLOAD_ATTRIBUTES = ("description", "contact", "reference")
+# Texts up to this size in bytes are kept inline
+MIN_SIZE = 512
+
+
+class BlobStore:
+    """
+    Content-addressed store of text blobs, written as static files
+    below directory and served from base_url, e.g. by the static
+    file server of context-catalog. Blobs are named after the
+    SHA-256 of their content, so identical texts are stored once.
+    """
+
+    def __init__(self, directory: str, base_url: str, min_size: int = MIN_SIZE):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.min_size = min_size
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def settings(self) -> str:
+        """
+        Settings that shape the offloaded entities, hashed into module
+        fingerprints so that changing them rewrites every entity.
+        """
+        return "blobs:{0}:{1}".format(self.base_url, self.min_size)
+
+    def put(self, text: str) -> str:
+        """
+        Store text, unless already present, and return its URL.
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        name = "{0}/{1}.txt".format(digest[:2], digest)
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Blobs may be written concurrently by builder processes
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+            METRICS.count("blobs_written")
+        return "{0}/{1}".format(self.base_url, name)
+
+    def offload(self, entity: dict) -> dict:
+        """
+        Replace large text attributes of a serialized entity with
+        the URL of their blob, along with their size in bytes.
+        """
+        for attribute in OFFLOAD_ATTRIBUTES:
+            prop = entity.get(attribute)
+            if not prop or not isinstance(prop.get("value"), str):
+                continue
+            size = len(prop["value"].encode("utf-8"))
+            if size <= self.min_size:
+                continue
+            entity[attribute] = {
+                "type": "Property",
+                "value": self.put(prop["value"]),
+                "size": {"type": "Property", "value": size},
+            }
+            METRICS.count("blob_bytes_offloaded", size)
+        return entity
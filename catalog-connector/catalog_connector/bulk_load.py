@@ -0,0 +1,164 @@
+import argparse
+import logging
+import sys
+
+from catalog_connector.batching import TARGET_LATENCY, AdaptiveBatcher
+from catalog_connector.clients.ngsi_ld import (
+    MAX_BATCH_BYTES,
+    MAX_BATCH_ENTITIES,
+    NGSILDAPI,
+)
+from catalog_connector.clients.retry import RETRY_BUDGET
+from catalog_connector.export import DeadLetterQueue, iter_entities
+from catalog_connector.metrics import METRICS
+from catalog_connector.upsert import MAX_IN_FLIGHT, BatchUpserter, UpsertError
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_load(
+    ngsi_ld_api: NGSILDAPI,
+    path: str,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    batcher: AdaptiveBatcher = None,
+    dead_letters: DeadLetterQueue = None,
+) -> int:
+    """
+    Stream entities exported by catalog_connector.main --export,
+    or dead-lettered by it, into the broker through pipelined
+    batch upserts. Returns the number of batches whose failed
+    entities were neither loaded nor dead-lettered.
+    """
+    if batcher is None:
+        batcher = AdaptiveBatcher()
+    with BatchUpserter(
+        ngsi_ld_api,
+        max_in_flight,
+        "update",
+        batcher,
+        dead_letters=dead_letters,
+    ) as upserter:
+        for batch_entities, batch_bytes in batcher.batches(iter_entities(path)):
+            upserter.submit(batch_entities, size=batch_bytes)
+    logger.info(
+        "Loaded {0} entities ({1} bytes) from {2} in {3} batches, {4} failed".format(
+            batcher.sent_entities,
+            batcher.sent_bytes,
+            path,
+            upserter.submitted,
+            upserter.failed,
+        )
+    )
+    for line in METRICS.report():
+        logger.info(line)
+    return upserter.unacknowledged
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="'%(asctime)s - %(name)s - %(levelname)s - %(message)s'",
+    )
+    parser = argparse.ArgumentParser(
+        description="Load exported NGSI-LD entities into a broker."
+    )
+    parser.add_argument("path", help="Newline-delimited JSON file, may be gzipped.")
+    parser.add_argument(
+        "--broker-uri",
+        dest="broker_uri",
+        default="http://localhost:9090",
+        required=False,
+        help="NGSI-LD Context Broker URI.",
+    )
+    parser.add_argument(
+        "--context-catalog-uri",
+        dest="context_catalog_uri",
+        default="http://context-catalog:8080/context.jsonld",
+        required=False,
+        help="Context Catalog URI.",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        dest="max_in_flight",
+        type=int,
+        default=MAX_IN_FLIGHT,
+        required=False,
+        help="Maximum number of batch upserts sent concurrently to the broker.",
+    )
+    parser.add_argument(
+        "--retry-budget",
+        dest="retry_budget",
+        type=float,
+        default=RETRY_BUDGET,
+        required=False,
+        help="Seconds a failed batch upsert keeps being retried.",
+    )
+    parser.add_argument(
+        "--batch-bytes",
+        dest="batch_bytes",
+        type=int,
+        default=MAX_BATCH_BYTES,
+        required=False,
+        help="Maximum payload bytes of a batch upsert request.",
+    )
+    parser.add_argument(
+        "--batch-entities",
+        dest="batch_entities",
+        type=int,
+        default=MAX_BATCH_ENTITIES,
+        required=False,
+        help="Maximum number of entities of a batch upsert request.",
+    )
+    parser.add_argument(
+        "--target-latency",
+        dest="target_latency",
+        type=float,
+        default=TARGET_LATENCY,
+        required=False,
+        help="Broker latency in seconds above which batches are shrunk.",
+    )
+    parser.add_argument(
+        "--dead-letter",
+        dest="dead_letter",
+        default=None,
+        required=False,
+        help="Append batches that failed for good to this file instead of "
+        "aborting. Must differ from the file being loaded.",
+    )
+    known_args = parser.parse_args()
+
+    ngsi_ld_api = NGSILDAPI(
+        url=known_args.broker_uri,
+        context=known_args.context_catalog_uri,
+        retry_budget=known_args.retry_budget,
+    )
+    batcher = AdaptiveBatcher(
+        max_bytes=known_args.batch_bytes,
+        max_entities=known_args.batch_entities,
+        target_latency=known_args.target_latency,
+    )
+    dead_letters = None
+    if known_args.dead_letter:
+        dead_letters = DeadLetterQueue(known_args.dead_letter)
+    try:
+        unacknowledged = bulk_load(
+            ngsi_ld_api,
+            known_args.path,
+            known_args.max_in_flight,
+            batcher,
+            dead_letters,
+        )
+        if unacknowledged:
+            logger.error(
+                "Bulk load incomplete, entities of {0} batches failed".format(
+                    unacknowledged
+                )
+            )
+            sys.exit(1)
+    except UpsertError as e:
+        logger.error("Bulk load aborted: {0}".format(e))
+        sys.exit(1)
+    finally:
+        if dead_letters is not None:
+            dead_letters.close()
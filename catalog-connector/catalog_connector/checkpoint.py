@@ -0,0 +1,151 @@
+import hashlib
+import heapq
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotDigest:
+    """
+    Content hash of the YANG Catalog modules, used to
+    identify the catalog snapshot a checkpoint refers to.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.blake2b(digest_size=16)
+
+    def feed(self, modules: Iterable[dict]) -> Iterator[dict]:
+        """
+        Hash modules while passing them through.
+        """
+        for module in modules:
+            self._digest.update(
+                json.dumps(module, separators=(",", ":")).encode("utf-8")
+            )
+            yield module
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+class Checkpoint:
+    """
+    Persistent synchronization progress: the catalog snapshot
+    being synchronized and the number of modules, in catalog
+    order, whose entities were all acknowledged by the broker.
+    Stored as JSON, replaced atomically on every save.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.snapshot: Optional[str] = None
+        self.offset = 0
+        self.module_id: Optional[str] = None
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                self.snapshot = data["snapshot"]
+                self.offset = data["offset"]
+                self.module_id = data.get("module")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(
+                    "Ignoring unreadable checkpoint {0}: {1}".format(path, e)
+                )
+
+    def resume_offset(self, snapshot: str) -> int:
+        """
+        Number of modules to skip for the given catalog snapshot.
+        A checkpoint of another snapshot is discarded.
+        """
+        if self.snapshot != snapshot:
+            if self.snapshot is not None:
+                logger.info("Catalog changed since checkpoint, starting over")
+            self.snapshot = snapshot
+            self.offset = 0
+            self.module_id = None
+        elif self.offset:
+            logger.info(
+                "Resuming synchronization after module {0} ({1})".format(
+                    self.offset, self.module_id
+                )
+            )
+        return self.offset
+
+    def save(self, offset: int, module_id: Optional[str] = None):
+        self.offset = offset
+        self.module_id = module_id
+        tmp_path = "{0}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"snapshot": self.snapshot, "offset": offset, "module": module_id}, f
+            )
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """
+        Remove the checkpoint once the synchronization completes.
+        """
+        self.offset = 0
+        self.module_id = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ProgressTracker:
+    """
+    Maps acknowledged upsert batches back to catalog offsets.
+
+    Entities are numbered in the order they are produced, and each
+    produced batch of entities is tagged with the catalog offset
+    reached once its modules were read. As batches may be
+    acknowledged out of order, the offset only advances up to the
+    first entity not yet acknowledged. Batches may be produced and
+    acknowledged from different threads.
+    """
+
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+        self.module_id: Optional[str] = None
+        self._produced = 0
+        self._acked = 0
+        self._ranges: List[tuple] = []
+        self._marks = deque()
+        self._lock = threading.Lock()
+
+    def produced(self, entities: List[dict], offset: int) -> range:
+        """
+        Register entities built from modules up to offset.
+        Returns their sequence numbers.
+        """
+        with self._lock:
+            start = self._produced
+            self._produced += len(entities)
+            module_id = entities[-1]["id"] if entities else None
+            self._marks.append((self._produced, offset, module_id))
+            self._advance()
+            return range(start, self._produced)
+
+    def acknowledge(self, start: int, end: int) -> bool:
+        """
+        Record that entities [start, end) were acknowledged.
+        Returns True when the committed offset advanced.
+        """
+        with self._lock:
+            heapq.heappush(self._ranges, (start, end))
+            return self._advance()
+
+    def _advance(self) -> bool:
+        while self._ranges and self._ranges[0][0] <= self._acked:
+            self._acked = max(self._acked, heapq.heappop(self._ranges)[1])
+        advanced = False
+        while self._marks and self._marks[0][0] <= self._acked:
+            _, self.offset, module_id = self._marks.popleft()
+            self.module_id = module_id or self.module_id
+            advanced = True
+        return advanced
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import BinaryIO, Optional
+
+logger = logging.getLogger(__name__)
+
+# Serve cached bodies without revalidation for one hour
+MAX_AGE = 3600
+# Keep up to 2 GiB of compressed bodies
+MAX_SIZE = 2 * 1024**3
+
+
+class CacheEntry:
+    def __init__(self, body_path: str, meta: dict):
+        self.body_path = body_path
+        self.meta = meta
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.meta.get("etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.meta.get("last_modified")
+
+    def age(self) -> float:
+        return time.time() - self.meta["validated_at"]
+
+    def open(self) -> BinaryIO:
+        """
+        Open the decompressed body for reading.
+        """
+        return gzip.open(self.body_path, "rb")
+
+
+class HTTPCache:
+    """
+    On-disk cache of HTTP response bodies. Bodies are stored gzipped
+    along with their ETag and Last-Modified validators so that they
+    can be revalidated through conditional requests.
+    Least recently used entries are evicted beyond max_size bytes.
+    """
+
+    def __init__(
+        self, directory: str, max_age: float = MAX_AGE, max_size: int = MAX_SIZE
+    ):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key)
+        return "{0}.gz".format(base), "{0}.json".format(base)
+
+    def _write_meta(self, meta_path: str, meta: dict):
+        tmp_path = "{0}.tmp".format(meta_path)
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not os.path.exists(body_path):
+            return None
+        meta["used_at"] = time.time()
+        self._write_meta(meta_path, meta)
+        return CacheEntry(body_path, meta)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.age() < self.max_age
+
+    def revalidate(self, url: str, entry: CacheEntry):
+        """
+        Mark entry as validated after a 304 Not Modified reply.
+        """
+        _, meta_path = self._paths(url)
+        entry.meta["validated_at"] = time.time()
+        self._write_meta(meta_path, entry.meta)
+
+    def put(
+        self,
+        url: str,
+        body: BinaryIO,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CacheEntry:
+        """
+        Store the body read from the given file object.
+        """
+        body_path, meta_path = self._paths(url)
+        tmp_path = "{0}.tmp".format(body_path)
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            shutil.copyfileobj(body, f)
+        os.replace(tmp_path, body_path)
+        now = time.time()
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "validated_at": now,
+            "used_at": now,
+            "size": os.path.getsize(body_path),
+        }
+        self._write_meta(meta_path, meta)
+        self.evict(keep=meta_path)
+        return CacheEntry(body_path, meta)
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Remove least recently used entries until the cache
+        fits in max_size bytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries.append((meta.get("used_at", 0), meta.get("size", 0), meta_path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, meta_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if meta_path == keep:
+                continue
+            body_path = "{0}.gz".format(meta_path[: -len(".json")])
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    pass
+            total_size -= size
+            logger.info("Evicted {0} from HTTP cache".format(body_path))
@@ -1,14 +1,50 @@
+import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from enum import Enum
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote, urljoin
 
 import requests
 from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
+
+# Relative, as this client is shared by several packages
+from .retry import RETRY_BUDGET, retry_policy
 
 logger = logging.getLogger(__name__)
 
 CORE_CONTEXT = "https://uri.etsi.org/ngsi-ld/v1/ngsi-ld-core-context.jsonld"
 
+# Bounds for the payload of batch entity operations
+MAX_BATCH_BYTES = 512 * 1024
+MAX_BATCH_ENTITIES = 100
+
+# Entities requested per page of query results
+PAGE_SIZE = 100
+
+# Bound for the URL of queries by entity IDs, below common server limits
+MAX_URL_LENGTH = 2048
+
+# Entries kept by the read cache, and seconds before they expire
+CACHE_SIZE = 1024
+CACHE_TTL = 60.0
+
+# Times the failed entities of a batch are sent again
+ENTITY_RETRIES = 1
+# Batch replies that only concern the entities of the batch
+BATCH_ERROR_STATUS = (207, 400)
+# NGSI-LD error types not worth sending the entity again
+PERMANENT_ERRORS = ("BadRequestData", "InvalidRequest", "AlreadyExists")
+
+# Connections kept alive to the broker
+POOL_SIZE = 10
+# Connect and read timeouts in seconds, None waits forever
+Timeout = Optional[Union[float, Tuple[float, float]]]
+
 
 class Options(Enum):
     keyValues = "keyValues"
@@ -17,6 +53,271 @@ class Options(Enum):
     update = "update"
 
 
+def entity_size(entity: dict) -> int:
+    """
+    Size in bytes of the entity once encoded in a request body.
+    """
+    return len(json.dumps(entity).encode("utf-8"))
+
+
+def chunk_entities(
+    entities: Iterable[dict],
+    max_bytes: int = MAX_BATCH_BYTES,
+    max_entities: int = MAX_BATCH_ENTITIES,
+) -> Iterator[List[dict]]:
+    """
+    Group entities into batches bounded both by
+    payload bytes and by number of entities.
+    An entity bigger than max_bytes is sent alone.
+    """
+    batch = []
+    batch_bytes = 2
+    for entity in entities:
+        size = entity_size(entity) + 2
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_entities):
+            yield batch
+            batch = []
+            batch_bytes = 2
+        batch.append(entity)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def chunk_ids(entity_ids: Iterable[str], max_length: int) -> Iterator[List[str]]:
+    """
+    Group entity IDs so that each group, comma separated and
+    URL encoded, fits within max_length characters.
+    """
+    chunk: List[str] = []
+    length = 0
+    for entity_id in entity_ids:
+        # Encoded ID, after an encoded separator but for the first one
+        size = len(quote(entity_id, safe=""))
+        if chunk and length + 3 + size > max_length:
+            yield chunk
+            chunk = []
+            length = 0
+        if chunk:
+            size += 3
+        chunk.append(entity_id)
+        length += size
+    if chunk:
+        yield chunk
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of batch entity operations: the IDs of the entities that
+    succeeded, the ProblemDetails of the ones that failed, the
+    number of requests it took along with their total latency, and
+    the status of the first reply.
+    """
+
+    success: List[str]
+    errors: Dict[str, dict]
+    requests: int = 1
+    latency: float = 0.0
+    status: Optional[int] = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def retryable(self) -> List[str]:
+        """
+        IDs of the failed entities that may succeed if sent again.
+        """
+        return [
+            entity_id
+            for entity_id, error in self.errors.items()
+            if str(error.get("type", "")).split("/")[-1] not in PERMANENT_ERRORS
+            and error.get("status") != 400
+        ]
+
+    def merge(self, other: "BatchResult") -> "BatchResult":
+        """
+        Combine with the result of other entities, or of
+        some of the same entities sent again.
+        """
+        errors = {
+            entity_id: error
+            for entity_id, error in self.errors.items()
+            if entity_id not in other.success and entity_id not in other.errors
+        }
+        errors.update(other.errors)
+        return BatchResult(
+            [entity_id for entity_id in self.success if entity_id not in errors]
+            + other.success,
+            errors,
+            self.requests + other.requests,
+            self.latency + other.latency,
+            self.status if self.status is not None else other.status,
+        )
+
+
+def parse_batch_result(
+    response: requests.Response, entities: List[dict], latency: float = 0.0
+) -> BatchResult:
+    """
+    Read the per entity outcome of a batch entity operation reply.
+    Entities missing from a multi-status reply are deemed failed.
+    """
+    entity_ids = [entity["id"] for entity in entities]
+    status = response.status_code
+    if response.ok and status != 207:
+        return BatchResult(entity_ids, {}, 1, latency, status)
+    try:
+        body = response.json()
+    except (AttributeError, ValueError):
+        body = None
+    if not isinstance(body, dict) or "errors" not in body:
+        # Whole batch rejected
+        error = {
+            "title": "Batch failed with status {0}".format(response.status_code),
+            "detail": response.text,
+        }
+        if isinstance(body, dict):
+            error.update(body)
+        error.setdefault("status", response.status_code)
+        return BatchResult(
+            [], {entity_id: error for entity_id in entity_ids}, 1, latency, status
+        )
+    success = set(body.get("success") or [])
+    errors = {}
+    for entry in body["errors"]:
+        error = entry.get("error") or {}
+        errors[entry.get("entityId")] = (
+            error if isinstance(error, dict) else {"title": str(error)}
+        )
+    for entity_id in entity_ids:
+        if entity_id not in success and entity_id not in errors:
+            errors[entity_id] = {"title": "Missing from batch result"}
+    return BatchResult(
+        [entity_id for entity_id in entity_ids if entity_id in success],
+        errors,
+        1,
+        latency,
+        status,
+    )
+
+
+def log_batch_errors(result: BatchResult):
+    for entity_id, error in result.errors.items():
+        logger.error(
+            "Upsert of {0} failed: {1} {2}".format(
+                entity_id, error.get("title", ""), error.get("detail", "")
+            )
+        )
+
+
+# Marks a read cache miss
+_MISS = object()
+
+
+class ReadCache:
+    """
+    Client side cache of entity retrievals and queries, expiring
+    entries after ttl seconds and evicting the least recently used
+    ones past maxsize. The client's own writes of an entity drop its
+    entries, along with every query as it may match the entity.
+    Cached entities are copied so that callers may modify them.
+
+    Writes are numbered by generation, so that the result of a read
+    which started before a write of the same entity, or before any
+    write for queries, is not cached after the write dropped it.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        # Generation of the last write of recently written entities,
+        # older writes being only known to be before the floor
+        self._written: OrderedDict = OrderedDict()
+        self._floor = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def key(kind: str, params: dict) -> tuple:
+        """
+        Key of a request, independent of the order of its
+        parameters and of the attributes it selects.
+        """
+        params = dict(params)
+        if params.get("attrs"):
+            params["attrs"] = ",".join(sorted(params["attrs"].split(",")))
+        return (
+            kind,
+            tuple(sorted((name, str(value)) for name, value in params.items())),
+        )
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return _MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return deepcopy(entry[1])
+
+    def generation(self) -> int:
+        """
+        Current generation, to be taken before a read
+        whose result is then put with it.
+        """
+        with self._lock:
+            return self._generation
+
+    def _stale(self, key: tuple, generation: int) -> bool:
+        if key[0] == "query":
+            return generation < self._generation
+        entity_id = dict(key[1]).get("id")
+        return generation < self._written.get(entity_id, self._floor)
+
+    def put(self, key: tuple, value, generation: Optional[int] = None):
+        """
+        Cache the result of a read, unless a write it may not
+        reflect happened since the given generation.
+        """
+        value = deepcopy(value)
+        with self._lock:
+            if generation is not None and self._stale(key, generation):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, entity_ids: Iterable[str]):
+        entity_ids = set(entity_ids)
+        with self._lock:
+            self._generation += 1
+            for entity_id in entity_ids:
+                self._written[entity_id] = self._generation
+                self._written.move_to_end(entity_id)
+            while len(self._written) > self.maxsize:
+                _, generation = self._written.popitem(last=False)
+                self._floor = max(self._floor, generation)
+            for key in list(self._entries):
+                if key[0] == "query" or dict(key[1]).get("id") in entity_ids:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
 # Class built based on reference docs for the
 # Scorpio Broker FIWARE NGSI-LD API Walktrough.
 # See https://scorpio.readthedocs.io/en/latest/API_walkthrough.html
@@ -26,24 +327,36 @@ class NGSILDAPI:
     def __init__(
         self,
         url: str = "http://scorpio:9090",
-        headers: dict = {},
+        headers: dict = None,
         disable_ssl: bool = False,
         debug: bool = False,
         context: str = CORE_CONTEXT,
+        pool_size: int = POOL_SIZE,
+        timeout: Timeout = None,
+        keep_alive: bool = True,
+        retry_budget: float = RETRY_BUDGET,
+        cache: ReadCache = None,
     ):
 
-        self.headers = headers
+        self.headers = dict(headers or {})
+        # Optional cache of entity retrievals and queries
+        self.cache = cache
         self.url = url
         self.ssl_verification = not disable_ssl
-        # Retry strategy
-        retry_strategy = Retry(
-            total=10,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "PUT", "POST", "OPTIONS"],
-            backoff_factor=5,
-        )
+        self.timeout = timeout
+        # Retry strategy, jittered and bounded in time
+        retry_strategy = retry_policy(budget=retry_budget)
         self._session = requests.Session()
-        self._session.mount(self.url, HTTPAdapter(max_retries=retry_strategy))
+        self._session.mount(
+            self.url,
+            HTTPAdapter(
+                max_retries=retry_strategy,
+                pool_connections=1,
+                pool_maxsize=pool_size,
+            ),
+        )
+        if not keep_alive:
+            self.headers["Connection"] = "close"
         self.context = context
         self.headers["Link"] = (
             "<{0}>;"
@@ -74,6 +387,22 @@ class NGSILDAPI:
             requests_log = logging.getLogger("requests.packages.urllib3")
             requests_log.propagate = True
 
+    def close(self):
+        """
+        Close the connections kept alive to the broker.
+        """
+        self._session.close()
+        if self.cache is not None:
+            logger.info(
+                "Read cache hit ratio {0:.1%} ({1} hits, {2} misses)".format(
+                    self.cache.hit_ratio, self.cache.hits, self.cache.misses
+                )
+            )
+
+    def _invalidate(self, entity_ids: Iterable[str]):
+        if self.cache is not None:
+            self.cache.invalidate(entity_ids)
+
     def checkOrionHealth(self):
         """
         Checks NGSI-LD Orion-LD broker status is up.
@@ -81,6 +410,7 @@ class NGSILDAPI:
         response = self._session.get(
             "{0}/version".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
         )
         return response.ok
@@ -92,6 +422,7 @@ class NGSILDAPI:
         response = self._session.get(
             "{0}/scorpio/v1/info/health".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
         )
         return response.ok
@@ -104,9 +435,11 @@ class NGSILDAPI:
         response = self._session.post(
             "{0}/ngsi-ld/v1/entities".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             json=entity,
         )
+        self._invalidate([entity.get("id")])
         if response.status_code == 409:
             # Already created
             pass
@@ -116,11 +449,25 @@ class NGSILDAPI:
     # NGSI-LD Query Entity -> /entities
     def queryEntities(
         self, type: str, attrs: str = None, q: str = None, options: Options = None
-    ) -> dict:
+    ) -> List[dict]:
         """
         Retrieve a set of entities which matches
-        a specific query from an NGSI-LD system.
+        a specific query from an NGSI-LD system,
+        following pagination to get all of them.
         """
+        if self.cache is None:
+            return list(self.iterEntities(type, attrs, q, options))
+        key = ReadCache.key("query", self._queryParams(type, attrs, q, options))
+        entities = self.cache.get(key)
+        if entities is _MISS:
+            generation = self.cache.generation()
+            entities = list(self.iterEntities(type, attrs, q, options))
+            self.cache.put(key, entities, generation)
+        return entities
+
+    def _queryParams(
+        self, type: str, attrs: str = None, q: str = None, options: Options = None
+    ) -> dict:
         params = {}
         if attrs:
             params["attrs"] = attrs
@@ -130,16 +477,80 @@ class NGSILDAPI:
             params["q"] = q
         if options:
             params["options"] = options
+        return params
+
+    def queryEntitiesPage(
+        self, url: str, params: Optional[dict]
+    ) -> Tuple[List[dict], Optional[tuple]]:
+        """
+        Retrieve a page of query results. Returns its entities along
+        with the url and params of the next page, None on the last one.
+        The next page is the one linked by the broker, if any, or the
+        one at the next offset until a page comes empty, as brokers
+        may return fewer entities than the limit asked for.
+        """
+        response = self._session.get(
+            url,
+            verify=self.ssl_verification,
+            timeout=self.timeout,
+            headers=self.headers,
+            params=params,
+        )
+        if response.status_code != 200:
+            response.raise_for_status()
+        entities = response.json()
+        links = response.links
+        link = links.get("next", {}).get("url")
+        if link:
+            return entities, (urljoin(response.url, link), None)
+        # Linked pages without a next one end with the last page
+        if params is None or not entities or "prev" in links:
+            return entities, None
+        params = dict(params, offset=params.get("offset", 0) + len(entities))
+        return entities, (url, params)
+
+    def iterEntities(
+        self,
+        type: str,
+        attrs: str = None,
+        q: str = None,
+        options: Options = None,
+        page_size: int = PAGE_SIZE,
+    ) -> Iterator[dict]:
+        """
+        Stream the entities which match a query, page by page,
+        attrs selecting the attributes retrieved. The next page
+        is fetched while the current one is being consumed.
+        """
+        params = self._queryParams(type, attrs, q, options)
+        params["limit"] = page_size
+        next_page = ("{0}/ngsi-ld/v1/entities".format(self.url), params)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="query") as prefetch:
+            page = prefetch.submit(self.queryEntitiesPage, *next_page)
+            while page is not None:
+                entities, next_page = page.result()
+                page = None
+                if next_page is not None:
+                    page = prefetch.submit(self.queryEntitiesPage, *next_page)
+                yield from entities
+
+    def countEntities(self, type: str, q: str = None) -> int:
+        """
+        Number of entities which match a query,
+        without retrieving any of them.
+        """
+        params = self._queryParams(type, q=q)
+        params.update(limit=0, count="true")
         response = self._session.get(
             "{0}/ngsi-ld/v1/entities".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             params=params,
         )
-        if response.status_code == 200:
-            return response.json()
-        else:
+        if response.status_code != 200:
             response.raise_for_status()
+        return int(response.headers["NGSILD-Results-Count"])
 
     # NGSI-LD Retrieve Entity -> /entities/{entityId}
     def retrieveEntityById(
@@ -161,17 +572,74 @@ class NGSILDAPI:
             params["type"] = type
         if options:
             params["options"] = options
+        if self.cache is not None:
+            key = ReadCache.key("entity", dict(params, id=entityId))
+            entity = self.cache.get(key)
+            if entity is not _MISS:
+                return entity
+            generation = self.cache.generation()
         response = self._session.get(
             "{0}/ngsi-ld/v1/entities/{1}".format(self.url, entityId),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             params=params,
         )
         if response.status_code == 200:
-            return response.json()
+            entity = response.json()
+            if self.cache is not None:
+                self.cache.put(key, entity, generation)
+            return entity
         else:
             response.raise_for_status()
 
+    def retrieveEntities(
+        self,
+        entityIds: Iterable[str],
+        attrs: str = None,
+        type: str = None,
+        options: Options = None,
+        max_url_length: int = MAX_URL_LENGTH,
+    ) -> Dict[str, dict]:
+        """
+        Retrieve entities by ID with as few queries as possible,
+        as many IDs going in each query as its URL length allows.
+        Returns the entities found keyed by ID.
+        """
+        params = self._queryParams(type, attrs, options=options)
+        entities = {}
+        missing = []
+        for entityId in dict.fromkeys(entityIds):
+            if self.cache is not None:
+                entity = self.cache.get(
+                    ReadCache.key("entity", dict(params, id=entityId))
+                )
+                if entity is not _MISS:
+                    entities[entityId] = entity
+                    continue
+            missing.append(entityId)
+        url = "{0}/ngsi-ld/v1/entities".format(self.url)
+        # Room left for the ids along with every param of the pages,
+        # whose offset reaches at most the number of ids queried
+        paged = dict(params, limit=PAGE_SIZE, offset=len(missing), id="")
+        base_length = len(requests.Request("GET", url, params=paged).prepare().url)
+        max_ids_length = max_url_length - base_length
+        for ids in chunk_ids(missing, max_ids_length):
+            next_page = (url, dict(params, id=",".join(ids), limit=PAGE_SIZE))
+            while next_page is not None:
+                if self.cache is not None:
+                    generation = self.cache.generation()
+                page, next_page = self.queryEntitiesPage(*next_page)
+                for entity in page:
+                    entities[entity["id"]] = entity
+                    if self.cache is not None:
+                        self.cache.put(
+                            ReadCache.key("entity", dict(params, id=entity["id"])),
+                            entity,
+                            generation,
+                        )
+        return entities
+
     # NGSI-LD Update Entity Attributes -> /entities/{entityId}/attrs
     def updateEntityAttrs(self, entityId: str, fragment: dict):
         """
@@ -180,9 +648,11 @@ class NGSILDAPI:
         response = self._session.patch(
             "{0}/ngsi-ld/v1/entities/{1}/attrs".format(self.url, entityId),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             json=fragment,
         )
+        self._invalidate([entityId])
         if response.status_code != 204:
             response.raise_for_status()
 
@@ -194,9 +664,11 @@ class NGSILDAPI:
         response = self._session.post(
             "{0}/ngsi-ld/v1/entities/{1}/attrs".format(self.url, entityId),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             json=fragment,
         )
+        self._invalidate([entityId])
         if response.status_code != 204:
             response.raise_for_status()
 
@@ -208,8 +680,10 @@ class NGSILDAPI:
         response = self._session.delete(
             "{0}/ngsi-ld/v1/entities/{1}".format(self.url, entityId),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
         )
+        self._invalidate([entityId])
         if response.status_code != 204:
             response.raise_for_status()
 
@@ -221,6 +695,7 @@ class NGSILDAPI:
         response = self._session.post(
             "{0}/ngsi-ld/v1/subscriptions/".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             json=subscription,
         )
@@ -235,6 +710,7 @@ class NGSILDAPI:
         response = self._session.get(
             "{0}/ngsi-ld/v1/subscriptions/{1}".format(self.url, subscriptionId),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
         )
         if response.status_code == 200:
@@ -253,6 +729,7 @@ class NGSILDAPI:
         response = self._session.get(
             "{0}/ngsi-ld/v1/subscriptions".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             params=params,
         )
@@ -269,6 +746,7 @@ class NGSILDAPI:
         response = self._session.delete(
             "{0}/ngsi-ld/v1/subscriptions/{1}".format(self.url, subscriptionId),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
         )
         if response.status_code != 204:
@@ -286,8 +764,70 @@ class NGSILDAPI:
         response = self._session.post(
             "{0}/ngsi-ld/v1/entityOperations/upsert".format(self.url),
             verify=self.ssl_verification,
+            timeout=self.timeout,
             headers=self.headers,
             json=entities,
             params=params,
         )
+        self._invalidate([entity.get("id") for entity in entities])
         return response
+
+    def upsertEntities(
+        self,
+        entities: List[dict],
+        options: Options = Options.replace.value,
+        retries: int = ENTITY_RETRIES,
+    ) -> BatchResult:
+        """
+        Batch upsert entities and read the per entity outcome.
+        When the broker rejects only some entities of the batch, the
+        ones that may succeed are sent again, up to retries times.
+        Failures are logged.
+        """
+        start = time.monotonic()
+        response = self.batchEntityUpsert(entities, options)
+        result = parse_batch_result(response, entities, time.monotonic() - start)
+        for _ in range(retries if result.status in BATCH_ERROR_STATUS else 0):
+            retry_ids = set(result.retryable())
+            if not retry_ids:
+                break
+            retry_entities = [
+                entity for entity in entities if entity["id"] in retry_ids
+            ]
+            logger.warning(
+                "Sending {0} failed entities again".format(len(retry_entities))
+            )
+            start = time.monotonic()
+            try:
+                response = self.batchEntityUpsert(retry_entities, options)
+            except requests.exceptions.RequestException as e:
+                # Entities keep their first error
+                logger.warning("Upsert of failed entities failed: {0}".format(e))
+                break
+            result = result.merge(
+                parse_batch_result(response, retry_entities, time.monotonic() - start)
+            )
+        log_batch_errors(result)
+        return result
+
+    def chunkedEntityUpsert(
+        self,
+        entities: Iterable[dict],
+        options: Options = Options.replace.value,
+        max_bytes: int = MAX_BATCH_BYTES,
+        max_entities: int = MAX_BATCH_ENTITIES,
+        retries: int = ENTITY_RETRIES,
+    ) -> BatchResult:
+        """
+        Upsert entities through as many batch requests as needed
+        to honour the payload bytes and entity count bounds.
+        """
+        result = BatchResult([], {}, 0)
+        for batch in chunk_entities(entities, max_bytes, max_entities):
+            result = result.merge(self.upsertEntities(batch, options, retries))
+        logger.info(
+            "Upserted {0} entities in {1} requests ({2:.2f}s), {3} failed".format(
+                len(result.success), result.requests, result.latency, len(result.errors)
+            )
+        )
+        return result
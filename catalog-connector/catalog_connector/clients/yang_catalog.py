@@ -1,9 +1,15 @@
+import json
 import logging
+import shutil
+import tempfile
 from enum import Enum
+from typing import BinaryIO
 
 import requests
 from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
+
+from catalog_connector.clients.http_cache import CacheEntry, HTTPCache
+from catalog_connector.clients.retry import RETRY_BUDGET, retry_policy
 
 YANG_CATALOG_URL = "https://yangcatalog.org/api"
 
@@ -17,18 +23,16 @@ class YangCatalogAPI:
         headers: dict = {"Accept": "application/json"},
         disable_ssl: bool = False,
         debug: bool = False,
+        cache: HTTPCache = None,
+        retry_budget: float = RETRY_BUDGET,
     ):
 
         self.headers = headers
         self.url = url
+        self.cache = cache
         self.ssl_verification = not disable_ssl
-        # Retry strategy
-        retry_strategy = Retry(
-            total=10,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "PUT", "POST", "OPTIONS"],
-            backoff_factor=5,
-        )
+        # Retry strategy, jittered and bounded in time
+        retry_strategy = retry_policy(budget=retry_budget)
         self._session = requests.Session()
         self._session.mount(self.url, HTTPAdapter(max_retries=retry_strategy))
         self.debug = debug
@@ -45,28 +49,96 @@ class YangCatalogAPI:
             requests_log = logging.getLogger("requests.packages.urllib3")
             requests_log.propagate = True
 
+    def _get_cached(self, path: str) -> CacheEntry:
+        """
+        Get the response body from the cache, revalidating
+        it with a conditional request once it gets stale.
+        """
+        url = "{0}/{1}".format(self.url, path)
+        entry = self.cache.get(url)
+        if entry and self.cache.is_fresh(entry):
+            logger.info("Using cached response for {0}".format(url))
+            return entry
+        headers = dict(self.headers)
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        with self._session.get(
+            url,
+            verify=self.ssl_verification,
+            headers=headers,
+            stream=True,
+        ) as response:
+            if entry and response.status_code == 304:
+                logger.info("Cached response for {0} not modified".format(url))
+                self.cache.revalidate(url, entry)
+                return entry
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return self.cache.put(
+                url,
+                response.raw,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+
+    def _get_json(self, path: str):
+        if self.cache:
+            with self._get_cached(path).open() as f:
+                return json.load(f)
+        response = self._session.get(
+            "{0}/{1}".format(self.url, path),
+            verify=self.ssl_verification,
+            headers=self.headers,
+        )
+        return response.json()
+
     def get_whole_catalog(self):
         """
         This endpoint serves to get all the modules with
         their vendor implementation metadata
         """
-        response = self._session.get(
+        return self._get_json("search/catalog")
+
+    def download_whole_catalog(self, fp: BinaryIO):
+        """
+        Same as get_whole_catalog, but the response body is
+        streamed into the given binary file object instead
+        of being loaded in memory
+        """
+        if self.cache:
+            with self._get_cached("search/catalog").open() as f:
+                shutil.copyfileobj(f, fp)
+            return
+        with self._session.get(
             "{0}/search/catalog".format(self.url),
             verify=self.ssl_verification,
             headers=self.headers,
-        )
-        return response.json()
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, fp)
+
+    def open_whole_catalog(self) -> BinaryIO:
+        """
+        Same as get_whole_catalog, but returns a binary file object
+        with the response body, read from the cache if enabled
+        or from a temporary file otherwise
+        """
+        if self.cache:
+            return self._get_cached("search/catalog").open()
+        fp = tempfile.TemporaryFile()
+        self.download_whole_catalog(fp)
+        fp.seek(0)
+        return fp
 
     def get_all_modules_metadata(self):
         """
         This endpoint serves to get all the modules metadata
         """
-        response = self._session.get(
-            "{0}/search/modules".format(self.url),
-            verify=self.ssl_verification,
-            headers=self.headers,
-        )
-        return response.json()
+        return self._get_json("search/modules")
 
     def filter_leaf_data(self, path_value):
         """
@@ -76,9 +148,4 @@ class YangCatalogAPI:
                             (example: cisco/xe/1632 would delete
                             all 1632 xe cisco modules)
         """
-        response = self._session.get(
-            "{0}/search/{1}".format(self.url, path_value),
-            verify=self.ssl_verification,
-            headers=self.headers,
-        )
-        return response.json()
+        return self._get_json("search/{0}".format(path_value))
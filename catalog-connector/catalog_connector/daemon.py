@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the starts of two synchronizations
+INTERVAL = 3600.0
+
+# Port of the status endpoints when no metrics port is given
+PORT = 8000
+
+# HTTP status code and JSON body of a status endpoint
+Route = Callable[[], Tuple[int, dict]]
+
+
+class SyncDaemon:
+    """
+    Run a synchronization function on a fixed schedule within a
+    long-running process, so that the state it keeps (HTTP sessions,
+    fingerprints, catalog indexes, batch sizes) stays warm between
+    runs. Runs never overlap: a run lasting longer than the interval
+    delays the next one, and a run triggered while another one is in
+    progress is skipped. The function returns statistics of the run.
+    """
+
+    def __init__(self, sync: Callable[[], dict], interval: float = INTERVAL):
+        self.sync = sync
+        self.interval = interval
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.started: Optional[float] = None
+        self.next_run: Optional[float] = None
+        self.last_run: Optional[dict] = None
+        self.last_success: Optional[float] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running = False
+
+    def run_once(self) -> bool:
+        """
+        Run a synchronization unless one is already in progress.
+        Returns whether it succeeded.
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.warning("Synchronization already in progress, skipping run")
+            return False
+        try:
+            self.started = time.time()
+            self.runs += 1
+            logger.info("Starting synchronization run {0}".format(self.runs))
+            run = {"started": self.started}
+            try:
+                run["stats"] = self.sync()
+                run["ok"] = True
+                self.consecutive_failures = 0
+            except Exception as e:
+                logger.exception("Synchronization run {0} failed".format(self.runs))
+                run["ok"] = False
+                run["error"] = str(e)
+                self.failures += 1
+                self.consecutive_failures += 1
+            run["finished"] = time.time()
+            run["duration"] = run["finished"] - run["started"]
+            if run["ok"]:
+                self.last_success = run["finished"]
+            self.last_run = run
+            self.started = None
+            return run["ok"]
+        finally:
+            self._lock.release()
+
+    def trigger(self):
+        """
+        Start the next synchronization now.
+        """
+        self._wake.set()
+
+    def stop(self):
+        """
+        Stop the schedule once the current synchronization completes.
+        """
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        """
+        Synchronize right away, then at every interval until stopped.
+        """
+        self._running = True
+        logger.info("Synchronizing every {0:.0f}s".format(self.interval))
+        try:
+            while not self._stop.is_set():
+                start = time.time()
+                self.run_once()
+                self.next_run = max(time.time(), start + self.interval)
+                self._wake.wait(self.next_run - time.time())
+                self._wake.clear()
+        finally:
+            self._running = False
+            self.next_run = None
+        logger.info("Synchronization schedule stopped")
+
+    def health(self) -> Tuple[int, dict]:
+        """
+        Liveness: the schedule is running.
+        """
+        if self._running:
+            return 200, {"status": "ok"}
+        return 503, {"status": "stopped"}
+
+    def readiness(self) -> Tuple[int, dict]:
+        """
+        Readiness: the last completed synchronization succeeded.
+        """
+        if self.last_run is not None and self.last_run["ok"]:
+            return 200, {"status": "ready"}
+        return 503, {"status": "not ready"}
+
+    def status(self) -> Tuple[int, dict]:
+        return 200, {
+            "state": "syncing" if self.started is not None else "idle",
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutiveFailures": self.consecutive_failures,
+            "currentRunStarted": self.started,
+            "nextRun": self.next_run,
+            "lastSuccess": self.last_success,
+            "lastRun": self.last_run,
+        }
+
+    def routes(self) -> Dict[str, Route]:
+        return {
+            "/healthz": self.health,
+            "/readyz": self.readiness,
+            "/status": self.status,
+        }
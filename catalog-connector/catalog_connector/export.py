@@ -0,0 +1,83 @@
+import gzip
+import json
+import logging
+from typing import Iterable, Iterator, TextIO
+
+logger = logging.getLogger(__name__)
+
+
+def _open(path: str, mode: str) -> TextIO:
+    # Files ending in .gz are gzip compressed
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+
+class EntityWriter:
+    """
+    Writes NGSI-LD entities as newline-delimited JSON,
+    gzip compressed when the file name ends in .gz.
+    """
+
+    def __init__(self, path: str, mode: str = "w"):
+        self.path = path
+        self.entities = 0
+        self._fp = _open(path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, entities: Iterable[dict]):
+        for entity in entities:
+            self._fp.write(json.dumps(entity, separators=(",", ":")))
+            self._fp.write("\n")
+            self.entities += 1
+
+    def close(self):
+        self._fp.close()
+        logger.info("Exported {0} entities to {1}".format(self.entities, self.path))
+
+
+class DeadLetterQueue(EntityWriter):
+    """
+    Persistent file of the entities whose upsert failed for good,
+    in the format of exports, so that it can be replayed later with
+    catalog_connector.bulk_load. Batches are appended to the file
+    and flushed as they come, the reason being logged.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, "a")
+        self.batches = 0
+
+    def write(self, entities: Iterable[dict], reason: str = None):
+        entities = list(entities)
+        super().write(entities)
+        self._fp.flush()
+        self.batches += 1
+        logger.warning(
+            "Dead-lettered {0} entities to {1}: {2}".format(
+                len(entities), self.path, reason
+            )
+        )
+
+    def close(self):
+        self._fp.close()
+        if self.batches:
+            logger.warning(
+                "Dead-lettered {0} batches to {1}, replay them with "
+                "catalog_connector.bulk_load".format(self.batches, self.path)
+            )
+
+
+def iter_entities(path: str) -> Iterator[dict]:
+    """
+    Stream the entities of a newline-delimited JSON file.
+    """
+    with _open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
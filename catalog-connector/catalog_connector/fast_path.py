@@ -0,0 +1,138 @@
+import logging
+from types import SimpleNamespace
+from typing import Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Leafs of /catalog/modules/module in yang-catalog@2018-04-03.yang
+# that are turned into NGSI-LD attributes
+MODULE_LEAFS = (
+    "name",
+    "revision",
+    "organization",
+    "namespace",
+    "schema",
+    "generated-from",
+    "maturity-level",
+    "document-name",
+    "author-email",
+    "reference",
+    "module-classification",
+    "compilation-status",
+    "compilation-result",
+    "prefix",
+    "yang-version",
+    "description",
+    "contact",
+    "module-type",
+    "belongs-to",
+    "tree-type",
+    "yang-tree",
+    "expires",
+    "expired",
+    "semantic-version",
+    "derived-semantic-version",
+)
+MODULE_KEYS = ("name", "revision", "organization")
+
+# Leafs of /catalog/modules/module/ietf
+IETF_LEAFS = ("ietf-wg",)
+
+# Leafs of /catalog/modules/module/dependencies and dependents
+DEPENDENCY_LEAFS = ("name", "revision", "schema")
+DEPENDENCY_KEYS = ("name",)
+
+# Leafs whose type is a union with boolean
+BOOLEAN_LEAFS = ("expired",)
+
+# Accepted values for YANG booleans, as in pyangbind YANGBool
+_TRUE_VALUES = ("true", "True", True, 1, "1")
+_FALSE_VALUES = ("false", "False", False, 0, "0")
+
+
+class YANGListView(dict):
+    """
+    Keyed YANG list, iterated like the pyangbind generated lists.
+    """
+
+    def iteritems(self):
+        return self.items()
+
+
+def safe_name(leaf: str) -> str:
+    """
+    Python attribute name used by pyangbind for a YANG leaf.
+    """
+    return leaf.replace("-", "_").replace(".", "_")
+
+
+def _leaf_value(leaf: str, value):
+    # Unset leafs read as empty strings in pyangbind
+    if value is None:
+        return ""
+    if leaf in BOOLEAN_LEAFS:
+        if value in _TRUE_VALUES:
+            return True
+        if value in _FALSE_VALUES:
+            return False
+    return value
+
+
+def _load_container(data: dict, leafs: Tuple[str, ...]) -> SimpleNamespace:
+    return SimpleNamespace(
+        **{safe_name(leaf): _leaf_value(leaf, data.get(leaf)) for leaf in leafs}
+    )
+
+
+def _merge_list(elements: Iterable[dict], keys: Tuple[str, ...]) -> dict:
+    # Like pyangbind, elements sharing the same key are merged
+    # into the first occurrence, with later leaf values winning
+    merged = {}
+    for element in elements:
+        key = " ".join(str(element[k]) for k in keys)
+        target = merged.setdefault(key, {})
+        for leaf, value in element.items():
+            if value is None:
+                continue
+            if isinstance(value, list) and isinstance(target.get(leaf), list):
+                target[leaf] = target[leaf] + value
+            else:
+                target[leaf] = value
+    return merged
+
+
+def _load_list(
+    elements: Iterable[dict], keys: Tuple[str, ...], leafs: Tuple[str, ...]
+) -> YANGListView:
+    return YANGListView(
+        (key, _load_container(element, leafs))
+        for key, element in _merge_list(elements, keys).items()
+    )
+
+
+def load_module(data: dict) -> SimpleNamespace:
+    """
+    Map a raw module dict to a lightweight object that exposes
+    the same attributes as the pyangbind module class.
+    """
+    module = _load_container(data, MODULE_LEAFS)
+    module.ietf = _load_container(data.get("ietf") or {}, IETF_LEAFS)
+    module.dependencies = _load_list(
+        data.get("dependencies") or [], DEPENDENCY_KEYS, DEPENDENCY_LEAFS
+    )
+    module.dependents = _load_list(
+        data.get("dependents") or [], DEPENDENCY_KEYS, DEPENDENCY_LEAFS
+    )
+    return module
+
+
+def load_modules(modules: Iterable[dict]) -> YANGListView:
+    """
+    Fast-path replacement of deserialize_yang for trusted catalog data.
+    Returns the equivalent of yc.catalog.modules.module, skipping
+    pyangbind type validation altogether.
+    """
+    return YANGListView(
+        (key, load_module(module))
+        for key, module in _merge_list(modules, MODULE_KEYS).items()
+    )
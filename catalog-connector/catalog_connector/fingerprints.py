@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when entity generation changes so that
+# every module gets upserted again
+FINGERPRINT_VERSION = "1"
+
+
+def module_entity_id(module: dict) -> str:
+    """
+    NGSI-LD entity ID for a raw module dict.
+    """
+    entity_type = "Module" if module.get("module-type") == "module" else "Submodule"
+    return "urn:ngsi-ld:{0}:{1}:{2}".format(
+        entity_type, module.get("name"), module.get("revision")
+    )
+
+
+def module_fingerprint(
+    module: dict, dependency_ids: Iterable[str] = (), settings: str = ""
+) -> str:
+    """
+    Content hash of a raw module dict. The resolved IDs of its
+    dependencies are also hashed as they may change when other
+    modules are added to the catalog, along with the settings
+    that change the entity built from the module.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(FINGERPRINT_VERSION.encode())
+    digest.update(settings.encode("utf-8"))
+    digest.update(
+        json.dumps(module, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    )
+    for dependency_id in dependency_ids:
+        digest.update(dependency_id.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FingerprintStore:
+    """
+    Persistent map of module entity IDs to the fingerprint
+    of the module data that was last upserted to the broker.
+    Stored as gzipped JSON.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.stats = Counter()
+        self._fingerprints: Dict[str, str] = {}
+        self._seen = set()
+        if path and os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self._fingerprints = json.load(f)
+            logger.info(
+                "Loaded {0} module fingerprints from {1}".format(
+                    len(self._fingerprints), path
+                )
+            )
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def check(self, entity_id: str, fingerprint: str) -> bool:
+        """
+        Returns True when the module has to be upserted,
+        and accounts it as added, changed or unchanged.
+        """
+        self._seen.add(entity_id)
+        stored = self._fingerprints.get(entity_id)
+        if stored is None:
+            self.stats["added"] += 1
+        elif stored != fingerprint:
+            self.stats["changed"] += 1
+        else:
+            self.stats["unchanged"] += 1
+            return False
+        return True
+
+    def update(self, fingerprints: Dict[str, str]):
+        """
+        Record fingerprints of modules acknowledged by the broker.
+        """
+        self._fingerprints.update(fingerprints)
+
+    def prune(self):
+        """
+        Forget modules that were not checked since the store was
+        loaded, i.e. the ones no longer present in the catalog.
+        """
+        removed = set(self._fingerprints) - self._seen
+        for entity_id in removed:
+            del self._fingerprints[entity_id]
+        self.stats["removed"] += len(removed)
+
+    def reset(self):
+        self.stats.clear()
+        self._seen.clear()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = "{0}.tmp".format(self.path)
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(self._fingerprints, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        logger.info(
+            "Saved {0} module fingerprints to {1}".format(
+                len(self._fingerprints), self.path
+            )
+        )
+
+    def report(self) -> str:
+        return "{0} added, {1} changed, {2} unchanged, {3} removed".format(
+            self.stats["added"],
+            self.stats["changed"],
+            self.stats["unchanged"],
+            self.stats["removed"],
+        )
@@ -0,0 +1,207 @@
+import json
+import logging
+from array import array
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Set, TextIO
+
+from catalog_connector import fast_path
+from catalog_connector.fingerprints import module_entity_id
+
+logger = logging.getLogger(__name__)
+
+# Resolves a (name, revision, schema) dependency to an entity ID
+Resolve = Callable[[str, str, str], str]
+
+
+def _csr(count: int, sources: array, targets: array):
+    """
+    Compressed sparse row layout of the edges grouped by source.
+    Edges of each source keep their insertion order.
+    """
+    offsets = array("l", [0]) * (count + 1)
+    for source in sources:
+        offsets[source + 1] += 1
+    for node in range(count):
+        offsets[node + 1] += offsets[node]
+    adjacent = array("l", [0]) * len(targets)
+    position = array("l", offsets[:-1])
+    for source, target in zip(sources, targets):
+        adjacent[position[source]] = target
+        position[source] += 1
+    return offsets, adjacent
+
+
+def _unique(count: int, offsets: array, adjacent: array):
+    """
+    Drop self loops and repeated edges from a CSR layout, in place,
+    keeping the first occurrence of each edge.
+    """
+    end = 0
+    start = offsets[0]
+    for node in range(count):
+        row_end = offsets[node + 1]
+        seen = {node}
+        for target in adjacent[start:row_end]:
+            if target not in seen:
+                seen.add(target)
+                adjacent[end] = target
+                end += 1
+        start = row_end
+        offsets[node + 1] = end
+    del adjacent[end:]
+    return offsets, adjacent
+
+
+def _transpose(count: int, offsets: array, adjacent: array):
+    """
+    CSR layout of the reversed edges, by counting sort. Edges of
+    each target keep the order of their sources.
+    """
+    reverse_offsets = array("l", [0]) * (count + 1)
+    for target in adjacent:
+        reverse_offsets[target + 1] += 1
+    for node in range(count):
+        reverse_offsets[node + 1] += reverse_offsets[node]
+    reverse = array("l", [0]) * len(adjacent)
+    position = array("l", reverse_offsets[:-1])
+    for source in range(count):
+        for target in adjacent[offsets[source] : offsets[source + 1]]:
+            reverse[position[target]] = source
+            position[target] += 1
+    return reverse_offsets, reverse
+
+
+class DependencyGraph:
+    """
+    Dependency edges of the whole catalog, between integer node IDs.
+
+    Edges are read from the dependencies of each module and from
+    its dependents, as the catalog lists some edges on one side
+    only, every reference being resolved once. They are stored in
+    CSR layout, where edges seen from both sides are merged, and
+    the reverse direction is derived by transposing it, so that
+    both directions always agree. Nodes are entity IDs, including
+    the ones of ghost dependencies that are not in the catalog.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self._out_offsets = array("l", [0])
+        self._out = array("l")
+        self._in_offsets = array("l", [0])
+        self._in = array("l")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _node(self, entity_id: str) -> int:
+        node = self.index.get(entity_id)
+        if node is None:
+            node = self.index[entity_id] = len(self.ids)
+            self.ids.append(entity_id)
+        return node
+
+    @classmethod
+    def from_modules(
+        cls, modules: Iterable[dict], resolve: Resolve
+    ) -> "DependencyGraph":
+        """
+        Build graph from an iterable of raw module dicts, resolving
+        dependency references to entity IDs with resolve.
+        """
+        graph = cls()
+        sources = array("l")
+        targets = array("l")
+        for module in modules:
+            node = graph._node(module_entity_id(module))
+            # Lists are read as pyangbind does, merging duplicate names
+            yang_module = fast_path.load_module(module)
+            for _, dep in yang_module.dependencies.iteritems():
+                sources.append(node)
+                targets.append(graph._node(resolve(dep.name, dep.revision, dep.schema)))
+            for _, dep in yang_module.dependents.iteritems():
+                sources.append(graph._node(resolve(dep.name, dep.revision, dep.schema)))
+                targets.append(node)
+        count = len(graph.ids)
+        offsets, adjacent = _csr(count, sources, targets)
+        del sources, targets
+        graph._out_offsets, graph._out = _unique(count, offsets, adjacent)
+        graph._in_offsets, graph._in = _transpose(count, graph._out_offsets, graph._out)
+        logger.info(
+            "Built dependency graph of {0} nodes and {1} edges".format(
+                count, len(graph._out)
+            )
+        )
+        return graph
+
+    def dependencies(self, entity_id: str) -> List[str]:
+        node = self.index.get(entity_id)
+        if node is None:
+            return []
+        start, end = self._out_offsets[node], self._out_offsets[node + 1]
+        return [self.ids[target] for target in self._out[start:end]]
+
+    def dependents(self, entity_id: str) -> List[str]:
+        node = self.index.get(entity_id)
+        if node is None:
+            return []
+        start, end = self._in_offsets[node], self._in_offsets[node + 1]
+        return [self.ids[source] for source in self._in[start:end]]
+
+    def relationships(self, entity_id: str) -> dict:
+        """
+        hasDependents and hasDependencies attributes of an entity.
+        """
+        deps = {}
+        for attribute, entity_ids in (
+            ("hasDependents", self.dependents(entity_id)),
+            ("hasDependencies", self.dependencies(entity_id)),
+        ):
+            if entity_ids:
+                deps[attribute] = [
+                    {"object": dep_id, "datasetId": dep_id} for dep_id in entity_ids
+                ]
+        return deps
+
+    def closure(self, entity_id: str, dependents: bool = False) -> Set[str]:
+        """
+        Entity IDs reachable from the given one through dependencies,
+        or through dependents when asked so.
+        """
+        offsets, adjacent = (
+            (self._in_offsets, self._in)
+            if dependents
+            else (self._out_offsets, self._out)
+        )
+        start = self.index.get(entity_id)
+        if start is None:
+            return set()
+        visited = {start}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for other in adjacent[offsets[node] : offsets[node + 1]]:
+                if other not in visited:
+                    visited.add(other)
+                    queue.append(other)
+        visited.discard(start)
+        return {self.ids[node] for node in visited}
+
+    def iter_closures(self, dependents: bool = False) -> Iterator[dict]:
+        for entity_id in self.ids:
+            yield {
+                "id": entity_id,
+                "closure": sorted(self.closure(entity_id, dependents)),
+            }
+
+    def export_closures(self, fp: TextIO, dependents: bool = False):
+        """
+        Write the transitive closure of every node as JSON lines.
+        """
+        count = 0
+        for closure in self.iter_closures(dependents):
+            fp.write(json.dumps(closure))
+            fp.write("\n")
+            count += 1
+        logger.info("Exported transitive closures of {0} entities".format(count))
@@ -1,41 +1,96 @@
 import argparse
 import json
 import logging
+import random
+import signal
 import sys
-from datetime import datetime
-from typing import Union
-from urllib.parse import urlparse
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple, Union
 
-import pandas as pd
-import pyangbind.lib.pybindJSON as pybindJSON
-
-from catalog_connector.clients.ngsi_ld import NGSILDAPI
+from catalog_connector import fast_path
+from catalog_connector.batching import TARGET_LATENCY, AdaptiveBatcher
+from catalog_connector.blobs import MIN_SIZE as BLOB_MIN_SIZE
+from catalog_connector.blobs import BlobStore
+from catalog_connector.checkpoint import Checkpoint, ProgressTracker, SnapshotDigest
+from catalog_connector.clients.http_cache import MAX_AGE, HTTPCache
+from catalog_connector.clients.ngsi_ld import (
+    MAX_BATCH_BYTES,
+    MAX_BATCH_ENTITIES,
+    NGSILDAPI,
+)
+from catalog_connector.clients.retry import RETRY_BUDGET
 from catalog_connector.clients.yang_catalog import YangCatalogAPI
+from catalog_connector.daemon import INTERVAL
+from catalog_connector.daemon import PORT as DAEMON_PORT
+from catalog_connector.daemon import SyncDaemon
+from catalog_connector.export import DeadLetterQueue, EntityWriter
+from catalog_connector.fingerprints import (
+    FingerprintStore,
+    module_entity_id,
+    module_fingerprint,
+)
+from catalog_connector.graph import DependencyGraph
+from catalog_connector.metrics import METRICS, MetricsExporter
 from catalog_connector.models.ngsi_ld.catalog import Module, Submodule
-from catalog_connector.models.yang import yang_catalog as binding
+from catalog_connector.pipeline import QUEUE_DEPTH, Pipeline, parse_queue_depth
+from catalog_connector.resolver import DependencyResolver
+from catalog_connector.scope import (
+    Scope,
+    ScopeError,
+    collect_scoped_modules,
+    platform_scopes,
+)
+from catalog_connector.stream import iter_catalog_modules
+from catalog_connector.upsert import (
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
+    MAX_IN_FLIGHT,
+    BatchUpserter,
+    CircuitBreaker,
+    UpsertError,
+)
+from catalog_connector.workers import BuilderPool
+
+if TYPE_CHECKING:
+    from catalog_connector.models.yang import yang_catalog as binding
 
 logger = logging.getLogger(__name__)
 
 BATCH_SIZE = 20
 
+LOCAL_CATALOG = "data.json"
+
 
-def chunks(lst, n):
+def chunks(iterable, n):
     """
-    Yield successive n-sized chunks from lst.
+    Yield successive n-sized chunks from iterable.
 
     Reference: https://stackoverflow.com/questions/312443/
                how-do-you-split-a-list-into-evenly-sized-chunks
     """
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def deserialize_yang(data: dict) -> "binding.yang_catalog":
+    # The bindings take long to import and the fast path does without them
+    import pyangbind.lib.pybindJSON as pybindJSON
 
+    from catalog_connector.models.yang import yang_catalog as binding
 
-def deserialize_yang(data: dict) -> binding.yang_catalog:
     return pybindJSON.loads_ietf(data, binding, "yang_catalog")
 
 
 def compute_module_properties(
-    data: binding.yc_module_yang_catalog__catalog_modules_module,
+    data: "binding.yc_module_yang_catalog__catalog_modules_module",
 ) -> dict:
     properties_dict = {}
     if data.ietf.ietf_wg:
@@ -86,7 +141,7 @@ def compute_module_properties(
 
 
 def build_dep(
-    df: pd.DataFrame,
+    resolver: DependencyResolver,
     dep_name: str,
     dep_revision: str = None,
     dep_schema: str = None,
@@ -94,52 +149,28 @@ def build_dep(
     dependency_id = None
     # (A) revision value takes preference when identifying the module
     if dep_revision:
-        filtered_modules = df[
-            (df["name"] == dep_name) & (df["revision"] == str(dep_revision))
-        ]
+        dependency_module = resolver.by_revision(dep_name, dep_revision)
         # Catch ghost dependency
-        if filtered_modules.empty:
+        if dependency_module is None:
             organization = "unknown"
             module_type = "module"
         else:
-            dependency_module = filtered_modules.iloc[0]
-            module_type = dependency_module["module-type"]
+            module_type = dependency_module.module_type
         # Generate dependency entity ID
         dependency_id = "urn:ngsi-ld:{0}:{1}:{2}".format(
             module_type.capitalize(), dep_name, dep_revision
         )
     # (B) use schema URL to identify the module
     if not dep_revision and dep_schema:
-        filtered_modules = df[
-            (df["name"] == dep_name) & (df["schema"] == str(dep_schema))
-        ]
+        dependency_module = resolver.by_schema(dep_name, dep_schema)
         revision = None
         # Catch ghost dependency
-        if filtered_modules.empty:
-            # Try to figure out revision date from filename
-            revision = (
-                urlparse(dep_schema).path.split("/")[-1].split("@")[-1].split(".")[0]
-            )
-            try:
-                _ = datetime.strptime(revision, "%Y-%m-%d")
-                filtered_modules = df[
-                    (df["name"] == dep_name) & (df["revision"] == revision)
-                ]
-                # Catch ghost dependency
-                if filtered_modules.empty:
-                    module_type = "module"
-                else:
-                    dependency_module = filtered_modules.iloc[0]
-                    organization = dependency_module["organization"]
-                    module_type = dependency_module["module-type"]
-            except ValueError:
-                revision = "unknown"
-                module_type = "module"
+        if dependency_module is None:
+            revision, module_type = resolver.infer_from_schema(dep_name, dep_schema)
         # Module found in the database
         else:
-            dependency_module = filtered_modules.iloc[0]
-            revision = dependency_module["revision"]
-            module_type = dependency_module["module-type"]
+            revision = dependency_module.revision
+            module_type = dependency_module.module_type
         # Generate dependency entity ID
         dependency_id = "urn:ngsi-ld:{0}:{1}:{2}".format(
             module_type.capitalize(), dep_name, revision
@@ -162,9 +193,13 @@ def build_dep(
 
 def collect_deps(
     module_id: str,
-    df: pd.DataFrame,
-    yang_data: binding.yc_module_yang_catalog__catalog_modules_module,
+    resolver: DependencyResolver,
+    yang_data: "binding.yc_module_yang_catalog__catalog_modules_module",
 ) -> dict:
+    if resolver.graph is not None:
+        # Both directions derived from the edges resolved once
+        logger.info("Collecting dependencies of {0}".format(module_id))
+        return resolver.graph.relationships(module_id)
     # Compute deps
     deps = {}
     # Then this entity becomes a dependency of its dependents
@@ -173,7 +208,7 @@ def collect_deps(
         deps["hasDependents"] = []
         for _, dependent in yang_data.dependents.iteritems():
             dependent_object = build_dep(
-                df, dependent.name, dependent.revision, dependent.schema
+                resolver, dependent.name, dependent.revision, dependent.schema
             )
             deps["hasDependents"].append(dependent_object)
 
@@ -183,7 +218,7 @@ def collect_deps(
         deps["hasDependencies"] = []
         for _, dependency in yang_data.dependencies.iteritems():
             dependency_object = build_dep(
-                df, dependency.name, dependency.revision, dependency.schema
+                resolver, dependency.name, dependency.revision, dependency.schema
             )
             deps["hasDependencies"].append(dependency_object)
 
@@ -191,16 +226,16 @@ def collect_deps(
 
 
 def build_module_entity(
-    df: pd.DataFrame, yang_data: binding.yc_module_yang_catalog__catalog_modules_module
+    resolver: DependencyResolver,
+    yang_data: "binding.yc_module_yang_catalog__catalog_modules_module",
 ) -> Union[Module, Submodule]:
 
     # Compute properties
-    yang_module_id = "{0}:{1}".format(
-        yang_data.name, yang_data.revision)
+    yang_module_id = "{0}:{1}".format(yang_data.name, yang_data.revision)
     properties = compute_module_properties(yang_data)
     if yang_data.module_type == "module":
         id = "urn:ngsi-ld:Module:{0}".format(yang_module_id)
-        deps = collect_deps(id, df, yang_data)
+        deps = collect_deps(id, resolver, yang_data)
         if deps:
             properties.update(deps)
         module = Module(
@@ -215,7 +250,7 @@ def build_module_entity(
     # Submodule then
     else:
         id = "urn:ngsi-ld:Submodule:{0}".format(yang_module_id)
-        deps = collect_deps(id, df, yang_data)
+        deps = collect_deps(id, resolver, yang_data)
         if deps:
             properties.update(deps)
         submodule = Submodule(
@@ -229,40 +264,477 @@ def build_module_entity(
         return submodule
 
 
-def main(ngsi_ld_api: NGSILDAPI, local_catalog: bool):
-    if local_catalog:
-        f = open("data.json")
-        catalog_data = json.load(f)
-        f.close()
-    else:
-        # Init YANGCatalog API Client
-        yangcatalog_api = YangCatalogAPI()
-        logger.info("Collecting data from YANG Catalog...")
-        catalog_data = yangcatalog_api.get_whole_catalog()
-        logger.info("Loaded module data from YANG Catalog!")
-    # Build pandas DataFrame from module list for fast queries
-    df = pd.json_normalize(catalog_data["yang-catalog:catalog"]["modules"]["module"])
-    # Build Python generator from module list for NGSI-LD transformation
-    module_list_generator = chunks(
-        catalog_data["yang-catalog:catalog"]["modules"]["module"], BATCH_SIZE
-    )
-    while True:
-        try:
-            module_list_batch = next(module_list_generator)
-        except StopIteration:
-            break
-        yang_batch = {
-            "yang-catalog:catalog": {"modules": {"module": module_list_batch}}
-        }
-        yc = deserialize_yang(yang_batch)
-        batch_entities = []
-        for _, yang_module in yc.catalog.modules.module.iteritems():
-            module_entity = build_module_entity(df, yang_module)
+def build_batch(
+    resolver: DependencyResolver, module_list_batch: list, fast: bool = False
+) -> list:
+    with METRICS.stage("deserialize", len(module_list_batch)):
+        if fast:
+            yang_modules = fast_path.load_modules(module_list_batch)
+        else:
+            yang_batch = {
+                "yang-catalog:catalog": {"modules": {"module": module_list_batch}}
+            }
+            yc = deserialize_yang(yang_batch)
+            yang_modules = yc.catalog.modules.module
+    batch_entities = []
+    with METRICS.stage("build", len(yang_modules)):
+        for _, yang_module in yang_modules.iteritems():
+            module_entity = build_module_entity(resolver, yang_module)
             batch_entities.append(module_entity.dict(exclude_none=True, by_alias=True))
-        # Send batch of entities
-        ngsi_ld_api.batchEntityUpsert(batch_entities, "update")
+    return batch_entities
+
+
+def validate_batch(
+    resolver: DependencyResolver, module_list_batch: list, batch_entities: list
+) -> list:
+    """
+    Check fast-path entities against the ones obtained through pyangbind.
+    On mismatch, the pyangbind entities are returned instead.
+    """
+    with METRICS.stage("validate", len(module_list_batch)):
+        expected_entities = build_batch(resolver, module_list_batch)
+    if json.dumps(batch_entities) != json.dumps(expected_entities):
+        logger.error(
+            "Fast-path entities differ from pyangbind ones for batch {0}".format(
+                [entity["id"] for entity in expected_entities]
+            )
+        )
+        return expected_entities
+    return batch_entities
+
+
+def transform_batch(
+    resolver: DependencyResolver,
+    module_list_batch: list,
+    fast: bool = False,
+    validate: bool = False,
+    blobs: BlobStore = None,
+) -> list:
+    """
+    Turn a batch of raw module dicts into serialized NGSI-LD entities.
+    """
+    batch_entities = build_batch(resolver, module_list_batch, fast)
+    if fast and validate:
+        batch_entities = validate_batch(resolver, module_list_batch, batch_entities)
+    if blobs is not None:
+        with METRICS.stage("offload", len(batch_entities)):
+            batch_entities = [blobs.offload(entity) for entity in batch_entities]
+    return batch_entities
+
+
+def select_changed_modules(
+    resolver: DependencyResolver,
+    modules: Iterable[dict],
+    fingerprints: FingerprintStore,
+    pending: dict,
+    settings: str = "",
+) -> Iterator[dict]:
+    """
+    Yield only the modules whose fingerprint differs from the
+    one stored for the last upsert. The new fingerprints are
+    kept in pending until the broker acknowledges the batch.
+    Settings shaping the entities are part of the fingerprints.
+    """
+    for module in modules:
+        entity_id = module_entity_id(module)
+        if resolver.graph is not None:
+            dependency_ids = resolver.graph.dependents(
+                entity_id
+            ) + resolver.graph.dependencies(entity_id)
+        else:
+            dependency_ids = [
+                build_dep(
+                    resolver, dep.get("name"), dep.get("revision"), dep.get("schema")
+                )["object"]
+                for key in ("dependents", "dependencies")
+                for dep in module.get(key) or []
+            ]
+        fingerprint = module_fingerprint(module, dependency_ids, settings)
+        changed = fingerprints.check(entity_id, fingerprint)
+        # Modules sharing an entity ID overwrite each other in
+        # the broker, so they are always sent
+        duplicated = [
+            record.revision for record in resolver.by_name(module.get("name"))
+        ].count(module.get("revision")) > 1
+        if changed or duplicated:
+            pending[entity_id] = fingerprint
+            yield module
+
+
+def sync_modules(
+    ngsi_ld_api: NGSILDAPI,
+    resolver: DependencyResolver,
+    modules: Iterable[dict],
+    fast: bool = False,
+    validate_fraction: float = 0.0,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    fingerprints: FingerprintStore = None,
+    workers: int = 1,
+    batcher: AdaptiveBatcher = None,
+    checkpoint: Checkpoint = None,
+    snapshot: str = None,
+    prune: bool = True,
+    blobs: BlobStore = None,
+    export: EntityWriter = None,
+    queue_depths: Dict[str, int] = None,
+    breaker: CircuitBreaker = None,
+    dead_letters: DeadLetterQueue = None,
+) -> dict:
+    """
+    Build and upsert the entities of modules, or write them to
+    export, and return statistics of the synchronization.
+    Modules are read, built into entities and grouped into upsert
+    batches by pipeline stages, with queue_depths items queued at
+    the output of each stage. Deserialization is part of the build
+    stage, as pyangbind objects cannot be handed to the build
+    processes.
+    """
+    if batcher is None:
+        batcher = AdaptiveBatcher()
+    # The batcher may be reused across synchronizations
+    sent_entities, sent_bytes = batcher.sent_entities, batcher.sent_bytes
+    pending_fingerprints = {}
+
+    def commit_fingerprints(entities: list):
+        fingerprints.update(
+            {
+                entity["id"]: pending_fingerprints.pop(entity["id"])
+                for entity in entities
+                if entity["id"] in pending_fingerprints
+            }
+        )
+
+    # Skip modules already acknowledged for this catalog snapshot
+    resume_offset = 0
+    if checkpoint is not None:
+        resume_offset = checkpoint.resume_offset(snapshot)
+        modules = islice(modules, resume_offset, None)
+    progress = ProgressTracker(resume_offset)
+    catalog_offset = resume_offset
+    task_offsets = deque()
+
+    def count_modules(modules: Iterable[dict]) -> Iterator[dict]:
+        nonlocal catalog_offset
+        for module in modules:
+            catalog_offset += 1
+            yield module
+
+    def release(start: int, end: int, entities: list):
+        # Dead-lettered entities are not fingerprinted,
+        # so they are sent again on the next synchronization
+        if progress.acknowledge(start, end) and checkpoint is not None:
+            checkpoint.save(progress.offset, progress.module_id)
+
+    def acknowledge(start: int, end: int, entities: list):
+        if fingerprints is not None:
+            commit_fingerprints(entities)
+        release(start, end, entities)
+
+    def track_progress(entity_batches: Iterable[list]) -> Iterator[list]:
+        for batch_entities in entity_batches:
+            progress.produced(batch_entities, task_offsets.popleft())
+            yield batch_entities
+
+    modules = count_modules(modules)
+    if fingerprints is not None:
+        fingerprints.reset()
+        modules = select_changed_modules(
+            resolver,
+            modules,
+            fingerprints,
+            pending_fingerprints,
+            blobs.settings if blobs is not None else "",
+        )
+
+    def build_tasks() -> Iterator[tuple]:
+        # Build Python generator from module list for NGSI-LD transformation
+        for module_list_batch in chunks(modules, BATCH_SIZE):
+            task_offsets.append(catalog_offset)
+            yield module_list_batch, fast, random.random() < validate_fraction, blobs
+
+    queue_depths = dict(QUEUE_DEPTH, **(queue_depths or {}))
+    try:
+        with ExitStack() as stack:
+            pool = None
+            if workers > 1:
+                # Spread entity building across processes
+                pool = stack.enter_context(BuilderPool(resolver, workers))
+            # Stages run concurrently, connected by bounded queues,
+            # and are held back by the broker through the upserter
+            pipeline = stack.enter_context(Pipeline())
+            tasks = pipeline.source("read", build_tasks(), queue_depths["read"])
+            if pool is not None:
+                entity_batches = pipeline.map(
+                    "build",
+                    transform_batch,
+                    tasks,
+                    # Batches being built count in the queue depth
+                    max(queue_depths["build"], workers),
+                    executor=pool,
+                )
+            else:
+                entity_batches = pipeline.map(
+                    "build",
+                    lambda task: transform_batch(resolver, *task),
+                    tasks,
+                    queue_depths["build"],
+                )
+            if export is not None:
+                # Entities are written to a file instead of the broker
+                exported = 0
+                for batch_entities in entity_batches:
+                    export.write(batch_entities)
+                    exported += len(batch_entities)
+                return {"exported": exported}
+            # Batches are sent in the background while the next ones are built
+            upserter = stack.enter_context(
+                BatchUpserter(
+                    ngsi_ld_api,
+                    max_in_flight,
+                    "update",
+                    batcher,
+                    breaker=breaker,
+                    dead_letters=dead_letters,
+                )
+            )
+            # Upsert batches are formed by payload bytes and entity count
+            batches = pipeline.source(
+                "serialize",
+                batcher.batches(chain.from_iterable(track_progress(entity_batches))),
+                queue_depths["serialize"],
+            )
+            sent = 0
+            for batch_entities, batch_bytes in batches:
+                # Send batch of entities
+                upserter.submit(
+                    batch_entities,
+                    partial(acknowledge, sent, sent + len(batch_entities)),
+                    batch_bytes,
+                    partial(release, sent, sent + len(batch_entities)),
+                )
+                sent += len(batch_entities)
+        logger.info(
+            "Upserted {0} entities ({1} bytes) at {2:.1f} entities/s "
+            "of broker time, batch target is {3} entities".format(
+                batcher.sent_entities,
+                batcher.sent_bytes,
+                batcher.throughput(),
+                batcher.entities_target,
+            )
+        )
+        if fingerprints is not None:
+            if resume_offset or not prune:
+                # Skipped modules were not checked, so they
+                # cannot tell removed modules apart
+                logger.info("Partial synchronization, fingerprints not pruned")
+            else:
+                fingerprints.prune()
+            logger.info("Catalog changes: {0}".format(fingerprints.report()))
+        if upserter.unacknowledged:
+            # Kept for the failed batches to be sent again on resume
+            logger.error(
+                "{0} batches failed and were not dead-lettered".format(
+                    upserter.unacknowledged
+                )
+            )
+        elif checkpoint is not None:
+            checkpoint.clear()
+        stats = {
+            "entities": batcher.sent_entities - sent_entities,
+            "bytes": batcher.sent_bytes - sent_bytes,
+            "deadLettered": upserter.dead_lettered,
+            "unacknowledged": upserter.unacknowledged,
+        }
+        if fingerprints is not None:
+            stats["changes"] = dict(fingerprints.stats)
+        return stats
+    finally:
+        # Keep progress of acknowledged batches even if the sync failed
+        if fingerprints is not None:
+            fingerprints.save()
+
+
+def build_graph(resolver: DependencyResolver, modules: Iterable[dict]):
+    """
+    Attach to the resolver the dependency graph of the catalog.
+    """
+    with METRICS.stage("graph", len(resolver)):
+        resolver.graph = DependencyGraph.from_modules(
+            modules,
+            lambda name, revision, schema: build_dep(resolver, name, revision, schema)[
+                "object"
+            ],
+        )
+
+
+def index_catalog(
+    module_list: List[dict], graph: bool = False, warm: dict = None
+) -> Tuple[DependencyResolver, str]:
+    """
+    Build the dependency resolver of a module list, along with the
+    catalog snapshot digest. The resolver of the previous run, kept
+    in warm, is reused as long as the catalog does not change.
+    """
+    digest = SnapshotDigest()
+    if warm is None:
+        with METRICS.stage("index", len(module_list)):
+            resolver = DependencyResolver.from_modules(digest.feed(module_list))
+        if graph:
+            build_graph(resolver, module_list)
+        return resolver, digest.hexdigest()
+    with METRICS.stage("digest", len(module_list)):
+        deque(digest.feed(module_list), maxlen=0)
+    snapshot = digest.hexdigest()
+    if warm.get("snapshot") == snapshot:
+        logger.info("Catalog unchanged, reusing dependency indexes")
+        return warm["resolver"], snapshot
+    with METRICS.stage("index", len(module_list)):
+        resolver = DependencyResolver.from_modules(module_list)
+    if graph:
+        build_graph(resolver, module_list)
+    warm.update(snapshot=snapshot, resolver=resolver)
+    return resolver, snapshot
+
+
+@contextmanager
+def load_catalog(
+    local_catalog: bool,
+    stream: bool = False,
+    yangcatalog_api: YangCatalogAPI = None,
+    scopes: List[Scope] = None,
+    graph: bool = False,
+    warm: dict = None,
+) -> Iterator[Tuple[DependencyResolver, Iterable[dict], str]]:
+    """
+    Load YANG Catalog data, either from YANG Catalog API or from
+    the local dump, and yield the dependency resolver along with
+    the module list to synchronize and the catalog snapshot digest.
+    With scopes, only the modules implemented by those vendor
+    slices and their dependencies are fetched from the API.
+    With graph, dependency relationships are precomputed for
+    the whole catalog. With warm, indexes are kept between calls
+    and reused while the catalog does not change, except when
+    streaming.
+    """
+    digest = SnapshotDigest()
+    if scopes:
+        yangcatalog_api = yangcatalog_api or YangCatalogAPI()
+        with METRICS.stage("download"):
+            module_list = collect_scoped_modules(yangcatalog_api, scopes)
+        resolver, snapshot = index_catalog(module_list, graph, warm)
+        yield resolver, module_list, snapshot
+    elif stream:
+        # Keep the catalog dump on disk and parse it incrementally.
+        # Only the dependency indexes are held in memory.
+        with METRICS.stage("download"):
+            if local_catalog:
+                catalog_file = open(LOCAL_CATALOG, "rb")
+            else:
+                # Init YANGCatalog API Client
+                yangcatalog_api = yangcatalog_api or YangCatalogAPI()
+                logger.info("Downloading data from YANG Catalog...")
+                catalog_file = yangcatalog_api.open_whole_catalog()
+                logger.info("Downloaded module data from YANG Catalog!")
+        with catalog_file:
+            # First pass builds hash indexes for fast dependency lookups
+            start = time.perf_counter()
+            resolver = DependencyResolver.from_modules(
+                digest.feed(iter_catalog_modules(catalog_file))
+            )
+            METRICS.add("index", time.perf_counter() - start, len(resolver))
+            # Second pass feeds modules to the NGSI-LD transformation
+            catalog_file.seek(0)
+            if graph:
+                # Extra pass, as edges are resolved once all modules are indexed
+                build_graph(resolver, iter_catalog_modules(catalog_file))
+                catalog_file.seek(0)
+            yield resolver, iter_catalog_modules(catalog_file), digest.hexdigest()
+    else:
+        with METRICS.stage("download"):
+            if local_catalog:
+                f = open(LOCAL_CATALOG)
+                catalog_data = json.load(f)
+                f.close()
+            else:
+                # Init YANGCatalog API Client
+                yangcatalog_api = yangcatalog_api or YangCatalogAPI()
+                logger.info("Collecting data from YANG Catalog...")
+                catalog_data = yangcatalog_api.get_whole_catalog()
+                logger.info("Loaded module data from YANG Catalog!")
+        module_list = catalog_data["yang-catalog:catalog"]["modules"]["module"]
+        # Build hash indexes from module list for fast dependency lookups
+        resolver, snapshot = index_catalog(module_list, graph, warm)
+        yield resolver, module_list, snapshot
+
+
+def main(
+    ngsi_ld_api: NGSILDAPI,
+    local_catalog: bool,
+    stream: bool = False,
+    fast: bool = False,
+    validate_fraction: float = 0.0,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    fingerprints: FingerprintStore = None,
+    yangcatalog_api: YangCatalogAPI = None,
+    workers: int = 1,
+    batcher: AdaptiveBatcher = None,
+    checkpoint: Checkpoint = None,
+    scopes: List[Scope] = None,
+    graph: bool = False,
+    closures_file: str = None,
+    blobs: BlobStore = None,
+    export_file: str = None,
+    warm: dict = None,
+    queue_depths: Dict[str, int] = None,
+    breaker: CircuitBreaker = None,
+    dead_letters: DeadLetterQueue = None,
+) -> dict:
+    if export_file and (fingerprints is not None or checkpoint is not None):
+        # Both track what the broker acknowledged
+        logger.warning("Fingerprints and checkpoints are not used when exporting")
+        fingerprints = checkpoint = None
+    with ExitStack() as stack:
+        resolver, modules, snapshot = stack.enter_context(
+            load_catalog(
+                local_catalog,
+                stream,
+                yangcatalog_api,
+                scopes,
+                graph or bool(closures_file),
+                warm,
+            )
+        )
+        if closures_file:
+            with open(closures_file, "w") as f:
+                resolver.graph.export_closures(f)
+        export = None
+        if export_file:
+            export = stack.enter_context(EntityWriter(export_file))
+        stats = sync_modules(
+            ngsi_ld_api,
+            resolver,
+            modules,
+            fast=fast,
+            validate_fraction=validate_fraction,
+            max_in_flight=max_in_flight,
+            fingerprints=fingerprints,
+            workers=workers,
+            batcher=batcher,
+            checkpoint=checkpoint,
+            snapshot=snapshot,
+            prune=not scopes,
+            blobs=blobs,
+            export=export,
+            queue_depths=queue_depths,
+            breaker=breaker,
+            dead_letters=dead_letters,
+        )
 
     logger.info("Synchronization with YANG Catalog completed!")
+    for line in METRICS.report():
+        logger.info(line)
+    stats["snapshot"] = snapshot
+    return stats
 
 
 if __name__ == "__main__":
@@ -289,11 +761,343 @@ if __name__ == "__main__":
     parser.add_argument(
         "--local-catalog", dest="local_catalog", default=False, required=False
     )
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        help="Parse the YANG Catalog dump incrementally to bound memory usage.",
+    )
+    parser.add_argument(
+        "--fast-path",
+        dest="fast",
+        action="store_true",
+        help="Map trusted catalog data to entities without pyangbind.",
+    )
+    parser.add_argument(
+        "--validate-fraction",
+        dest="validate_fraction",
+        type=float,
+        default=0.0,
+        required=False,
+        help="Fraction of fast-path batches to validate against pyangbind.",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        dest="max_in_flight",
+        type=int,
+        default=MAX_IN_FLIGHT,
+        required=False,
+        help="Maximum number of batch upserts sent concurrently to the broker.",
+    )
+    parser.add_argument(
+        "--fingerprint-store",
+        dest="fingerprint_store",
+        default=None,
+        required=False,
+        help="File with module fingerprints to only upsert changed modules.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        required=False,
+        help="Directory to cache YANG Catalog API responses.",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        dest="cache_max_age",
+        type=float,
+        default=MAX_AGE,
+        required=False,
+        help="Seconds a cached response is used without revalidation.",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        required=False,
+        help="Number of processes deserializing modules and building "
+        "entities. The other stages run in a single thread each.",
+    )
+    parser.add_argument(
+        "--batch-bytes",
+        dest="batch_bytes",
+        type=int,
+        default=MAX_BATCH_BYTES,
+        required=False,
+        help="Maximum payload bytes of a batch upsert request.",
+    )
+    parser.add_argument(
+        "--batch-entities",
+        dest="batch_entities",
+        type=int,
+        default=MAX_BATCH_ENTITIES,
+        required=False,
+        help="Maximum number of entities of a batch upsert request.",
+    )
+    parser.add_argument(
+        "--target-latency",
+        dest="target_latency",
+        type=float,
+        default=TARGET_LATENCY,
+        required=False,
+        help="Broker latency in seconds above which batches are shrunk.",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        dest="queue_depths",
+        action="append",
+        type=parse_queue_depth,
+        default=[],
+        required=False,
+        help="Number of items queued at the output of the read, build "
+        "(deserialization included) or serialize stage, as stage=N (defaults "
+        "{0}). Upserts are bounded by --max-in-flight. Can be repeated.".format(
+            ", ".join("{0}={1}".format(*item) for item in QUEUE_DEPTH.items())
+        ),
+    )
+    parser.add_argument(
+        "--scope",
+        dest="scopes",
+        action="append",
+        type=Scope.parse,
+        default=[],
+        required=False,
+        help="Only sync modules of a vendor[/platform[/software-version]] "
+        "and their dependencies. Can be repeated.",
+    )
+    parser.add_argument(
+        "--scope-from-broker",
+        dest="scope_from_broker",
+        action="store_true",
+        help="Scope the sync to the Platform entities registered in the broker.",
+    )
+    parser.add_argument(
+        "--dependency-graph",
+        dest="graph",
+        action="store_true",
+        help="Derive both dependency relationship directions "
+        "from a graph of the whole catalog.",
+    )
+    parser.add_argument(
+        "--export-closures",
+        dest="closures_file",
+        default=None,
+        required=False,
+        help="Write the transitive dependencies of every module "
+        "as JSON lines to this file.",
+    )
+    parser.add_argument(
+        "--blob-dir",
+        dest="blob_dir",
+        default=None,
+        required=False,
+        help="Directory to store large description, contact and reference "
+        "texts, replaced on entities by their URL and size.",
+    )
+    parser.add_argument(
+        "--blob-base-url",
+        dest="blob_base_url",
+        default="http://context-catalog:8080/blobs",
+        required=False,
+        help="URL the blob directory is served from.",
+    )
+    parser.add_argument(
+        "--blob-min-size",
+        dest="blob_min_size",
+        type=int,
+        default=BLOB_MIN_SIZE,
+        required=False,
+        help="Size in bytes above which texts are offloaded.",
+    )
+    parser.add_argument(
+        "--export",
+        dest="export_file",
+        default=None,
+        required=False,
+        help="Write entities as newline-delimited JSON to this file, gzipped "
+        "if it ends in .gz, instead of sending them to the broker.",
+    )
+    parser.add_argument(
+        "--retry-budget",
+        dest="retry_budget",
+        type=float,
+        default=RETRY_BUDGET,
+        required=False,
+        help="Seconds a failed broker or YANG Catalog request keeps being retried.",
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        dest="breaker_threshold",
+        type=int,
+        default=BREAKER_THRESHOLD,
+        required=False,
+        help="Consecutive failed upserts after which the broker is deemed "
+        "unhealthy and the synchronization aborted.",
+    )
+    parser.add_argument(
+        "--breaker-cooldown",
+        dest="breaker_cooldown",
+        type=float,
+        default=BREAKER_COOLDOWN,
+        required=False,
+        help="Seconds before upserts are attempted again once the broker "
+        "was deemed unhealthy.",
+    )
+    parser.add_argument(
+        "--dead-letter",
+        dest="dead_letter",
+        default=None,
+        required=False,
+        help="Append batches that failed for good to this newline-delimited "
+        "JSON file, to be replayed with catalog_connector.bulk_load, "
+        "instead of aborting the synchronization.",
+    )
+    parser.add_argument(
+        "--daemon",
+        dest="daemon",
+        action="store_true",
+        help="Keep running and synchronize periodically, serving /healthz, "
+        "/readyz and /status along with metrics on the metrics port "
+        "(default {0}). SIGHUP starts a synchronization right away.".format(
+            DAEMON_PORT
+        ),
+    )
+    parser.add_argument(
+        "--interval",
+        dest="interval",
+        type=float,
+        default=INTERVAL,
+        required=False,
+        help="Seconds between the starts of two synchronizations in daemon mode.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        default=None,
+        required=False,
+        help="File periodically rewritten with metrics in Prometheus text format.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        dest="metrics_port",
+        type=int,
+        default=None,
+        required=False,
+        help="Port of an HTTP endpoint serving metrics in Prometheus text format.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint",
+        default=None,
+        required=False,
+        help="File recording synchronization progress to resume after a crash.",
+    )
     argv = sys.argv[1:]
     known_args, _ = parser.parse_known_args(argv)
 
     # Init NGSI-LD API Client
     ngsi_ld_api = NGSILDAPI(
-        url=known_args.broker_uri, context=known_args.context_catalog_uri
+        url=known_args.broker_uri,
+        context=known_args.context_catalog_uri,
+        retry_budget=known_args.retry_budget,
+    )
+    # Init YANGCatalog API Client
+    cache = None
+    if known_args.cache_dir:
+        cache = HTTPCache(known_args.cache_dir, max_age=known_args.cache_max_age)
+    yangcatalog_api = YangCatalogAPI(cache=cache, retry_budget=known_args.retry_budget)
+    batcher = AdaptiveBatcher(
+        max_bytes=known_args.batch_bytes,
+        max_entities=known_args.batch_entities,
+        target_latency=known_args.target_latency,
+    )
+    fingerprints = None
+    if known_args.fingerprint_store:
+        fingerprints = FingerprintStore(known_args.fingerprint_store)
+    blobs = None
+    if known_args.blob_dir:
+        blobs = BlobStore(
+            known_args.blob_dir,
+            known_args.blob_base_url,
+            known_args.blob_min_size,
+        )
+    checkpoint = None
+    if known_args.checkpoint:
+        checkpoint = Checkpoint(known_args.checkpoint)
+    # Kept across daemon synchronizations
+    breaker = CircuitBreaker(known_args.breaker_threshold, known_args.breaker_cooldown)
+    dead_letters = None
+    if known_args.dead_letter:
+        dead_letters = DeadLetterQueue(known_args.dead_letter)
+    # Indexes kept between synchronizations of the daemon
+    warm = {} if known_args.daemon else None
+
+    def sync() -> dict:
+        if known_args.daemon:
+            # Report the totals of this run only
+            METRICS.reset()
+        scopes = list(known_args.scopes)
+        if known_args.scope_from_broker:
+            # Platforms registered since the last run are picked up
+            scopes += platform_scopes(ngsi_ld_api)
+            if not scopes:
+                raise ScopeError("No Platform entities found to scope the sync")
+        return main(
+            ngsi_ld_api,
+            known_args.local_catalog,
+            known_args.stream,
+            known_args.fast,
+            known_args.validate_fraction,
+            known_args.max_in_flight,
+            fingerprints,
+            yangcatalog_api,
+            known_args.workers,
+            batcher,
+            checkpoint,
+            scopes,
+            known_args.graph,
+            known_args.closures_file,
+            blobs,
+            known_args.export_file,
+            warm,
+            dict(known_args.queue_depths),
+            breaker,
+            dead_letters,
+        )
+
+    if known_args.daemon:
+        daemon = SyncDaemon(sync, known_args.interval)
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+        signal.signal(signal.SIGHUP, lambda signum, frame: daemon.trigger())
+        exporter = MetricsExporter(
+            METRICS,
+            path=known_args.metrics_file,
+            port=(
+                known_args.metrics_port
+                if known_args.metrics_port is not None
+                else DAEMON_PORT
+            ),
+            routes=daemon.routes(),
+        )
+        try:
+            with exporter:
+                daemon.run()
+        finally:
+            if dead_letters is not None:
+                dead_letters.close()
+        sys.exit(0)
+    exporter = MetricsExporter(
+        METRICS, path=known_args.metrics_file, port=known_args.metrics_port
     )
-    main(ngsi_ld_api, known_args.local_catalog)
+    try:
+        with exporter:
+            sync()
+    except (UpsertError, ScopeError) as e:
+        logger.error("Synchronization with YANG Catalog aborted: {0}".format(e))
+        sys.exit(1)
+    finally:
+        if dead_letters is not None:
+            dead_letters.close()
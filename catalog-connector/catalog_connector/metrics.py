@@ -0,0 +1,387 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "catalog_connector"
+
+# Broker latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Seconds between two writes of the metrics file
+EXPORT_INTERVAL = 15.0
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket upper bounds.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class Stage:
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.items = 0
+
+
+class QueueStats:
+    """
+    Occupancy samples of a bounded queue.
+    """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.size = 0
+        self.max = 0
+        self.total = 0
+        self.samples = 0
+
+    def observe(self, size: int):
+        self.size = size
+        self.max = max(self.max, size)
+        self.total += size
+        self.samples += 1
+
+    def mean(self) -> float:
+        return self.total / self.samples if self.samples else 0.0
+
+
+class Metrics:
+    """
+    Per-stage wall time and item counts of the synchronization,
+    along with upsert request counts, bytes sent and broker
+    latencies, and the occupancy of pipeline queues. Safe to update
+    from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Start over from zero, e.g. at each run of the daemon. The start
+        time is reset along so that scrapers see a counter reset.
+        """
+        with self._lock:
+            self.started = time.time()
+            self.stages: Dict[str, Stage] = {}
+            self.counters: Dict[str, int] = {}
+            self.queues: Dict[str, QueueStats] = {}
+            self.requests: Dict[str, int] = {}
+            self.bytes_sent = 0
+            self.latency = Histogram()
+
+    def add(self, stage: str, seconds: float, items: int = 0, calls: int = 1):
+        with self._lock:
+            totals = self.stages.setdefault(stage, Stage())
+            totals.seconds += seconds
+            totals.calls += calls
+            totals.items += items
+
+    def count(self, counter: str, value: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextmanager
+    def stage(self, stage: str, items: int = 0):
+        """
+        Time the enclosed block as a call of the given stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def observe_queue(self, stage: str, size: int, depth: int):
+        """
+        Sample the number of items queued at the output of a stage.
+        """
+        with self._lock:
+            self.queues.setdefault(stage, QueueStats(depth)).observe(size)
+
+    def observe_upsert(
+        self, entities: int, size: int, latency: float, status: Optional[int]
+    ):
+        with self._lock:
+            key = str(status) if status is not None else "error"
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent += size
+            self.latency.observe(latency)
+            totals = self.stages.setdefault("upsert", Stage())
+            totals.seconds += latency
+            totals.calls += 1
+            totals.items += entities
+
+    def pop_totals(self) -> dict:
+        """
+        Return and reset stage totals and counters, so that the ones
+        measured in worker processes can be merged in the main process.
+        """
+        with self._lock:
+            totals = {
+                "stages": [
+                    (name, stage.seconds, stage.items, stage.calls)
+                    for name, stage in self.stages.items()
+                ],
+                "counters": self.counters,
+            }
+            self.stages = {}
+            self.counters = {}
+        return totals
+
+    def merge_totals(self, totals: dict):
+        for name, seconds, items, calls in totals["stages"]:
+            self.add(name, seconds, items, calls)
+        for counter, value in totals["counters"].items():
+            self.count(counter, value)
+
+    def render(self) -> str:
+        """
+        Metrics in Prometheus text exposition format.
+        """
+        with self._lock:
+            lines = [
+                "# TYPE {0}_stage_seconds_total counter".format(PREFIX),
+            ]
+            for name, totals in sorted(self.stages.items()):
+                lines.append(
+                    '{0}_stage_seconds_total{{stage="{1}"}} {2}'.format(
+                        PREFIX, name, totals.seconds
+                    )
+                )
+            lines.append("# TYPE {0}_stage_items_total counter".format(PREFIX))
+            for name, totals in sorted(self.stages.items()):
+                lines.append(
+                    '{0}_stage_items_total{{stage="{1}"}} {2}'.format(
+                        PREFIX, name, totals.items
+                    )
+                )
+            for counter, value in sorted(self.counters.items()):
+                lines.append("# TYPE {0}_{1}_total counter".format(PREFIX, counter))
+                lines.append("{0}_{1}_total {2}".format(PREFIX, counter, value))
+            if self.queues:
+                lines.append("# TYPE {0}_queue_items gauge".format(PREFIX))
+                for name, stats in sorted(self.queues.items()):
+                    lines.append(
+                        '{0}_queue_items{{stage="{1}"}} {2}'.format(
+                            PREFIX, name, stats.size
+                        )
+                    )
+                lines.append("# TYPE {0}_queue_capacity gauge".format(PREFIX))
+                for name, stats in sorted(self.queues.items()):
+                    lines.append(
+                        '{0}_queue_capacity{{stage="{1}"}} {2}'.format(
+                            PREFIX, name, stats.depth
+                        )
+                    )
+            lines.append("# TYPE {0}_upsert_requests_total counter".format(PREFIX))
+            for status, count in sorted(self.requests.items()):
+                lines.append(
+                    '{0}_upsert_requests_total{{status="{1}"}} {2}'.format(
+                        PREFIX, status, count
+                    )
+                )
+            lines.append("# TYPE {0}_upsert_bytes_total counter".format(PREFIX))
+            lines.append("{0}_upsert_bytes_total {1}".format(PREFIX, self.bytes_sent))
+            lines.append("# TYPE {0}_broker_latency_seconds histogram".format(PREFIX))
+            cumulative = 0
+            for bound, count in zip(self.latency.buckets, self.latency.counts):
+                cumulative += count
+                lines.append(
+                    '{0}_broker_latency_seconds_bucket{{le="{1}"}} {2}'.format(
+                        PREFIX, bound, cumulative
+                    )
+                )
+            lines.append(
+                '{0}_broker_latency_seconds_bucket{{le="+Inf"}} {1}'.format(
+                    PREFIX, self.latency.count
+                )
+            )
+            lines.append(
+                "{0}_broker_latency_seconds_sum {1}".format(PREFIX, self.latency.sum)
+            )
+            lines.append(
+                "{0}_broker_latency_seconds_count {1}".format(
+                    PREFIX, self.latency.count
+                )
+            )
+            lines.append("# TYPE {0}_start_time_seconds gauge".format(PREFIX))
+            lines.append("{0}_start_time_seconds {1}".format(PREFIX, self.started))
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> List[str]:
+        """
+        Human readable summary, one line per stage.
+        """
+        with self._lock:
+            lines = []
+            for name, totals in self.stages.items():
+                rate = totals.items / totals.seconds if totals.seconds else 0.0
+                lines.append(
+                    "{0}: {1:.2f}s in {2} calls, {3} items ({4:.1f}/s)".format(
+                        name, totals.seconds, totals.calls, totals.items, rate
+                    )
+                )
+            if self.counters:
+                lines.append(
+                    "counters: {0}".format(
+                        ", ".join(
+                            "{0}={1}".format(counter, value)
+                            for counter, value in sorted(self.counters.items())
+                        )
+                    )
+                )
+            if self.queues:
+                lines.append(
+                    "queues: {0}".format(
+                        ", ".join(
+                            "{0} mean {1:.1f}/{2}, max {3}".format(
+                                name, stats.mean(), stats.depth, stats.max
+                            )
+                            for name, stats in self.queues.items()
+                        )
+                    )
+                )
+            if self.latency.count:
+                lines.append(
+                    "broker: {0} requests {1}, {2} bytes, latency mean "
+                    "{3:.3f}s, p50 <= {4}s, p95 <= {5}s, max {6:.3f}s".format(
+                        self.latency.count,
+                        dict(sorted(self.requests.items())),
+                        self.bytes_sent,
+                        self.latency.sum / self.latency.count,
+                        self.latency.quantile(0.5),
+                        self.latency.quantile(0.95),
+                        self.latency.max,
+                    )
+                )
+        return lines
+
+
+# Metrics of this process
+METRICS = Metrics()
+
+
+class MetricsExporter:
+    """
+    Expose metrics while the connector runs, either by rewriting
+    a text file periodically (e.g. for the node exporter textfile
+    collector) or through an HTTP endpoint, or both. Extra paths
+    of the endpoint can be routed to functions returning an HTTP
+    status code and a JSON body.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics = METRICS,
+        path: Optional[str] = None,
+        port: Optional[int] = None,
+        interval: float = EXPORT_INTERVAL,
+        routes: Dict[str, Callable[[], Tuple[int, dict]]] = None,
+    ):
+        self.metrics = metrics
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.routes = routes or {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def write(self):
+        tmp_path = "{0}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.path)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self):
+        if self.path:
+            self._thread = threading.Thread(
+                target=self._write_loop, name="metrics", daemon=True
+            )
+            self._thread.start()
+        if self.port is not None:
+            metrics = self.metrics
+            routes = self.routes
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    route = routes.get(self.path.split("?")[0])
+                    if route is not None:
+                        status, data = route()
+                        body = json.dumps(data).encode("utf-8")
+                        content_type = "application/json"
+                    else:
+                        status = 200
+                        body = metrics.render().encode("utf-8")
+                        content_type = "text/plain; version=0.0.4"
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("", self.port), MetricsHandler)
+            threading.Thread(
+                target=self._server.serve_forever, name="metrics-http", daemon=True
+            ).start()
+            logger.info("Serving metrics on port {0}".format(self._server.server_port))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            # Last write holds the final values
+            self.write()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
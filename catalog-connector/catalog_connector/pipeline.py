@@ -0,0 +1,158 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from catalog_connector.metrics import METRICS, Metrics
+
+logger = logging.getLogger(__name__)
+
+# Default number of items queued at the output of each stage
+QUEUE_DEPTH = {"read": 4, "build": 4, "serialize": 4}
+
+# Seconds between two checks for pipeline shutdown while blocked
+POLL_INTERVAL = 0.1
+
+# Marks the end of a stage output
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def parse_queue_depth(value: str) -> tuple:
+    """
+    Parse a stage=depth option value.
+    """
+    stage, _, depth = value.partition("=")
+    if stage not in QUEUE_DEPTH or not depth.isdigit() or int(depth) < 1:
+        raise ValueError(
+            "Expected one of {0} followed by =<depth>".format("|".join(QUEUE_DEPTH))
+        )
+    return stage, int(depth)
+
+
+class Pipeline:
+    """
+    Chain of stages connected by bounded queues, each fed by its own
+    thread. A stage blocks once its output queue is full, so a slow
+    downstream stage, such as the broker upserts, holds back the
+    upstream ones instead of letting items pile up in memory.
+
+    Stages are chained by passing the iterator returned by one stage
+    as the items of the next one, and items come out in order. Queue
+    sizes are sampled into metrics on every put and get.
+    """
+
+    def __init__(self, metrics: Metrics = METRICS):
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._executors: List[ThreadPoolExecutor] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _put(self, name: str, items: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                items.put(item, timeout=POLL_INTERVAL)
+            except queue.Full:
+                continue
+            self.metrics.observe_queue(name, items.qsize(), items.maxsize)
+            return True
+        return False
+
+    def _drain(self, name: str, items: queue.Queue) -> Iterator:
+        while True:
+            try:
+                item = items.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            self.metrics.observe_queue(name, items.qsize(), items.maxsize)
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def _start(self, name: str, feed: Callable, items: queue.Queue):
+        def run():
+            try:
+                feed()
+            except BaseException as e:
+                # Raised again to the consumer of the stage
+                self._put(name, items, _Failure(e))
+            else:
+                self._put(name, items, _END)
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def source(self, name: str, items: Iterable, depth: int) -> Iterator:
+        """
+        Stage iterating items in its own thread.
+        """
+        output = queue.Queue(max(1, depth))
+
+        def feed():
+            for item in items:
+                if not self._put(name, output, item):
+                    return
+
+        self._start(name, feed, output)
+        return self._drain(name, output)
+
+    def map(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        items: Iterable,
+        depth: int = 1,
+        workers: int = 1,
+        executor: Optional[Executor] = None,
+    ) -> Iterator:
+        """
+        Stage calling fn on items. With several workers, or an
+        executor (e.g. a process pool), calls run concurrently and
+        their futures are queued in item order, so the queue depth
+        bounds the items both queued and in progress.
+        """
+        output = queue.Queue(max(1, depth))
+        if executor is None and workers > 1:
+            executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+            self._executors.append(executor)
+
+        def feed():
+            for item in items:
+                if executor is not None:
+                    item = executor.submit(fn, item)
+                else:
+                    item = fn(item)
+                if not self._put(name, output, item):
+                    return
+
+        self._start(name, feed, output)
+        results = self._drain(name, output)
+        if executor is None:
+            return results
+        return (future.result() for future in results)
+
+    def close(self):
+        """
+        Stop all stages, e.g. when the consumer gave up early.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        for executor in self._executors:
+            executor.shutdown(cancel_futures=True)
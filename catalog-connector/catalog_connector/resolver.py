@@ -0,0 +1,144 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+from catalog_connector.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of schema URL inferences kept by each resolver
+SCHEMA_MEMO_SIZE = 65536
+
+
+def schema_revision(schema: str) -> Optional[str]:
+    """
+    Revision date found in the filename of a schema URL, if any.
+    """
+    revision = urlparse(schema).path.split("/")[-1].split("@")[-1].split(".")[0]
+    try:
+        datetime.strptime(revision, "%Y-%m-%d")
+    except ValueError:
+        return None
+    return revision
+
+
+class ModuleRecord(NamedTuple):
+    """
+    Compact view of a YANG Catalog module, holding only
+    the leafs required to resolve dependency entity IDs.
+    """
+
+    name: str
+    revision: str
+    organization: str
+    module_type: str
+
+
+class DependencyResolver:
+    """
+    Hash indexes over the module list of the YANG Catalog.
+
+    Built once per synchronization, it provides constant-time
+    lookups of modules by (name, revision), by (name, schema)
+    and by name. When several modules share the same key,
+    the first one found in the catalog is kept.
+    A precomputed dependency graph can be attached to it.
+    """
+
+    def __init__(self, schema_memo_size: int = SCHEMA_MEMO_SIZE):
+        self.graph = None
+        self.schema_memo_size = schema_memo_size
+        self._schema_memo: Dict[Tuple[str, str], Tuple[str, str]] = OrderedDict()
+        # Lookups come from both the read and the build threads
+        self._schema_lock = threading.Lock()
+        self._by_revision: Dict[Tuple[str, str], ModuleRecord] = {}
+        self._by_schema: Dict[Tuple[str, str], ModuleRecord] = {}
+        self._by_name: Dict[str, List[ModuleRecord]] = {}
+
+    def __getstate__(self) -> dict:
+        # Handed to worker processes, which get a lock of their own
+        state = self.__dict__.copy()
+        del state["_schema_lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._schema_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._by_name.values())
+
+    @classmethod
+    def from_modules(cls, modules: Iterable[dict]) -> "DependencyResolver":
+        """
+        Build resolver from an iterable of raw module dicts
+        as served by the YANG Catalog API.
+        """
+        resolver = cls()
+        for module in modules:
+            resolver.add(module)
+        logger.info(
+            "Indexed {0} modules for dependency resolution".format(len(resolver))
+        )
+        return resolver
+
+    def add(self, module: dict):
+        """
+        Index a raw module dict.
+        """
+        name = module.get("name")
+        record = ModuleRecord(
+            name=name,
+            revision=module.get("revision"),
+            organization=module.get("organization"),
+            module_type=module.get("module-type"),
+        )
+        self._by_name.setdefault(name, []).append(record)
+        if record.revision is not None:
+            self._by_revision.setdefault((name, record.revision), record)
+        schema = module.get("schema")
+        if schema is not None:
+            self._by_schema.setdefault((name, schema), record)
+
+    def by_revision(self, name: str, revision: str) -> Optional[ModuleRecord]:
+        return self._by_revision.get((name, str(revision)))
+
+    def by_schema(self, name: str, schema: str) -> Optional[ModuleRecord]:
+        return self._by_schema.get((name, str(schema)))
+
+    def by_name(self, name: str) -> List[ModuleRecord]:
+        return self._by_name.get(name, [])
+
+    def infer_from_schema(self, name: str, schema: str) -> Tuple[str, str]:
+        """
+        Revision and module type of a dependency whose schema URL is
+        not in the catalog, figured out from the URL filename.
+        Results are memoized, as the same URLs appear many times.
+        """
+        key = (str(name), str(schema))
+        with self._schema_lock:
+            inferred = self._schema_memo.get(key)
+            if inferred is not None:
+                self._schema_memo.move_to_end(key)
+        if inferred is not None:
+            METRICS.count("schema_memo_hits")
+            return inferred
+        METRICS.count("schema_memo_misses")
+        # Try to figure out revision date from filename
+        revision = schema_revision(schema)
+        if revision is None:
+            revision = "unknown"
+            module_type = "module"
+        else:
+            record = self.by_revision(name, revision)
+            # Catch ghost dependency
+            module_type = "module" if record is None else record.module_type
+        inferred = (revision, module_type)
+        with self._schema_lock:
+            self._schema_memo[key] = inferred
+            if len(self._schema_memo) > self.schema_memo_size:
+                self._schema_memo.popitem(last=False)
+        return inferred
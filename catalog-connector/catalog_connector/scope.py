@@ -0,0 +1,206 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from catalog_connector.clients.ngsi_ld import NGSILDAPI
+from catalog_connector.clients.yang_catalog import YangCatalogAPI
+from catalog_connector.resolver import schema_revision
+
+logger = logging.getLogger(__name__)
+
+# Number of YANG Catalog API requests sent concurrently
+MAX_FETCHES = 8
+
+ModuleKey = Tuple[str, str, str]
+
+
+class ScopeError(Exception):
+    pass
+
+
+class Scope(NamedTuple):
+    """
+    Slice of the vendors tree of YANG Catalog.
+    Platform and software version narrow down the vendor.
+    """
+
+    vendor: str
+    platform: Optional[str] = None
+    software_version: Optional[str] = None
+
+    @classmethod
+    def parse(cls, value: str) -> "Scope":
+        """
+        Parse a vendor[/platform[/software-version]] path.
+        """
+        return cls(*[part for part in value.split("/") if part][:3])
+
+    def path(self) -> str:
+        """
+        Path of the slice, relative to the search endpoint.
+        """
+        path = "vendors/vendor/{0}".format(quote(self.vendor, safe=""))
+        if self.platform:
+            path += "/platforms/platform/{0}".format(quote(self.platform, safe=""))
+            if self.software_version:
+                path += "/software-versions/software-version/{0}".format(
+                    quote(self.software_version, safe="")
+                )
+        return path
+
+
+def platform_scopes(ngsi_ld_api: NGSILDAPI) -> List[Scope]:
+    """
+    Scopes of the Platform entities registered in the broker.
+    """
+    scopes = set()
+    for platform in ngsi_ld_api.iterEntities(
+        type="Platform", attrs="vendor,name,softwareVersion"
+    ):
+        vendor = platform.get("vendor", {}).get("value")
+        if not vendor:
+            continue
+        scopes.add(
+            Scope(
+                vendor.lower(),
+                platform.get("name", {}).get("value"),
+                platform.get("softwareVersion", {}).get("value"),
+            )
+        )
+    logger.info("Found {0} platform scopes in the broker".format(len(scopes)))
+    return sorted(scopes)
+
+
+def iter_modules(data) -> Iterator[dict]:
+    """
+    Yield the entries of every module list found in an API reply.
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key.split(":")[-1] == "module" and isinstance(value, list):
+                for module in value:
+                    if isinstance(module, dict) and module.get("name"):
+                        yield module
+            else:
+                yield from iter_modules(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield from iter_modules(value)
+
+
+def module_key(module: dict) -> ModuleKey:
+    return module.get("name"), module.get("revision"), module.get("organization")
+
+
+def select_dependency(candidates: List[dict], dependency: dict) -> Optional[dict]:
+    """
+    Pick the module a dependency points to, among the
+    catalog modules sharing its name, as build_dep does.
+    Dependencies known by name only point to no module.
+    """
+    revision = dependency.get("revision")
+    schema = dependency.get("schema")
+    if not revision and schema:
+        for candidate in candidates:
+            if candidate.get("schema") == schema:
+                return candidate
+        # Try to figure out revision date from filename
+        revision = schema_revision(schema)
+    if not revision:
+        return None
+    for candidate in candidates:
+        if candidate.get("revision") == revision:
+            return candidate
+    return None
+
+
+def _fetch_all(
+    executor: ThreadPoolExecutor,
+    yangcatalog_api: YangCatalogAPI,
+    paths: Iterable[str],
+) -> Iterator[Tuple[str, object]]:
+    def fetch(path: str):
+        try:
+            return path, yangcatalog_api.filter_leaf_data(path)
+        except Exception as e:
+            logger.warning("Could not fetch {0}: {1}".format(path, e))
+            return path, None
+
+    return executor.map(fetch, list(paths))
+
+
+def collect_scoped_modules(
+    yangcatalog_api: YangCatalogAPI,
+    scopes: Iterable[Scope],
+    max_fetches: int = MAX_FETCHES,
+) -> List[dict]:
+    """
+    Fetch the modules implemented in the given vendor scopes,
+    along with their transitive dependencies, through
+    filter_leaf_data requests sent concurrently.
+
+    Dependents are not followed, as that would pull most of the
+    catalog. Unlike in a full synchronization, the hasDependents
+    relationships to submodules left out of the scope thus point
+    to Module entity IDs, their type being unknown.
+    """
+    modules: Dict[ModuleKey, dict] = {}
+    by_name: Dict[str, List[dict]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_fetches)) as executor:
+        # Keys of the modules implemented in each scope
+        keys = set()
+        for path, data in _fetch_all(
+            executor, yangcatalog_api, [scope.path() for scope in scopes]
+        ):
+            scope_keys = {module_key(module) for module in iter_modules(data)}
+            logger.info("Found {0} modules in {1}".format(len(scope_keys), path))
+            keys |= scope_keys
+        # Metadata of the implemented modules
+        paths = [
+            "modules/{0}".format(",".join(quote(part or "", safe="") for part in key))
+            for key in sorted(keys)
+        ]
+        pending = []
+        for _, data in _fetch_all(executor, yangcatalog_api, paths):
+            for module in iter_modules(data):
+                if module_key(module) not in modules:
+                    modules[module_key(module)] = module
+                    pending.append(module)
+        # Follow dependencies until no new module is found
+        while pending:
+            names = {
+                dependency.get("name")
+                for module in pending
+                for dependency in module.get("dependencies") or []
+                if dependency.get("revision") or dependency.get("schema")
+            } - set(by_name)
+            paths = {
+                "name/{0}".format(quote(name, safe="")): name for name in names if name
+            }
+            for path, data in _fetch_all(executor, yangcatalog_api, paths):
+                name = paths[path]
+                by_name[name] = [
+                    module
+                    for module in iter_modules(data)
+                    if module.get("name") == name
+                ]
+            for name in names:
+                by_name.setdefault(name, [])
+            dependencies = pending
+            pending = []
+            for module in dependencies:
+                for dependency in module.get("dependencies") or []:
+                    target = select_dependency(
+                        by_name.get(dependency.get("name"), []), dependency
+                    )
+                    # Ghost dependencies are left to build_dep
+                    if target is not None and module_key(target) not in modules:
+                        modules[module_key(target)] = target
+                        pending.append(target)
+    logger.info(
+        "Collected {0} modules from {1} implemented ones".format(
+            len(modules), len(keys)
+        )
+    )
+    return list(modules.values())
@@ -0,0 +1,165 @@
+import codecs
+import json
+import logging
+import re
+from typing import BinaryIO, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Location of the module list within the YANG Catalog dump
+MODULES_PATH = ("yang-catalog:catalog", "modules", "module")
+
+READ_SIZE = 64 * 1024
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+_TOKEN_RE = re.compile(r'["\[\]{}]')
+_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+
+
+class _JSONReader:
+    """
+    Pull reader over a binary JSON document.
+
+    Only a window of the document is kept in memory. Values that
+    are not needed are skipped without being decoded, so memory
+    usage is bounded by the size of the largest decoded value.
+    """
+
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fp.read(READ_SIZE)
+        if not chunk:
+            self._eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self._buf = self._buf[self._pos :] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                "Malformed JSON: expected one of {0!r}, found {1!r}".format(chars, char)
+            )
+        self._pos += 1
+        return char
+
+    def read_value(self):
+        """
+        Decode the next JSON value in the document.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+                # A number may continue past the end of the window
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def skip_value(self):
+        """
+        Consume the next JSON value without decoding it.
+        """
+        if self.peek() not in "[{":
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            match = _TOKEN_RE.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError("Malformed JSON: unexpected end of document")
+                continue
+            if match.group() == '"':
+                string = _STRING_RE.match(self._buf, match.start())
+                if string is None or string.end() == len(self._buf):
+                    # String might be cut by the window
+                    self._pos = match.start()
+                    if not self._fill():
+                        raise ValueError("Malformed JSON: unterminated string")
+                    continue
+                self._pos = string.end()
+                continue
+            self._pos = match.end()
+            if match.group() in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def _iter_array(reader: _JSONReader, path: Tuple[str, ...]) -> Iterator:
+    """
+    Walk the document down to path and yield the items of the array
+    found there. Returns True once the array has been consumed.
+    """
+    if not path:
+        if reader.peek() != "[":
+            reader.skip_value()
+            return True
+        reader.expect("[")
+        if reader.peek() == "]":
+            reader.expect("]")
+            return True
+        while True:
+            yield reader.read_value()
+            if reader.expect(",]") == "]":
+                return True
+    if reader.peek() != "{":
+        reader.skip_value()
+        return False
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return False
+    while True:
+        key = reader.read_value()
+        reader.expect(":")
+        if key == path[0]:
+            found = yield from _iter_array(reader, path[1:])
+            if found:
+                return True
+        else:
+            reader.skip_value()
+        if reader.expect(",}") == "}":
+            return False
+
+
+def iter_catalog_modules(fp: BinaryIO) -> Iterator[dict]:
+    """
+    Incrementally parse a YANG Catalog dump and yield
+    the raw dicts of yang-catalog:catalog/modules/module
+    one by one, without loading the whole document.
+    """
+    reader = _JSONReader(fp)
+    count = 0
+    for module in _iter_array(reader, MODULES_PATH):
+        count += 1
+        yield module
+    logger.info("Parsed {0} modules from YANG Catalog dump".format(count))
@@ -0,0 +1,421 @@
+import logging
+import threading
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Callable, Dict, List, Optional, Tuple
+
+from catalog_connector.batching import PAYLOAD_TOO_LARGE_STATUS, AdaptiveBatcher
+from catalog_connector.clients.ngsi_ld import (
+    BATCH_ERROR_STATUS,
+    ENTITY_RETRIES,
+    BatchResult,
+    NGSILDAPI,
+    Options,
+    entity_size,
+)
+from catalog_connector.export import DeadLetterQueue
+from catalog_connector.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = 4
+
+# Broker replies the client retried in vain
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Consecutive failed attempts that trip the circuit breaker
+BREAKER_THRESHOLD = 5
+# Seconds before a tripped circuit breaker lets a probe through
+BREAKER_COOLDOWN = 30.0
+
+
+class UpsertError(Exception):
+    """
+    Raised when the broker fails in a way that makes
+    sending the remaining batches pointless.
+    """
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Trips after threshold consecutive failed requests, as the broker
+    is then deemed unhealthy, and rejects requests until cooldown
+    seconds have passed. A single probe request is then let through,
+    whose outcome closes the breaker or trips it again.
+    """
+
+    def __init__(
+        self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN
+    ):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened is None:
+            return "closed"
+        return "half-open" if self._probing else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened is None:
+                return True
+            if self._probing or time.monotonic() - self.opened < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, success: bool):
+        with self._lock:
+            if success:
+                self.failures = 0
+                self.opened = None
+            else:
+                self.failures += 1
+                if self._probing or self.failures >= self.threshold:
+                    if self.opened is None:
+                        logger.error("Broker unhealthy, circuit breaker tripped")
+                        METRICS.count("circuit_breaker_trips")
+                    self.opened = time.monotonic()
+            self._probing = False
+
+
+class SplitBatch:
+    """
+    Batch rejected for being too big and sent again in parts.
+    The callbacks of the batch are called once all the parts are
+    done, with the entities of every part, unless some entities
+    were left unacknowledged.
+    """
+
+    def __init__(
+        self,
+        entities: int,
+        on_success: Optional[Callable],
+        on_dead_letter: Optional[Callable],
+    ):
+        self.entities = entities
+        self.on_success = on_success
+        self.on_dead_letter = on_dead_letter
+        self.pending = 0
+        self.succeeded: List[dict] = []
+        self.dead_lettered: List[dict] = []
+
+    def part_done(self):
+        self.pending -= 1
+        if self.pending:
+            return
+        if len(self.succeeded) + len(self.dead_lettered) < self.entities:
+            # Not acknowledged, so that the batch is sent again on resume
+            return
+        if self.on_success and self.succeeded:
+            self.on_success(self.succeeded)
+        if self.on_dead_letter and self.dead_lettered:
+            self.on_dead_letter(self.dead_lettered)
+
+
+def payload_size(entities: List[dict]) -> int:
+    """
+    Size in bytes of the body of a batch request.
+    """
+    return 2 + sum(entity_size(entity) + 2 for entity in entities)
+
+
+class BatchUpserter:
+    """
+    Upsert stage that keeps up to max_in_flight batches
+    being sent to the NGSI-LD broker in the background,
+    so that the caller can keep building the next batches.
+
+    Failed requests are already retried by the NGSI-LD client, within
+    its retry budget. When the broker rejects only some entities of
+    a batch, only those are sent again, up to entity_retries times.
+    Batches rejected for being too big are split under the shrunk
+    batcher targets, or in halves, and sent again.
+    Entities failing for good are appended to the dead-letter queue,
+    when given, so that the other ones keep flowing, along with the
+    batches refused while the circuit breaker is open. Without a
+    dead-letter queue, the synchronization is aborted on the first
+    failed batch that is not only some entities rejected.
+    """
+
+    def __init__(
+        self,
+        ngsi_ld_api: NGSILDAPI,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        options: str = Options.update.value,
+        batcher: AdaptiveBatcher = None,
+        breaker: CircuitBreaker = None,
+        dead_letters: DeadLetterQueue = None,
+        entity_retries: int = ENTITY_RETRIES,
+    ):
+        self.ngsi_ld_api = ngsi_ld_api
+        self.batcher = batcher
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.dead_letters = dead_letters
+        self.entity_retries = entity_retries
+        self.max_in_flight = max(1, max_in_flight)
+        self.options = options
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.failed_entities = 0
+        # Failed batches left to be sent again on resume
+        self.unacknowledged = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="upsert"
+        )
+        # Callbacks, payload size and split batch of each pending batch
+        self._in_flight: Dict[Future, Tuple] = {}
+        self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except UpsertError:
+            # Do not mask an exception raised within the block
+            if exc_type is None:
+                raise
+
+    def _send(self, entities: list):
+        if not self.breaker.allow():
+            return CircuitOpenError("Circuit breaker open")
+        try:
+            result = self.ngsi_ld_api.upsertEntities(
+                entities, self.options, self.entity_retries
+            )
+        except Exception as e:
+            self.breaker.record(False)
+            return e
+        # Batch errors only concern its entities
+        self.breaker.record(result.status < 500 and result.status not in RETRY_STATUS)
+        if result.requests > 1:
+            METRICS.count("entity_retries", result.requests - 1)
+        return result
+
+    def _upsert(self, index: int, entities: list):
+        start = time.monotonic()
+        result = self._send(entities)
+        return index, entities, result, time.monotonic() - start
+
+    def _dead_letter(
+        self, entities: list, reason: str, on_dead_letter: Optional[Callable]
+    ) -> bool:
+        if self.dead_letters is None:
+            return False
+        self.dead_letters.write(entities, reason)
+        self.dead_lettered += 1
+        METRICS.count("dead_lettered_entities", len(entities))
+        if on_dead_letter:
+            on_dead_letter(entities)
+        return True
+
+    def _check(
+        self,
+        future: Future,
+        on_success: Optional[Callable],
+        size: int,
+        on_dead_letter: Optional[Callable],
+        split: Optional[SplitBatch] = None,
+    ):
+        index, entities, result, latency = future.result()
+        if isinstance(result, CircuitOpenError):
+            # Not sent at all, dead-lettered until a probe succeeds
+            self.failed += 1
+            if not self._dead_letter(entities, str(result), on_dead_letter):
+                self._error = self._error or UpsertError(
+                    "Broker unhealthy, circuit breaker open"
+                )
+            return
+        status = None if isinstance(result, Exception) else result.status
+        METRICS.observe_upsert(len(entities), size, latency, status)
+        if self.batcher:
+            self.batcher.record(len(entities), size, latency, status)
+        if isinstance(result, Exception):
+            self.failed += 1
+            logger.error("Batch {0} upsert failed: {1}".format(index, result))
+            if not self._dead_letter(entities, str(result), on_dead_letter):
+                self._error = self._error or UpsertError(str(result))
+            return
+        if result.ok or status in BATCH_ERROR_STATUS:
+            self._check_entities(index, entities, result, on_success, on_dead_letter)
+            return
+        if status in PAYLOAD_TOO_LARGE_STATUS and len(entities) > 1:
+            self._resplit(index, entities, on_success, on_dead_letter, split)
+            return
+        # Whole batch rejected, with the same error for all its entities
+        self.failed += 1
+        error = next(iter(result.errors.values()))
+        logger.error(
+            "Batch {0} with entities {1} failed with status {2}: {3}".format(
+                index,
+                [entity["id"] for entity in entities],
+                status,
+                error.get("detail", ""),
+            )
+        )
+        reason = "status {0}: {1}".format(status, error.get("detail", ""))
+        if not self._dead_letter(entities, reason, on_dead_letter):
+            self._error = self._error or UpsertError(
+                "Broker replied with status {0}".format(status)
+            )
+
+    def _check_entities(
+        self,
+        index: int,
+        entities: list,
+        result: BatchResult,
+        on_success: Optional[Callable],
+        on_dead_letter: Optional[Callable],
+    ):
+        if result.ok:
+            # Failed entities went through once sent again
+            self.succeeded += 1
+            if on_success:
+                on_success(entities)
+            return
+        self.failed += 1
+        self.failed_entities += len(result.errors)
+        METRICS.count("failed_entities", len(result.errors))
+        # The client logged the error of each entity
+        logger.error(
+            "Batch {0} upsert failed for {1} of {2} entities".format(
+                index, len(result.errors), len(entities)
+            )
+        )
+        if self.dead_letters is None:
+            # Not acknowledged, so that the batch is sent again on resume
+            self.unacknowledged += 1
+            return
+        failed = [entity for entity in entities if entity["id"] in result.errors]
+        if on_success and len(failed) < len(entities):
+            on_success(
+                [entity for entity in entities if entity["id"] not in result.errors]
+            )
+        reason = "; ".join(
+            sorted(
+                {
+                    error.get("title") or error.get("type") or "unknown error"
+                    for error in result.errors.values()
+                }
+            )
+        )
+        self._dead_letter(failed, reason, on_dead_letter)
+
+    def _resplit(
+        self,
+        index: int,
+        entities: list,
+        on_success: Optional[Callable],
+        on_dead_letter: Optional[Callable],
+        split: Optional[SplitBatch],
+    ):
+        parts = []
+        if self.batcher:
+            # Targets were shrunk by the rejection
+            parts = list(self.batcher.batches(entities))
+        if len(parts) < 2:
+            middle = len(entities) // 2
+            parts = [
+                (part, payload_size(part))
+                for part in (entities[:middle], entities[middle:])
+            ]
+        logger.warning(
+            "Batch {0} too large, sending it again in {1} parts".format(
+                index, len(parts)
+            )
+        )
+        METRICS.count("split_batches")
+        if split is None:
+            split = SplitBatch(len(entities), on_success, on_dead_letter)
+        # Parts of an already split batch are accounted by its split batch
+        split.pending += len(parts)
+        for part, size in parts:
+            self._start(
+                index,
+                part,
+                split.succeeded.extend,
+                size,
+                split.dead_lettered.extend,
+                split,
+            )
+
+    def _wait(self, return_when=FIRST_COMPLETED):
+        done, _ = wait(self._in_flight, return_when=return_when)
+        for future in done:
+            on_success, size, on_dead_letter, split = self._in_flight.pop(future)
+            self._check(future, on_success, size, on_dead_letter, split)
+            if split is not None:
+                split.part_done()
+
+    def _start(
+        self,
+        index: int,
+        entities: list,
+        on_success: Optional[Callable],
+        size: int,
+        on_dead_letter: Optional[Callable],
+        split: Optional[SplitBatch] = None,
+    ):
+        future = self._executor.submit(self._upsert, index, entities)
+        self._in_flight[future] = (on_success, size, on_dead_letter, split)
+        METRICS.observe_queue("upsert", len(self._in_flight), self.max_in_flight)
+
+    def submit(
+        self,
+        entities: list,
+        on_success: Optional[Callable] = None,
+        size: int = 0,
+        on_dead_letter: Optional[Callable] = None,
+    ):
+        """
+        Queue a batch of entities for upsert, blocking while
+        max_in_flight batches are pending. Raises UpsertError
+        once the broker has failed.
+        The on_success callback is called with the entities
+        from the caller thread once the broker accepts them,
+        and on_dead_letter once they are dead-lettered. Both
+        are called on a batch the broker partially rejected.
+        Size is the payload bytes reported to the batcher.
+        """
+        while len(self._in_flight) >= self.max_in_flight:
+            self._wait()
+        if self._error:
+            raise self._error
+        self._start(self.submitted, entities, on_success, size, on_dead_letter)
+        self.submitted += 1
+
+    def close(self):
+        """
+        Wait for pending batches and release the worker threads.
+        Raises UpsertError if the broker failed meanwhile.
+        """
+        # Parts of split batches may be started meanwhile
+        while self._in_flight:
+            self._wait(return_when=ALL_COMPLETED)
+        self._executor.shutdown()
+        logger.info(
+            "Upserted {0} batches, {1} failed ({2} entities), {3} dead-lettered".format(
+                self.succeeded, self.failed, self.failed_entities, self.dead_lettered
+            )
+        )
+        if self._error:
+            raise self._error
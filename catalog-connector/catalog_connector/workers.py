@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable
+
+from catalog_connector.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Per-process state set by the pool initializer
+_worker_state = {}
+
+
+def _init_worker(resolver):
+    _worker_state["resolver"] = resolver
+    # Forget metrics inherited from the parent process
+    METRICS.pop_totals()
+
+
+def _run(fn: Callable, args: tuple) -> str:
+    # Results are sent back JSON encoded, as pyangbind
+    # values cannot be pickled. Metrics measured
+    # in the worker are sent back along.
+    result = fn(_worker_state["resolver"], *args)
+    return json.dumps([result, METRICS.pop_totals()])
+
+
+class BuilderPool:
+    """
+    Process pool for the CPU-bound entity building stage.
+
+    The dependency resolver is handed to each worker once, when the
+    process starts (with the fork start method it is shared
+    copy-on-write), so tasks only carry their batch of modules.
+    The caller bounds the number of tasks in flight.
+    """
+
+    def __init__(self, resolver, workers: int = None):
+        self.workers = workers or os.cpu_count()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(resolver,),
+        )
+        logger.info("Started {0} entity builder processes".format(self.workers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, fn: Callable, args: tuple) -> Future:
+        """
+        Call fn(resolver, *args) in a worker. The returned
+        future holds the decoded result.
+        """
+        result = Future()
+
+        def done(future: Future):
+            try:
+                result.set_result(self._result(future))
+            except BaseException as e:
+                result.set_exception(e)
+
+        self._executor.submit(_run, fn, args).add_done_callback(done)
+        return result
+
+    def _result(self, future: Future):
+        result, totals = json.loads(future.result())
+        METRICS.merge_totals(totals)
+        return result
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,41 @@
+from catalog_connector.batching import AdaptiveBatcher
+from catalog_connector.clients.ngsi_ld import chunk_entities, entity_size
+
+ENTITIES = [{"id": "urn:ngsi-ld:Module:m{0}:2020-01-01".format(i)} for i in range(10)]
+
+
+def test_chunk_entities():
+    assert [len(b) for b in chunk_entities(ENTITIES, max_entities=4)] == [4, 4, 2]
+    size = entity_size(ENTITIES[0]) + 2
+    batches = list(chunk_entities(ENTITIES, max_bytes=2 + 3 * size))
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+    # Oversized entities are sent alone
+    assert [len(b) for b in chunk_entities(ENTITIES[:2], max_bytes=1)] == [1, 1]
+
+
+def test_adaptive_batcher():
+    batcher = AdaptiveBatcher(max_entities=6, initial_entities=4, target_latency=1.0)
+    batches = list(batcher.batches(ENTITIES))
+    assert [len(b) for b, _ in batches] == [4, 4, 2]
+    sizes = sum(entity_size(e) + 2 for e in ENTITIES)
+    assert sum(b for _, b in batches) == sizes + 3 * 2
+    # Fast, full batches grow the target up to the maximum
+    for _ in range(5):
+        batcher.record(batcher.entities_target, 100, 0.1, 201)
+    assert batcher.entities_target == 6
+    # Slow batches and failures shrink it
+    batcher.record(6, 100, 2.0, 201)
+    assert batcher.entities_target == 4
+    batcher.record(4, 100, 0.1, 503)
+    assert batcher.entities_target == 2
+    batcher.record(2, 100, 0.1, 413)
+    assert batcher.bytes_target == batcher.max_bytes // 2
+    assert batcher.sent_entities == 33
+    # Fast successes grow the bytes target back, slow ones do not
+    batcher.record(2, 100, 2.0, 201)
+    assert batcher.bytes_target == batcher.max_bytes // 2
+    batcher.record(2, 100, 0.1, 201)
+    assert batcher.bytes_target == batcher.max_bytes // 2 + batcher.min_bytes
+    for _ in range(100):
+        batcher.record(2, 100, 0.1, 201)
+    assert batcher.bytes_target == batcher.max_bytes
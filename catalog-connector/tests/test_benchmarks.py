@@ -0,0 +1,59 @@
+import pytest
+
+from benchmarks.bench_import import compare as compare_imports
+from benchmarks.bench_import import measure
+from benchmarks.bench_sync import compare, run
+from benchmarks.synthetic_catalog import generate_catalog
+
+
+def test_generate_catalog():
+    catalog = generate_catalog(200, seed=1)
+    assert catalog == generate_catalog(200, seed=1)
+    modules = catalog["yang-catalog:catalog"]["modules"]["module"]
+    assert len(modules) == 200
+    names = {module["name"] for module in modules}
+    dependencies = [
+        dependency["name"]
+        for module in modules
+        for dependency in module.get("dependencies", [])
+    ]
+    # Some dependencies point to modules missing from the catalog
+    assert any(name not in names for name in dependencies)
+    assert any(module.get("dependents") for module in modules)
+
+
+def test_bench_sync():
+    options = {"seed": 0, "fast": True, "stream": True, "workers": 1, "latency": 0}
+    result = run(50, options)
+    assert result["entities"] == len(
+        {
+            (module["name"], module["revision"])
+            for module in generate_catalog(50)["yang-catalog:catalog"]["modules"][
+                "module"
+            ]
+        }
+    )
+    assert result["requests"] > 0
+    assert compare([result], [result], 0.2) == []
+    slower = dict(result, modules_per_second=result["modules_per_second"] * 2)
+    assert len(compare([result], [slower], 0.2)) == 1
+
+
+def test_bench_import():
+    result = measure("catalog_connector.main", runs=1)
+    # The YANG bindings are only loaded once the pyangbind path runs
+    assert result["heavy"] == []
+    assert result["import_ms"] > 0
+    heavier = dict(result, heavy=["pyangbind"])
+    assert len(compare_imports([heavier], [result], 0.2)) == 1
+
+
+@pytest.mark.parametrize(
+    "module", ["platform_registry.registry", "platform_registry.main"]
+)
+def test_bench_import_platform_registry(module):
+    if module == "platform_registry.main":
+        pytest.importorskip("fastapi")
+    result = measure(module, runs=1)
+    # NETCONF and gNMI clients are only loaded by discovery
+    assert not {"ncclient", "pygnmi", "grpc"} & set(result["heavy"])
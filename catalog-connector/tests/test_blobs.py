@@ -0,0 +1,24 @@
+import os
+
+from catalog_connector.blobs import BlobStore
+
+
+def test_blob_store(tmp_path):
+    blobs = BlobStore(str(tmp_path), "http://context-catalog:8080/blobs/", min_size=10)
+    text = "YANG module description " * 10
+    entity = {
+        "id": "urn:ngsi-ld:Module:a:2020-01-01",
+        "description": {"type": "Property", "value": text},
+        "contact": {"type": "Property", "value": "short"},
+    }
+    blobs.offload(entity)
+    url = entity["description"]["value"]
+    assert url.startswith("http://context-catalog:8080/blobs/")
+    assert entity["description"]["size"]["value"] == len(text)
+    # Small texts stay inline
+    assert entity["contact"]["value"] == "short"
+    path = os.path.join(str(tmp_path), url.split("/blobs/")[1])
+    with open(path) as f:
+        assert f.read() == text
+    # Same content, same blob
+    assert blobs.put(text) == url
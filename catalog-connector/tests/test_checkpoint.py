@@ -0,0 +1,98 @@
+from catalog_connector.batching import AdaptiveBatcher
+from catalog_connector.checkpoint import Checkpoint, ProgressTracker, SnapshotDigest
+from catalog_connector.clients.ngsi_ld import NGSILDAPI
+from catalog_connector.main import sync_modules
+from catalog_connector.resolver import DependencyResolver
+
+
+def entities(*names):
+    return [{"id": "urn:ngsi-ld:Module:{0}:1".format(name)} for name in names]
+
+
+def test_progress_tracker():
+    progress = ProgressTracker(offset=10)
+    progress.produced(entities("a", "b"), 12)
+    progress.produced(entities("c", "d"), 15)
+    # Out of order acknowledgement does not advance the offset
+    assert not progress.acknowledge(2, 4)
+    assert progress.offset == 10
+    assert not progress.acknowledge(0, 1)
+    assert progress.acknowledge(1, 2)
+    assert progress.offset == 15
+    assert progress.module_id == "urn:ngsi-ld:Module:d:1"
+
+
+def test_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    digest = SnapshotDigest()
+    assert list(digest.feed(entities("a"))) == entities("a")
+    snapshot = digest.hexdigest()
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.resume_offset(snapshot) == 0
+    checkpoint.save(40, "urn:ngsi-ld:Module:a:1")
+    assert Checkpoint(path).resume_offset(snapshot) == 40
+    # Checkpoints of other snapshots are discarded
+    assert Checkpoint(path).resume_offset("other") == 0
+    checkpoint.clear()
+    assert Checkpoint(path).resume_offset(snapshot) == 0
+
+
+class FakeResponse:
+    status_code = 207
+    ok = True
+    text = ""
+
+    def __init__(self, body: dict):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class RejectingNGSILDAPI(NGSILDAPI):
+    def __init__(self, rejected: str):
+        super().__init__()
+        self.rejected = rejected
+
+    def batchEntityUpsert(self, entities: list, options: str):
+        ids = [entity["id"] for entity in entities]
+        return FakeResponse(
+            {
+                "success": [
+                    entity_id for entity_id in ids if entity_id != self.rejected
+                ],
+                "errors": [
+                    {"entityId": self.rejected, "error": {"title": "Invalid attribute"}}
+                ]
+                if self.rejected in ids
+                else [],
+            }
+        )
+
+
+def test_partial_failure_keeps_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    modules = [
+        {
+            "name": "m{0}".format(i),
+            "revision": "2020-01-01",
+            "organization": "ietf",
+            "module-type": "module",
+        }
+        for i in range(25)
+    ]
+    # The broker rejects an entity of the second module batch
+    api = RejectingNGSILDAPI("urn:ngsi-ld:Module:m22:2020-01-01")
+    stats = sync_modules(
+        api,
+        DependencyResolver.from_modules(modules),
+        modules,
+        fast=True,
+        batcher=AdaptiveBatcher(max_entities=5),
+        checkpoint=Checkpoint(path),
+        snapshot="snapshot",
+    )
+    assert stats["unacknowledged"] == 1
+    # Without a dead-letter queue, the failed batch is sent again on resume
+    assert Checkpoint(path).resume_offset("snapshot") == 20
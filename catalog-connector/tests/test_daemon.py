@@ -0,0 +1,32 @@
+import threading
+
+from catalog_connector.daemon import SyncDaemon
+
+
+def test_sync_daemon():
+    nested = []
+
+    def sync() -> dict:
+        # Runs never overlap
+        nested.append(daemon.run_once())
+        if daemon.runs == 2:
+            raise ValueError("Broker unavailable")
+        if daemon.runs == 3:
+            daemon.stop()
+        return {"entities": daemon.runs}
+
+    daemon = SyncDaemon(sync, interval=0)
+    assert daemon.readiness()[0] == 503
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert nested == [False, False, False]
+    assert daemon.runs == 3
+    assert daemon.failures == 1
+    assert daemon.consecutive_failures == 0
+    assert daemon.readiness()[0] == 200
+    assert daemon.health()[0] == 503
+    status = daemon.status()[1]
+    assert status["state"] == "idle"
+    assert status["lastRun"]["stats"] == {"entities": 3}
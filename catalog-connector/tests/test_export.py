@@ -0,0 +1,46 @@
+from catalog_connector.bulk_load import bulk_load
+from catalog_connector.clients.ngsi_ld import NGSILDAPI
+from catalog_connector.export import EntityWriter, iter_entities
+
+ENTITIES = [
+    {"id": "urn:ngsi-ld:Module:m{0}:2020-01-01".format(i), "type": "Module"}
+    for i in range(50)
+]
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+
+
+class FakeNGSILDAPI(NGSILDAPI):
+    def __init__(self, rejected: str = None):
+        super().__init__()
+        self.rejected = rejected
+        self.entities = []
+
+    def batchEntityUpsert(self, entities: list, options: str):
+        if any(entity["id"] == self.rejected for entity in entities):
+            return FakeResponse(400)
+        self.entities.extend(entities)
+        return FakeResponse(204)
+
+
+def test_export_and_bulk_load(tmp_path):
+    path = str(tmp_path / "entities.ndjson.gz")
+    with EntityWriter(path) as writer:
+        writer.write(ENTITIES[:20])
+        writer.write(ENTITIES[20:])
+    assert writer.entities == 50
+    assert list(iter_entities(path)) == ENTITIES
+
+    api = FakeNGSILDAPI()
+    assert bulk_load(api, path, max_in_flight=2) == 0
+    assert sorted(e["id"] for e in api.entities) == sorted(e["id"] for e in ENTITIES)
+
+    # Without a dead-letter queue, failed batches are reported
+    api = FakeNGSILDAPI(rejected=ENTITIES[7]["id"])
+    assert bulk_load(api, path, max_in_flight=2) == 1
+    assert len(api.entities) < len(ENTITIES)
@@ -0,0 +1,48 @@
+import json
+
+from catalog_connector.main import build_batch
+from catalog_connector.resolver import DependencyResolver
+
+MODULES = [
+    {
+        "name": "ietf-interfaces",
+        "revision": "2018-02-20",
+        "organization": "ietf",
+        "namespace": "urn:ietf:params:xml:ns:yang:ietf-interfaces",
+        "module-type": "module",
+        "schema": "https://example.org/ietf-interfaces@2018-02-20.yang",
+        "ietf": {"ietf-wg": "netmod"},
+        "yang-version": "1.1",
+        "expired": "false",
+        "dependencies": [
+            {"name": "ietf-yang-types", "revision": "2013-07-15"},
+            {"name": "ietf-yang-types", "schema": "https://example.org/x.yang"},
+        ],
+        "dependents": [
+            {"name": "ietf-ip", "schema": "https://example.org/ietf-ip@2018-02-22.yang"}
+        ],
+    },
+    {
+        "name": "ietf-ip-sub",
+        "revision": "2018-02-22",
+        "organization": "ietf",
+        "module-type": "submodule",
+        "belongs-to": "ietf-ip",
+        "expired": "not-applicable",
+        "description": "Submodule",
+    },
+    {
+        "name": "ietf-interfaces",
+        "revision": "2018-02-20",
+        "organization": "ietf",
+        "expired": True,
+    },
+]
+
+
+def test_fast_path_matches_pyangbind():
+    resolver = DependencyResolver.from_modules(MODULES)
+    fast_entities = build_batch(resolver, MODULES, fast=True)
+    entities = build_batch(resolver, MODULES)
+    assert len(fast_entities) == 2
+    assert json.dumps(fast_entities) == json.dumps(entities)
@@ -0,0 +1,54 @@
+from catalog_connector.blobs import BlobStore
+from catalog_connector.fingerprints import (
+    FingerprintStore,
+    module_entity_id,
+    module_fingerprint,
+)
+
+MODULE = {
+    "name": "ietf-interfaces",
+    "revision": "2018-02-20",
+    "organization": "ietf",
+    "module-type": "module",
+}
+
+
+def test_module_fingerprint(tmp_path):
+    assert module_entity_id(MODULE) == "urn:ngsi-ld:Module:ietf-interfaces:2018-02-20"
+    assert module_entity_id(dict(MODULE, **{"module-type": "submodule"})) == (
+        "urn:ngsi-ld:Submodule:ietf-interfaces:2018-02-20"
+    )
+    fingerprint = module_fingerprint(MODULE)
+    # Key order does not matter
+    assert fingerprint == module_fingerprint(dict(reversed(list(MODULE.items()))))
+    assert fingerprint != module_fingerprint(dict(MODULE, description="new"))
+    assert fingerprint != module_fingerprint(MODULE, ["urn:ngsi-ld:Module:a:b"])
+    # Turning blob offload on, or changing its settings, rewrites entities
+    blobs = BlobStore(str(tmp_path), "http://context-catalog:8080/blobs")
+    offloaded = module_fingerprint(MODULE, settings=blobs.settings)
+    assert offloaded != fingerprint
+    blobs.min_size *= 2
+    assert module_fingerprint(MODULE, settings=blobs.settings) != offloaded
+
+
+def test_fingerprint_store(tmp_path):
+    path = str(tmp_path / "fingerprints.json.gz")
+    store = FingerprintStore(path)
+    assert store.check("a", "1")
+    assert store.check("b", "2")
+    store.update({"a": "1", "b": "2"})
+    store.save()
+
+    store = FingerprintStore(path)
+    assert len(store) == 2
+    assert not store.check("a", "1")
+    assert store.check("c", "3")
+    store.update({"c": "3"})
+    store.prune()
+    assert store.report() == "1 added, 0 changed, 1 unchanged, 1 removed"
+    store.save()
+
+    store = FingerprintStore(path)
+    assert len(store) == 2
+    assert store.check("a", "changed")
+    assert store.stats["changed"] == 1
@@ -0,0 +1,69 @@
+import io
+import json
+
+from catalog_connector.graph import DependencyGraph
+from catalog_connector.main import build_dep
+from catalog_connector.resolver import DependencyResolver
+
+MODULES = [
+    {
+        "name": "a",
+        "revision": "2020-01-01",
+        "module-type": "module",
+        "dependencies": [
+            {"name": "b", "revision": "2020-01-01"},
+            {"name": "ghost", "revision": "2019-01-01"},
+        ],
+    },
+    # Same edge as above, seen from the other side
+    {
+        "name": "b",
+        "revision": "2020-01-01",
+        "module-type": "module",
+        "dependents": [
+            {"name": "a", "revision": "2020-01-01"},
+            {"name": "c", "revision": "2020-01-01"},
+        ],
+    },
+    {"name": "c", "revision": "2020-01-01", "module-type": "module"},
+]
+
+
+def build_graph():
+    resolver = DependencyResolver.from_modules(MODULES)
+    return DependencyGraph.from_modules(
+        MODULES, lambda *dep: build_dep(resolver, *dep)["object"]
+    )
+
+
+def test_dependency_graph():
+    graph = build_graph()
+    a, b, c, ghost = (
+        "urn:ngsi-ld:Module:a:2020-01-01",
+        "urn:ngsi-ld:Module:b:2020-01-01",
+        "urn:ngsi-ld:Module:c:2020-01-01",
+        "urn:ngsi-ld:Module:ghost:2019-01-01",
+    )
+    assert len(graph) == 4
+    assert graph.dependencies(a) == [b, ghost]
+    assert graph.dependents(b) == [a, c]
+    # Dependencies of c come from the dependents of b
+    assert graph.relationships(c) == {
+        "hasDependencies": [{"object": b, "datasetId": b}]
+    }
+    assert graph.dependents(ghost) == [a]
+    assert graph.closure(c) == {b}
+    assert graph.closure(ghost, dependents=True) == {a}
+
+
+def test_export_closures():
+    fp = io.StringIO()
+    build_graph().export_closures(fp)
+    closures = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert closures[0] == {
+        "id": "urn:ngsi-ld:Module:a:2020-01-01",
+        "closure": [
+            "urn:ngsi-ld:Module:b:2020-01-01",
+            "urn:ngsi-ld:Module:ghost:2019-01-01",
+        ],
+    }
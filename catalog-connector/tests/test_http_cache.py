@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from catalog_connector.clients.http_cache import HTTPCache
+from catalog_connector.clients.yang_catalog import YangCatalogAPI
+
+CATALOG = {"yang-catalog:catalog": {"modules": {"module": [{"name": "a"}]}}}
+
+
+class CatalogHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(CATALOG).encode()
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_yang_catalog_cache(tmp_path):
+    server = HTTPServer(("127.0.0.1", 0), CatalogHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{0}/api".format(server.server_port)
+        cache = HTTPCache(str(tmp_path), max_age=3600)
+        api = YangCatalogAPI(url=url, cache=cache)
+        assert api.get_whole_catalog() == CATALOG
+        # Fresh entry is served without any request
+        assert api.get_whole_catalog() == CATALOG
+        assert CatalogHandler.requests == [None]
+        # Stale entry is revalidated with a conditional request
+        cache.max_age = 0
+        with api.open_whole_catalog() as f:
+            assert json.load(f) == CATALOG
+        assert CatalogHandler.requests == [None, '"v1"']
+    finally:
+        server.shutdown()
+
+
+def test_cache_eviction(tmp_path):
+    cache = HTTPCache(str(tmp_path), max_size=0)
+    with open(tmp_path / "body", "wb") as f:
+        f.write(b"x" * 100)
+    with open(tmp_path / "body", "rb") as f:
+        cache.put("http://example.org/a", f)
+    with open(tmp_path / "body", "rb") as f:
+        cache.put("http://example.org/b", f)
+    # Latest entry is always kept
+    assert cache.get("http://example.org/a") is None
+    with cache.get("http://example.org/b").open() as f:
+        assert f.read() == b"x" * 100
+
+
+def test_concurrent_eviction(tmp_path, monkeypatch):
+    cache = HTTPCache(str(tmp_path), max_size=0)
+    with open(tmp_path / "body", "wb") as f:
+        f.write(b"x" * 100)
+    with open(tmp_path / "body", "rb") as f:
+        cache.put("http://example.org/a", f)
+    remove = os.remove
+
+    def remove_twice(path):
+        # Another process evicts the same entry first
+        remove(path)
+        remove(path)
+
+    monkeypatch.setattr(os, "remove", remove_twice)
+    with open(tmp_path / "body", "rb") as f:
+        cache.put("http://example.org/b", f)
+    assert cache.get("http://example.org/a") is None
@@ -0,0 +1,63 @@
+import json
+import urllib.error
+import urllib.request
+
+from catalog_connector.metrics import Metrics, MetricsExporter
+
+
+def test_metrics():
+    metrics = Metrics()
+    with metrics.stage("build", items=20):
+        pass
+    metrics.observe_upsert(20, 1000, 0.2, 204)
+    metrics.observe_upsert(10, 500, 3.0, None)
+    text = metrics.render()
+    assert 'catalog_connector_stage_items_total{stage="build"} 20' in text
+    assert 'catalog_connector_stage_items_total{stage="upsert"} 30' in text
+    assert 'catalog_connector_upsert_requests_total{status="error"} 1' in text
+    assert "catalog_connector_upsert_bytes_total 1500" in text
+    assert 'catalog_connector_broker_latency_seconds_bucket{le="0.25"} 1' in text
+    assert 'catalog_connector_broker_latency_seconds_bucket{le="+Inf"} 2' in text
+    assert metrics.latency.quantile(0.5) == 0.25
+    assert len(metrics.report()) == 3
+
+    # Totals measured elsewhere can be merged
+    metrics.count("schema_memo_hits", 3)
+    other = Metrics()
+    other.merge_totals(metrics.pop_totals())
+    assert other.stages["build"].items == 20
+    assert other.counters == {"schema_memo_hits": 3}
+    assert "catalog_connector_schema_memo_hits_total 3" in other.render()
+    assert not metrics.stages
+
+    # Each daemon run starts over
+    started = metrics.started
+    metrics.reset()
+    assert metrics.started >= started
+    assert not metrics.requests and not metrics.latency.count
+    assert metrics.report() == []
+
+
+def test_metrics_file(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    metrics = Metrics()
+    with MetricsExporter(metrics, path=path, interval=60):
+        metrics.add("download", 1.5)
+    with open(path) as f:
+        assert 'catalog_connector_stage_seconds_total{stage="download"} 1.5' in f.read()
+
+
+def test_metrics_routes():
+    metrics = Metrics()
+    routes = {"/readyz": lambda: (503, {"status": "not ready"})}
+    with MetricsExporter(metrics, port=0, routes=routes) as exporter:
+        url = "http://localhost:{0}".format(exporter._server.server_port)
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert b"catalog_connector_start_time_seconds" in response.read()
+        try:
+            urllib.request.urlopen(url + "/readyz")
+        except urllib.error.HTTPError as e:
+            assert e.code == 503
+            assert json.load(e) == {"status": "not ready"}
+        else:
+            raise AssertionError("Expected HTTP 503")
@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from catalog_connector.clients.ngsi_ld import NGSILDAPI, ReadCache
+
+
+class BrokerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    clients = set()
+    queries = []
+    paths = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.clients.add(self.client_address)
+        time.sleep(0.2)
+        self.send_response(503 if "unhealthy" in self.path else 204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        query = parse_qs(urlsplit(self.path).query)
+        offset = int(query.get("offset", ["0"])[0])
+        # Pages are capped below the limit asked for
+        limit = min(int(query.get("limit", ["20"])[0]), 80)
+        entities = [
+            {"id": "urn:ngsi-ld:Module:m{0}:1".format(i), "type": "Module"}
+            for i in range(250)
+        ]
+        if "id" in query:
+            ids = query["id"][0].split(",")
+            self.queries.append(ids)
+            entities = [entity for entity in entities if entity["id"] in ids]
+        body = json.dumps(entities[offset : offset + limit]).encode()
+        self.send_response(200)
+        if query.get("count") == ["true"]:
+            self.send_header("NGSILD-Results-Count", str(len(entities)))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def broker_url():
+    server = ThreadingHTTPServer(("localhost", 0), BrokerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://localhost:{0}".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_pooled_ngsi_ld_api(broker_url):
+    api = NGSILDAPI(broker_url, pool_size=4)
+    entities = [{"id": "urn:ngsi-ld:Module:m{0}:1".format(i)} for i in range(8)]
+    start = time.monotonic()
+    with ThreadPoolExecutor(4) as executor:
+        results = list(
+            executor.map(lambda entity: api.upsertEntities([entity]), entities)
+        )
+    elapsed = time.monotonic() - start
+    api.close()
+    assert all(result.ok for result in results)
+    # Two rounds of 4 concurrent requests
+    assert elapsed < 0.7
+    # Connections are kept alive and reused
+    assert len(BrokerHandler.clients) <= 4
+
+
+def test_retry_budget(broker_url):
+    api = NGSILDAPI(broker_url + "/unhealthy", retry_budget=1.0)
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.RetryError):
+        api.batchEntityUpsert([{"id": "urn:ngsi-ld:Module:a:1"}])
+    # Gave up instead of backing off for minutes
+    assert time.monotonic() - start < 2.0
+
+
+def test_headers_not_shared():
+    NGSILDAPI(keep_alive=False)
+    assert "Connection" not in NGSILDAPI().headers
+
+
+def test_query_pagination(broker_url):
+    api = NGSILDAPI(broker_url)
+    entities = list(api.iterEntities("Module", page_size=100))
+    assert [entity["id"] for entity in entities] == [
+        "urn:ngsi-ld:Module:m{0}:1".format(i) for i in range(250)
+    ]
+    assert api.countEntities("Module") == 250
+
+
+def test_read_cache(broker_url):
+    cache = ReadCache(maxsize=2, ttl=60)
+    api = NGSILDAPI(broker_url, cache=cache)
+    entities = api.queryEntities("Module", attrs="name,revision")
+    entities[0]["id"] = "modified"
+    # Same query, whatever the order of attributes
+    assert api.queryEntities("Module", attrs="revision,name")[0]["id"] != "modified"
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Own writes drop the queries that may match
+    api.batchEntityUpsert([{"id": "urn:ngsi-ld:Module:m0:1"}])
+    api.queryEntities("Module", attrs="name,revision")
+    assert cache.misses == 2
+
+    # Least recently used entries are evicted
+    cache.put(("entity", "a"), 1)
+    cache.put(("entity", "b"), 2)
+    cache.get(("entity", "a"))
+    cache.put(("entity", "c"), 3)
+    assert cache.get(("entity", "b")) != 2
+    assert cache.get(("entity", "a")) == 1
+    cache.ttl = 0
+    cache.put(("entity", "d"), 4)
+    assert cache.get(("entity", "d")) != 4
+    assert cache.hit_ratio == 3 / 7
+
+
+def test_read_cache_concurrent_write():
+    cache = ReadCache(maxsize=1)
+    a = ReadCache.key("entity", {"id": "a"})
+    b = ReadCache.key("entity", {"id": "b"})
+    query = ReadCache.key("query", {"type": "Module"})
+    generation = cache.generation()
+    # Writes land while the reads are in flight
+    cache.invalidate(["a"])
+    cache.put(a, 1, generation)
+    cache.put(query, [1], generation)
+    assert cache.get(a) != 1
+    assert cache.get(query) != [1]
+    # Other entities are still cached, also once "a" is forgotten
+    cache.put(b, 2, generation)
+    assert cache.get(b) == 2
+    cache.invalidate(["c"])
+    cache.put(a, 1, generation)
+    assert cache.get(a) != 1
+    # Reads started after the writes are cached
+    cache.put(a, 1, cache.generation())
+    assert cache.get(a) == 1
+
+
+def test_retrieve_entities(broker_url):
+    api = NGSILDAPI(broker_url)
+    ids = ["urn:ngsi-ld:Module:m{0}:1".format(i) for i in range(0, 300, 2)]
+    entities = api.retrieveEntities(ids, max_url_length=1024)
+    assert sorted(entities) == sorted(ids[:125])
+    assert entities[ids[0]]["id"] == ids[0]
+    # Several IDs per query, within the URL length bound
+    assert 1 < len(BrokerHandler.queries) < len(ids) / 10
+    assert all(len(",".join(query)) < 1024 for query in BrokerHandler.queries)
+
+
+def test_retrieve_entities_url_limit(broker_url):
+    api = NGSILDAPI(broker_url)
+    ids = ["urn:ngsi-ld:Module:m{0}:1".format(i) for i in range(90)]
+    url = "{0}/ngsi-ld/v1/entities".format(broker_url)
+    # Last page of a single query, past the 90 entities found
+    params = {"id": ",".join(ids), "limit": 100, "offset": 90}
+    max_url_length = len(requests.Request("GET", url, params=params).prepare().url)
+    BrokerHandler.paths.clear()
+    assert len(api.retrieveEntities(ids, max_url_length=max_url_length)) == 90
+    lengths = [len(broker_url + path) for path in BrokerHandler.paths]
+    # Pages of 80, 10 and none, the last one at the exact limit
+    assert lengths[-1] == max_url_length
+    assert len(lengths) == 3
+    BrokerHandler.paths.clear()
+    assert len(api.retrieveEntities(ids, max_url_length=max_url_length - 1)) == 90
+    lengths = [len(broker_url + path) for path in BrokerHandler.paths]
+    assert len(lengths) > 3
+    assert max(lengths) < max_url_length
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from catalog_connector.metrics import Metrics
+from catalog_connector.pipeline import Pipeline, parse_queue_depth
+
+
+def test_pipeline_backpressure():
+    produced = []
+
+    def read():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    metrics = Metrics()
+    with Pipeline(metrics) as pipeline:
+        items = pipeline.source("read", read(), depth=2)
+        items = pipeline.map("build", lambda i: i * 2, items, depth=3, workers=2)
+        results = []
+        for item in items:
+            time.sleep(0.001)
+            # Slow consumer holds back the upstream stages
+            assert len(produced) - len(results) <= 2 + 3 + 3
+            results.append(item)
+    assert results == [i * 2 for i in range(50)]
+    assert metrics.queues["read"].max <= 2
+    assert metrics.queues["build"].depth == 3
+
+
+def test_pipeline_failure():
+    def build(i):
+        if i == 5:
+            raise KeyError(i)
+        return i
+
+    with Pipeline(Metrics()) as pipeline:
+        items = pipeline.map("build", build, pipeline.source("read", range(100), 2))
+        with pytest.raises(KeyError):
+            list(items)
+
+
+def test_parse_queue_depth():
+    assert parse_queue_depth("build=8") == ("build", 8)
+    with pytest.raises(ValueError):
+        parse_queue_depth("upsert=8")
@@ -0,0 +1,124 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog_connector.main import build_dep
+from catalog_connector.metrics import METRICS
+from catalog_connector.resolver import DependencyResolver
+
+MODULES = [
+    {
+        "name": "ietf-interfaces",
+        "revision": "2018-02-20",
+        "organization": "ietf",
+        "module-type": "module",
+        "schema": "https://example.org/ietf-interfaces@2018-02-20.yang",
+    },
+    {
+        "name": "ietf-interfaces",
+        "revision": "2014-05-08",
+        "organization": "ietf",
+        "module-type": "module",
+    },
+    {
+        "name": "openconfig-extensions-sub",
+        "revision": "2020-06-16",
+        "organization": "openconfig",
+        "module-type": "submodule",
+    },
+]
+
+
+def test_resolver_indexes():
+    resolver = DependencyResolver.from_modules(MODULES)
+    assert len(resolver) == 3
+    assert resolver.by_revision("ietf-interfaces", "2014-05-08").organization == "ietf"
+    assert (
+        resolver.by_schema(
+            "ietf-interfaces", "https://example.org/ietf-interfaces@2018-02-20.yang"
+        ).revision
+        == "2018-02-20"
+    )
+    assert [r.revision for r in resolver.by_name("ietf-interfaces")] == [
+        "2018-02-20",
+        "2014-05-08",
+    ]
+    assert resolver.by_revision("ietf-interfaces", "2000-01-01") is None
+    assert resolver.by_name("missing") == []
+
+
+def test_build_dep():
+    resolver = DependencyResolver.from_modules(MODULES)
+    # Known module by revision
+    assert (
+        build_dep(resolver, "openconfig-extensions-sub", "2020-06-16")["object"]
+        == "urn:ngsi-ld:Submodule:openconfig-extensions-sub:2020-06-16"
+    )
+    # Known module by schema
+    assert (
+        build_dep(
+            resolver,
+            "ietf-interfaces",
+            dep_schema="https://example.org/ietf-interfaces@2018-02-20.yang",
+        )["object"]
+        == "urn:ngsi-ld:Module:ietf-interfaces:2018-02-20"
+    )
+    # Ghost dependency with revision in schema filename
+    assert (
+        build_dep(
+            resolver,
+            "ietf-ip",
+            dep_schema="https://example.org/ietf-ip@2018-02-22.yang",
+        )["object"]
+        == "urn:ngsi-ld:Module:ietf-ip:2018-02-22"
+    )
+    # Ghost dependency without revision
+    assert (
+        build_dep(resolver, "ietf-ip", dep_schema="https://example.org/ietf-ip.yang")[
+            "object"
+        ]
+        == "urn:ngsi-ld:Module:ietf-ip:unknown"
+    )
+    assert build_dep(resolver, "ietf-ip")["datasetId"] == (
+        "urn:ngsi-ld:Module:ietf-ip:unknown"
+    )
+
+
+def test_schema_memo():
+    resolver = DependencyResolver(schema_memo_size=2)
+    for module in MODULES:
+        resolver.add(module)
+    METRICS.pop_totals()
+    schema = "https://example.org/openconfig-extensions-sub@2020-06-16.yang"
+    for _ in range(3):
+        assert resolver.infer_from_schema("openconfig-extensions-sub", schema) == (
+            "2020-06-16",
+            "submodule",
+        )
+    resolver.infer_from_schema("a", "https://example.org/a.yang")
+    resolver.infer_from_schema("b", "https://example.org/b.yang")
+    # Least recently used entry was evicted
+    resolver.infer_from_schema("openconfig-extensions-sub", schema)
+    assert METRICS.pop_totals()["counters"] == {
+        "schema_memo_hits": 2,
+        "schema_memo_misses": 4,
+    }
+
+
+def test_schema_memo_threads():
+    resolver = DependencyResolver(schema_memo_size=8)
+    schemas = ["https://example.org/m{0}@2020-01-01.yang".format(i) for i in range(64)]
+
+    def infer():
+        for _ in range(50):
+            for schema in schemas:
+                assert resolver.infer_from_schema("m", schema)[0] == "2020-01-01"
+
+    with ThreadPoolExecutor(4) as executor:
+        for future in [executor.submit(infer) for _ in range(4)]:
+            future.result()
+    assert len(resolver._schema_memo) == 8
+    # Handed to worker processes along with a lock of its own
+    assert pickle.loads(pickle.dumps(resolver)).infer_from_schema("m", schemas[-1]) == (
+        "2020-01-01",
+        "module",
+    )
@@ -0,0 +1,135 @@
+from catalog_connector.main import build_dep
+from catalog_connector.resolver import DependencyResolver
+from catalog_connector.scope import Scope, collect_scoped_modules, select_dependency
+
+MODULES = [
+    {
+        "name": "vendor-a",
+        "revision": "2020-01-01",
+        "organization": "acme",
+        "dependencies": [{"name": "base", "revision": "2019-01-01"}, {"name": "ghost"}],
+    },
+    {
+        "name": "base",
+        "revision": "2019-01-01",
+        "organization": "ietf",
+        "dependencies": [
+            {"name": "types", "schema": "https://example.org/types@2018-01-01.yang"}
+        ],
+    },
+    {"name": "base", "revision": "2021-01-01", "organization": "ietf"},
+    {
+        "name": "types",
+        "revision": "2018-01-01",
+        "organization": "ietf",
+        "dependents": [{"name": "types-sub", "revision": "2018-01-01"}],
+    },
+    {"name": "types", "revision": "2022-01-01", "organization": "ietf"},
+    {"name": "unrelated", "revision": "2020-01-01", "organization": "ietf"},
+]
+for module in MODULES:
+    module["module-type"] = "module"
+MODULES.append(
+    {
+        "name": "types-sub",
+        "revision": "2018-01-01",
+        "organization": "ietf",
+        "module-type": "submodule",
+    }
+)
+
+
+class FakeYangCatalogAPI:
+    def __init__(self):
+        self.paths = []
+
+    def filter_leaf_data(self, path_value):
+        self.paths.append(path_value)
+        if path_value.startswith("vendors/"):
+            modules = [
+                {"name": "vendor-a", "revision": "2020-01-01", "organization": "acme"}
+            ]
+            return {
+                "yang-catalog:vendor": [
+                    {
+                        "name": "acme",
+                        "platforms": {
+                            "platform": [
+                                {
+                                    "name": "x1",
+                                    "software-versions": {
+                                        "software-version": [
+                                            {
+                                                "name": "1.0",
+                                                "modules": {"module": modules},
+                                            }
+                                        ]
+                                    },
+                                }
+                            ]
+                        },
+                    }
+                ]
+            }
+        if path_value.startswith("modules/"):
+            key = path_value.split("/", 1)[1].split(",")
+            return {
+                "module": [
+                    m
+                    for m in MODULES
+                    if [m["name"], m["revision"], m["organization"]] == key
+                ]
+            }
+        name = path_value.split("/", 1)[1]
+        return {
+            "yang-catalog:modules": {
+                "module": [m for m in MODULES if m["name"] == name]
+            }
+        }
+
+
+def test_scope():
+    assert Scope.parse("acme/x1/1.0").path() == (
+        "vendors/vendor/acme/platforms/platform/x1"
+        "/software-versions/software-version/1.0"
+    )
+    assert Scope.parse("acme").path() == "vendors/vendor/acme"
+
+
+def test_select_dependency():
+    bases = MODULES[1:3]
+    # Name only dependencies point to an unknown revision, as in build_dep
+    assert select_dependency(bases, {"name": "base"}) is None
+    types = MODULES[3:5]
+    assert (
+        select_dependency(
+            types,
+            {"name": "types", "schema": "https://example.org/types@2022-01-01.yang"},
+        )
+        is MODULES[4]
+    )
+    assert select_dependency(bases, {"name": "base", "revision": "2019-01-01"}) is (
+        MODULES[1]
+    )
+    assert select_dependency(bases, {"name": "base", "revision": "2000-01-01"}) is None
+
+
+def test_collect_scoped_modules():
+    api = FakeYangCatalogAPI()
+    modules = collect_scoped_modules(api, [Scope.parse("acme/x1/1.0")])
+    assert [(m["name"], m["revision"]) for m in modules] == [
+        ("vendor-a", "2020-01-01"),
+        ("base", "2019-01-01"),
+        ("types", "2018-01-01"),
+    ]
+    # Each dependency name is fetched once, unless it is a name only one
+    assert sorted(api.paths[2:]) == ["name/base", "name/types"]
+    # Dependents outside the scope are not fetched, so their type is unknown
+    resolver = DependencyResolver.from_modules(modules)
+    assert build_dep(resolver, "types-sub", "2018-01-01")["object"] == (
+        "urn:ngsi-ld:Module:types-sub:2018-01-01"
+    )
+    full = DependencyResolver.from_modules(MODULES)
+    assert build_dep(full, "types-sub", "2018-01-01")["object"] == (
+        "urn:ngsi-ld:Submodule:types-sub:2018-01-01"
+    )
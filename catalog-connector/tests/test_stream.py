@@ -0,0 +1,45 @@
+import io
+import json
+
+from catalog_connector import stream
+from catalog_connector.stream import iter_catalog_modules
+
+CATALOG = {
+    "yang-catalog:catalog": {
+        "vendors": {
+            "vendor": [
+                {
+                    "name": "cisco",
+                    "modules": {"module": [{"name": "decoy", "revision": "x"}]},
+                }
+            ]
+        },
+        "modules": {
+            "module": [
+                {
+                    "name": "ietf-interfaces",
+                    "revision": "2018-02-20",
+                    "description": 'Escaped "quotes" and \\ brackets ]}[{',
+                    "dependencies": [{"name": "ietf-yang-types"}],
+                },
+                {"name": "ietf-ip", "revision": "2018-02-22", "expired": False},
+                {"name": "café", "revision": "2020-01-01", "size": 12345},
+            ]
+        },
+    }
+}
+
+
+def test_iter_catalog_modules(monkeypatch):
+    # Small window to exercise values cut across reads
+    monkeypatch.setattr(stream, "READ_SIZE", 7)
+    fp = io.BytesIO(json.dumps(CATALOG, indent=2).encode("utf-8"))
+    modules = list(iter_catalog_modules(fp))
+    assert modules == CATALOG["yang-catalog:catalog"]["modules"]["module"]
+
+
+def test_iter_catalog_modules_empty():
+    fp = io.BytesIO(b'{"yang-catalog:catalog": {"modules": {"module": []}}}')
+    assert list(iter_catalog_modules(fp)) == []
+    fp = io.BytesIO(b'{"yang-catalog:catalog": {}}')
+    assert list(iter_catalog_modules(fp)) == []
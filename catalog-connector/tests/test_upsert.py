@@ -0,0 +1,234 @@
+import json
+import time
+
+import pytest
+
+from catalog_connector.batching import AdaptiveBatcher
+from catalog_connector.clients.ngsi_ld import NGSILDAPI
+from catalog_connector.export import DeadLetterQueue, iter_entities
+from catalog_connector.upsert import BatchUpserter, CircuitBreaker, UpsertError
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+        self.body = body
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("No JSON body")
+        return self.body
+
+
+class FakeNGSILDAPI(NGSILDAPI):
+    def __init__(self, statuses: dict):
+        super().__init__()
+        self.statuses = statuses
+        self.batches = []
+
+    def batchEntityUpsert(self, entities: list, options: str):
+        self.batches.append(entities)
+        status = self.statuses.get(entities[0]["id"], 204)
+        if status != 207:
+            return FakeResponse(status)
+        return FakeResponse(
+            207,
+            {
+                "success": [entity["id"] for entity in entities[1:]],
+                "errors": [
+                    {
+                        "entityId": entities[0]["id"],
+                        "error": {
+                            "type": "https://uri.etsi.org/ngsi-ld/errors/BadRequestData",
+                            "title": "Invalid attribute",
+                        },
+                    }
+                ],
+            },
+        )
+
+
+def test_batch_upserter():
+    api = FakeNGSILDAPI({"urn:ngsi-ld:Module:b:1": 207})
+    with BatchUpserter(api, max_in_flight=2) as upserter:
+        for name in "abcde":
+            upserter.submit([{"id": "urn:ngsi-ld:Module:{0}:1".format(name)}])
+    assert len(api.batches) == 5
+    assert upserter.succeeded == 4
+    assert upserter.failed == 1
+
+
+class PartialNGSILDAPI(FakeNGSILDAPI):
+    def batchEntityUpsert(self, entities: list, options: str):
+        self.batches.append([entity["id"] for entity in entities])
+        if len(self.batches) > 1:
+            return FakeResponse(201)
+        return FakeResponse(
+            207,
+            {
+                "success": [entity["id"] for entity in entities[2:]],
+                "errors": [
+                    {
+                        "entityId": entities[0]["id"],
+                        "error": {"title": "Internal error"},
+                    },
+                    {
+                        "entityId": entities[1]["id"],
+                        "error": {
+                            "type": "https://uri.etsi.org/ngsi-ld/errors/BadRequestData",
+                            "title": "Invalid attribute",
+                        },
+                    },
+                ],
+            },
+        )
+
+
+def test_batch_upserter_partial_failure(tmp_path):
+    api = PartialNGSILDAPI({})
+    entities = [{"id": "urn:ngsi-ld:Module:{0}:1".format(name)} for name in "abcd"]
+    acknowledged = []
+    with DeadLetterQueue(str(tmp_path / "dead-letters.ndjson")) as dead_letters:
+        with BatchUpserter(api, max_in_flight=1, dead_letters=dead_letters) as upserter:
+            upserter.submit(entities, on_success=acknowledged.extend)
+    # Only the entity whose error is not permanent is sent again
+    assert api.batches[1:] == [["urn:ngsi-ld:Module:a:1"]]
+    assert [entity["id"] for entity in acknowledged] == [
+        "urn:ngsi-ld:Module:a:1",
+        "urn:ngsi-ld:Module:c:1",
+        "urn:ngsi-ld:Module:d:1",
+    ]
+    assert upserter.failed_entities == 1
+    assert [entity["id"] for entity in iter_entities(dead_letters.path)] == [
+        "urn:ngsi-ld:Module:b:1"
+    ]
+
+
+def test_batch_upserter_fatal_error():
+    api = FakeNGSILDAPI({"urn:ngsi-ld:Module:a:1": 503})
+    with pytest.raises(UpsertError):
+        with BatchUpserter(api, max_in_flight=1) as upserter:
+            for name in "abcde":
+                upserter.submit([{"id": "urn:ngsi-ld:Module:{0}:1".format(name)}])
+    assert len(api.batches) == 1
+
+
+class FlakyNGSILDAPI(FakeNGSILDAPI):
+    def batchEntityUpsert(self, entities: list, options: str):
+        self.batches.append(entities)
+        if len(self.batches) == 1:
+            raise ConnectionError("Connection reset")
+        return FakeResponse(503 if len(self.batches) == 2 else 201)
+
+
+def test_batch_upserter_no_retries(tmp_path):
+    api = FlakyNGSILDAPI({})
+    with DeadLetterQueue(str(tmp_path / "dead-letters.ndjson")) as dead_letters:
+        with BatchUpserter(api, max_in_flight=1, dead_letters=dead_letters) as upserter:
+            upserter.submit([{"id": "urn:ngsi-ld:Module:a:1"}])
+            upserter.submit([{"id": "urn:ngsi-ld:Module:b:1"}])
+    # Failed requests were already retried by the client
+    assert len(api.batches) == 2
+    assert upserter.dead_lettered == 2
+    assert upserter.succeeded == 0
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(0.06)
+    # Single probe once cooled down
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def test_batch_upserter_dead_letter(tmp_path):
+    path = str(tmp_path / "dead-letters.ndjson")
+    api = FakeNGSILDAPI({"urn:ngsi-ld:Module:b:1": 500, "urn:ngsi-ld:Module:d:1": 400})
+    dead = []
+    with DeadLetterQueue(path) as dead_letters:
+        with BatchUpserter(api, max_in_flight=2, dead_letters=dead_letters) as upserter:
+            for name in "abcde":
+                upserter.submit(
+                    [{"id": "urn:ngsi-ld:Module:{0}:1".format(name)}],
+                    on_dead_letter=dead.extend,
+                )
+    assert upserter.succeeded == 3
+    assert upserter.dead_lettered == 2
+    assert sorted(entity["id"] for entity in dead) == [
+        "urn:ngsi-ld:Module:b:1",
+        "urn:ngsi-ld:Module:d:1",
+    ]
+    assert sorted(entity["id"] for entity in iter_entities(path)) == [
+        "urn:ngsi-ld:Module:b:1",
+        "urn:ngsi-ld:Module:d:1",
+    ]
+
+
+class DownNGSILDAPI(FakeNGSILDAPI):
+    def batchEntityUpsert(self, entities: list, options: str):
+        self.batches.append(entities)
+        raise ConnectionError("Connection refused")
+
+
+def test_batch_upserter_circuit_breaker(tmp_path):
+    api = DownNGSILDAPI({})
+    with DeadLetterQueue(str(tmp_path / "dead-letters.ndjson")) as dead_letters:
+        with BatchUpserter(
+            api,
+            max_in_flight=1,
+            breaker=CircuitBreaker(threshold=3, cooldown=60),
+            dead_letters=dead_letters,
+        ) as upserter:
+            for name in "abcdefgh":
+                upserter.submit([{"id": "urn:ngsi-ld:Module:{0}:1".format(name)}])
+    # Requests stop once the breaker trips, refused batches are dead-lettered
+    assert len(api.batches) == 3
+    assert upserter.dead_lettered == 8
+    assert len(list(iter_entities(dead_letters.path))) == 8
+
+
+class SizeLimitedNGSILDAPI(FakeNGSILDAPI):
+    def __init__(self, max_bytes: int):
+        super().__init__({})
+        self.max_bytes = max_bytes
+        self.entities = {}
+
+    def batchEntityUpsert(self, entities: list, options: str):
+        self.batches.append(entities)
+        if len(json.dumps(entities)) > self.max_bytes:
+            return FakeResponse(413)
+        self.entities.update((entity["id"], entity) for entity in entities)
+        return FakeResponse(204)
+
+
+def test_batch_upserter_payload_too_large(tmp_path):
+    api = SizeLimitedNGSILDAPI(40 * 1024)
+    entities = [
+        {"id": "urn:ngsi-ld:Module:m{0}:1".format(i), "description": "x" * 1000}
+        for i in range(300)
+    ]
+    # Sent alone, this one is still too large
+    entities.append({"id": "urn:ngsi-ld:Module:big:1", "description": "x" * 50000})
+    batcher = AdaptiveBatcher(max_bytes=512 * 1024, max_entities=100, min_bytes=1024)
+    acknowledged = []
+    with DeadLetterQueue(str(tmp_path / "dead-letters.ndjson")) as dead_letters:
+        with BatchUpserter(
+            api, max_in_flight=2, batcher=batcher, dead_letters=dead_letters
+        ) as upserter:
+            for batch, size in batcher.batches(entities):
+                upserter.submit(batch, acknowledged.extend, size)
+    # Every entity arrived, the rejected batches were split and sent again
+    assert sorted(api.entities) == sorted(entity["id"] for entity in entities[:-1])
+    assert sorted(entity["id"] for entity in acknowledged) == sorted(api.entities)
+    assert [entity["id"] for entity in iter_entities(dead_letters.path)] == [
+        "urn:ngsi-ld:Module:big:1"
+    ]
@@ -0,0 +1,23 @@
+from catalog_connector.workers import BuilderPool
+
+
+def scale(resolver: dict, value: int) -> dict:
+    return {"value": value * resolver["factor"]}
+
+
+def fail(resolver: dict, value: int) -> dict:
+    raise ValueError(value)
+
+
+def test_builder_pool_submit():
+    with BuilderPool({"factor": 3}, workers=2) as pool:
+        futures = [pool.submit(scale, (i,)) for i in range(20)]
+        results = [future.result() for future in futures]
+        failed = pool.submit(fail, (7,))
+        try:
+            failed.result()
+        except ValueError as e:
+            assert e.args == (7,)
+        else:
+            raise AssertionError("Expected ValueError")
+    assert results == [{"value": i * 3} for i in range(20)]
@@ -0,0 +1,78 @@
+import logging
+import random
+import time
+
+from requests.packages.urllib3.exceptions import MaxRetryError, ResponseError
+from requests.packages.urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Replies worth sending the request again
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_METHODS = ("HEAD", "GET", "PUT", "POST", "OPTIONS")
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 1.0
+# Seconds a request keeps being retried after its first failure
+RETRY_BUDGET = 60.0
+
+
+class BudgetRetry(Retry):
+    """
+    Retry with exponential backoff and full jitter, bounded by a time
+    budget counted from the first failed attempt of a request, so that
+    a failing request cannot hold its caller for more than the budget
+    plus one attempt.
+    """
+
+    def __init__(self, *args, budget: float = RETRY_BUDGET, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.budget = budget
+        self.first_failure = None
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.budget = self.budget
+        retry.first_failure = self.first_failure
+        return retry
+
+    def get_backoff_time(self) -> float:
+        # Spread the retries of concurrent requests over time
+        return random.uniform(0, super().get_backoff_time())
+
+    def increment(
+        self,
+        method=None,
+        url=None,
+        response=None,
+        error=None,
+        _pool=None,
+        _stacktrace=None,
+    ):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        now = time.monotonic()
+        if retry.first_failure is None:
+            retry.first_failure = now
+        # Budget checked against the longest backoff before the next attempt
+        backoff = Retry.get_backoff_time(retry)
+        if now + backoff - retry.first_failure > self.budget:
+            logger.warning(
+                "Retry budget of {0:.0f}s exhausted for {1}".format(self.budget, url)
+            )
+            raise MaxRetryError(
+                _pool, url, error or ResponseError("retry budget exhausted")
+            )
+        return retry
+
+
+def retry_policy(
+    total: int = RETRY_TOTAL,
+    backoff: float = RETRY_BACKOFF,
+    budget: float = RETRY_BUDGET,
+) -> BudgetRetry:
+    return BudgetRetry(
+        total=total,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=RETRY_METHODS,
+        backoff_factor=backoff,
+        budget=budget,
+    )
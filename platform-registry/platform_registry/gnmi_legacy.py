@@ -3,9 +3,14 @@ import logging
 from pygnmi.client import gNMIclient
 
 from platform_registry.clients.ngsi_ld import NGSILDAPI
-from platform_registry.models.ngsi_ld.platform import (BelongsTo, Credentials,
-                                                       Module, ModuleSet,
-                                                       Platform, Protocol)
+from platform_registry.models.ngsi_ld.platform import (
+    BelongsTo,
+    Credentials,
+    Module,
+    ModuleSet,
+    Platform,
+    Protocol,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -13,16 +18,17 @@ logger = logging.getLogger(__name__)
 def build_module_set(platform: Platform, name: str = "default") -> ModuleSet:
     # Produce ModuleSet entity
     module_set_entity = ModuleSet(
-        id="urn:ngsi-ld:ModuleSet:{0}:{1}".format(
-            platform.id.split(":")[-1], name),
+        id="urn:ngsi-ld:ModuleSet:{0}:{1}".format(platform.id.split(":")[-1], name),
         name={"value": name},
         definedBy={"object": platform.id},
     )
     logger.info("Building %s" % module_set_entity.id)
     return module_set_entity
 
-def loader(platform: Platform, gnmi: Protocol,
-           credentials: Credentials, ngsi_ld_api: NGSILDAPI) -> None:
+
+def loader(
+    platform: Platform, gnmi: Protocol, credentials: Credentials, ngsi_ld_api: NGSILDAPI
+) -> None:
 
     gc = gNMIclient(
         target=(str(gnmi.address.value), gnmi.port.value),
@@ -38,8 +44,9 @@ def loader(platform: Platform, gnmi: Protocol,
     # This is Legacy mechanism, set Module Set to "default"
     module_set_entity = build_module_set(platform)
     logger.info("Creating %s" % module_set_entity.id)
-    ngsi_ld_api.batchEntityUpsert([module_set_entity.dict(exclude_none=True)])
+    ngsi_ld_api.upsertEntities([module_set_entity.dict(exclude_none=True)])
 
+    module_entities = {}
     for model in supported_models:
         name = model["name"]
         revision = model["version"]
@@ -50,15 +57,14 @@ def loader(platform: Platform, gnmi: Protocol,
             datasetId=module_set_entity.id,
         )
         module_entity = Module(
-            id="urn:ngsi-ld:Module:{0}:{1}".format(
-                name, revision
-            ),
+            id="urn:ngsi-ld:Module:{0}:{1}".format(name, revision),
             name={"value": name},
             revision={"value": revision},
             organization={"value": organization},
             belongsTo=belongs_to_rel,
         )
         logger.info("Creating %s" % module_entity.id)
-        ngsi_ld_api.batchEntityUpsert(
-            [module_entity.dict(exclude_none=True)], "update"
-        )
+        module_entities[module_entity.id] = module_entity.dict(exclude_none=True)
+
+    # Send all Module entities in bounded batch upserts
+    ngsi_ld_api.chunkedEntityUpsert(module_entities.values(), "update")
@@ -3,6 +3,7 @@ import os
 import sys
 
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 
 from platform_registry.clients.ngsi_ld import NGSILDAPI
 from platform_registry.models.rest import Registration
@@ -17,13 +18,25 @@ CONTEXT_CATALOG_URI = os.getenv(
     "CONTEXT_CATALOG_URI", "http://context-catalog:8080/context.jsonld"
 )
 
+# Pooled keep-alive connections to the broker
+BROKER_POOL_SIZE = int(os.getenv("BROKER_POOL_SIZE", "10"))
+
 # Init NGSI-LD API Client
-ngsi_ld = NGSILDAPI(url=BROKER_URI, context=CONTEXT_CATALOG_URI)
+ngsi_ld = NGSILDAPI(
+    url=BROKER_URI, context=CONTEXT_CATALOG_URI, pool_size=BROKER_POOL_SIZE
+)
 
 # Init FastAPI server
 app = FastAPI(title="Platform Registry API", version="1.0.0")
 
 
+@app.on_event("shutdown")
+def close_ngsi_ld():
+    ngsi_ld.close()
+
+
 @app.post("/platforms/")
 async def register_platform(registration: Registration):
-    loader(registration, ngsi_ld)
+    # Platform discovery blocks, so it runs off the event loop,
+    # concurrent registrations sharing the broker connection pool
+    await run_in_threadpool(loader, registration, ngsi_ld)
@@ -4,9 +4,14 @@ from typing import List
 from ncclient import manager
 
 from platform_registry.clients.ngsi_ld import NGSILDAPI
-from platform_registry.models.ngsi_ld.platform import (BelongsTo, Credentials,
-                                                       Module, ModuleSet,
-                                                       Platform, Protocol)
+from platform_registry.models.ngsi_ld.platform import (
+    BelongsTo,
+    Credentials,
+    Module,
+    ModuleSet,
+    Platform,
+    Protocol,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,16 +19,20 @@ logger = logging.getLogger(__name__)
 def build_module_set(platform: Platform, name: str = "default") -> ModuleSet:
     # Produce ModuleSet entity
     module_set_entity = ModuleSet(
-        id="urn:ngsi-ld:ModuleSet:{0}:{1}".format(
-            platform.id.split(":")[-1], name),
+        id="urn:ngsi-ld:ModuleSet:{0}:{1}".format(platform.id.split(":")[-1], name),
         name={"value": name},
         definedBy={"object": platform.id},
     )
     logger.info("Building %s" % module_set_entity.id)
     return module_set_entity
 
-def loader(platform: Platform, netconf: Protocol,
-           credentials: Credentials, ngsi_ld_api: NGSILDAPI) -> None:
+
+def loader(
+    platform: Platform,
+    netconf: Protocol,
+    credentials: Credentials,
+    ngsi_ld_api: NGSILDAPI,
+) -> None:
 
     # We rely on NETCONF to collect module information
     # https://community.cisco.com/t5/devnet-sandbox/
@@ -52,11 +61,12 @@ def loader(platform: Platform, netconf: Protocol,
     # This is Legacy mechanism, set Module Set to "default"
     module_set_entity = build_module_set(platform)
     logger.info("Creating %s" % module_set_entity.id)
-    ngsi_ld_api.batchEntityUpsert([module_set_entity.dict(exclude_none=True)])
+    ngsi_ld_api.upsertEntities([module_set_entity.dict(exclude_none=True)])
 
     # Thus far, rely on NETCONF capabilities to discover YANG modules
     # NETCONF hello retrieves features, deviations,
     # and submodules (as other modules though)
+    module_entities = {}
     for module in nc_modules:
         name = module.parameters["module"]
         revision = module.parameters["revision"]
@@ -76,15 +86,14 @@ def loader(platform: Platform, netconf: Protocol,
             datasetId=module_set_entity.id,
         )
         module_entity = Module(
-            id="urn:ngsi-ld:Module:{0}:{1}".format(
-                name, revision
-            ),
+            id="urn:ngsi-ld:Module:{0}:{1}".format(name, revision),
             name={"value": name},
             revision={"value": revision},
             namespace={"value": module.namespace_uri},
             belongsTo=belongs_to_rel,
         )
         logger.info("Creating %s" % module_entity.id)
-        ngsi_ld_api.batchEntityUpsert(
-            [module_entity.dict(exclude_none=True)], "update"
-        )
+        module_entities[module_entity.id] = module_entity.dict(exclude_none=True)
+
+    # Send all Module entities in bounded batch upserts
+    ngsi_ld_api.chunkedEntityUpsert(module_entities.values(), "update")
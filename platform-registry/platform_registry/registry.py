@@ -3,29 +3,36 @@ import os
 import xml.etree.ElementTree as ET
 from cmath import log
 from re import S
-from typing import List
-
-from ncclient import manager
-from ncclient.capabilities import Capability
-from pygnmi.client import gNMIclient
+from typing import TYPE_CHECKING, List
 
 from platform_registry.clients.ngsi_ld import NGSILDAPI
-from platform_registry.gnmi_legacy import loader as gnmi_legacy_loader
 from platform_registry.models.ngsi_ld.entity import DatasetId
-from platform_registry.models.ngsi_ld.platform import (BelongsTo, Credentials,
-                                                       Datastore, Module,
-                                                       ModuleSet, Platform,
-                                                       Protocol, Schema,
-                                                       Submodule)
-from platform_registry.models.rest import (CredentialsConfig, ProtocolConfig,
-                                           Registration)
-from platform_registry.netconf_legacy import loader as netconf_legacy_loader
+from platform_registry.models.ngsi_ld.platform import (
+    BelongsTo,
+    Credentials,
+    Datastore,
+    Module,
+    ModuleSet,
+    Platform,
+    Protocol,
+    Schema,
+    Submodule,
+)
+from platform_registry.models.rest import (
+    CredentialsConfig,
+    ProtocolConfig,
+    Registration,
+)
+
+if TYPE_CHECKING:
+    from ncclient.capabilities import Capability
 
 NS = {"": "urn:ietf:params:xml:ns:yang:ietf-yang-library"}
 
 logger = logging.getLogger(__name__)
 script_dir = os.path.dirname(__file__)
 
+
 def build_credentials(
     cred_config: CredentialsConfig, protocol: Protocol, platform: Platform
 ) -> Credentials:
@@ -70,7 +77,9 @@ def discover_gnmi_protocol(
 
 
 def discover_netconf_protocol(
-    nc_capabilities: List[Capability], proto_config: ProtocolConfig, platform: Platform
+    nc_capabilities: List["Capability"],
+    proto_config: ProtocolConfig,
+    platform: Platform,
 ) -> Protocol:
     protocol_entity = Protocol(
         id="urn:ngsi-ld:Protocol:{0}:netconf".format(platform.id.split(":")[-1]),
@@ -90,12 +99,17 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
 
     platform_entity = build_platform(registration)
     logger.info("Creating %s" % platform_entity.id)
-    ngsi_ld_api.batchEntityUpsert([platform_entity.dict(exclude_none=True)])
+    ngsi_ld_api.upsertEntities([platform_entity.dict(exclude_none=True)])
 
     modules_discovered = False
 
     # Then NETCONF
     if registration.netconf:
+        # Protocol clients are only imported when registrations use them
+        from ncclient import manager
+
+        from platform_registry.netconf_legacy import loader as netconf_legacy_loader
+
         logger.info("Configuring netconf")
         netconf = registration.netconf
         device_params = {}
@@ -114,7 +128,7 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
             hostkey_verify=False,
             look_for_keys=False,
             allow_agent=False,
-            device_params=device_params
+            device_params=device_params,
         )
         capabilities = nc.server_capabilities
         nc_capabilities = []
@@ -131,12 +145,13 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
             nc_capabilities, registration.netconf, platform_entity
         )
         logger.info("Creating %s" % netconf_entity.id)
-        ngsi_ld_api.batchEntityUpsert([netconf_entity.dict(exclude_none=True)])
+        ngsi_ld_api.upsertEntities([netconf_entity.dict(exclude_none=True)])
 
         credentials_entity = build_credentials(
-            netconf.credentials, netconf_entity, platform_entity)
+            netconf.credentials, netconf_entity, platform_entity
+        )
         logger.info("Creating %s" % credentials_entity.id)
-        ngsi_ld_api.batchEntityUpsert([credentials_entity.dict(exclude_none=True)])
+        ngsi_ld_api.upsertEntities([credentials_entity.dict(exclude_none=True)])
 
         # Collect modules from YANG Library, if supported
         for nc_module in nc_modules:
@@ -145,8 +160,9 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                 # Check YANG Library latest release (RFC 8525)
                 if nc_module.parameters["revision"] == "2019-01-04":
                     logger.info(
-                        "Supported 2019-01-04 version of YANG Library (RFC 8525)")
-                    #load_yang_library_rfc8525()
+                        "Supported 2019-01-04 version of YANG Library (RFC 8525)"
+                    )
+                    # load_yang_library_rfc8525()
                     filter_path = "netconf_filters/yang-library-rfc8525.xml"
                     yl_filter = open(os.path.join(script_dir, filter_path)).read()
                     netconf_reply = nc.get(yl_filter).xml
@@ -159,12 +175,13 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                         name = datastore.find("name", NS).text
                         datastore_entity = Datastore(
                             id="urn:ngsi-ld:Datastore:{0}:{1}".format(
-                                platform_entity.id.split(":")[-1], name),
+                                platform_entity.id.split(":")[-1], name
+                            ),
                             name={"value": name},
                             supportedBy={"object": platform_entity.id},
                         )
                         logger.info("Creating %s" % datastore_entity.id)
-                        ngsi_ld_api.batchEntityUpsert(
+                        ngsi_ld_api.upsertEntities(
                             [datastore_entity.dict(exclude_none=True)], "update"
                         )
 
@@ -178,20 +195,24 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                             if ds_schema == name:
                                 ds_name = ds.find("name", NS).text
                                 datastore_id = "urn:ngsi-ld:Datastore:{0}:{1}".format(
-                                    platform_entity.id.split(":")[-1], ds_name)
+                                    platform_entity.id.split(":")[-1], ds_name
+                                )
                                 datastores.append(
-                                    {"type": "Relationship",
-                                    "object": datastore_id,
-                                    "datasetId": datastore_id}
+                                    {
+                                        "type": "Relationship",
+                                        "object": datastore_id,
+                                        "datasetId": datastore_id,
+                                    }
                                 )
                         schema_entity = Schema(
                             id="urn:ngsi-ld:Schema:{0}:{1}".format(
-                                platform_entity.id.split(":")[-1], name),
+                                platform_entity.id.split(":")[-1], name
+                            ),
                             name={"value": name},
                             implementedBy=datastores,
                         )
                         logger.info("Creating %s" % schema_entity.id)
-                        ngsi_ld_api.batchEntityUpsert(
+                        ngsi_ld_api.upsertEntities(
                             [schema_entity.dict(exclude_none=True)], "update"
                         )
 
@@ -205,26 +226,32 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                             if ms_name == name:
                                 schema_name = sch.find("name", NS).text
                                 schema_id = "urn:ngsi-ld:Schema:{0}:{1}".format(
-                                    platform_entity.id.split(":")[-1], schema_name)
+                                    platform_entity.id.split(":")[-1], schema_name
+                                )
                                 schemas.append(
-                                    {"type": "Relationship",
-                                    "object": schema_id,
-                                    "datasetId": schema_id}
+                                    {
+                                        "type": "Relationship",
+                                        "object": schema_id,
+                                        "datasetId": schema_id,
+                                    }
                                 )
 
                         module_set_entity = ModuleSet(
                             id="urn:ngsi-ld:ModuleSet:{0}:{1}".format(
-                                platform_entity.id.split(":")[-1], name),
-                            name={"value": name}
+                                platform_entity.id.split(":")[-1], name
+                            ),
+                            name={"value": name},
                         )
                         if schemas:
                             module_set_entity.definedBy = schemas
 
                         logger.info("Creating %s" % module_set_entity.id)
-                        ngsi_ld_api.batchEntityUpsert(
+                        ngsi_ld_api.upsertEntities(
                             [module_set_entity.dict(exclude_none=True)], "update"
                         )
 
+                        # Module entities are upserted in batches
+                        module_entities = {}
                         module_list = module_set.iterfind("module", NS)
                         for module in module_list:
                             name = module.find("name", NS).text
@@ -252,20 +279,18 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                                 deviation=deviation,
                                 feature=feature,
                                 datasetId=module_set_entity.id,
-                                conformanceType={"value": "implement"}
+                                conformanceType={"value": "implement"},
                             )
                             module_entity = Module(
-                                id="urn:ngsi-ld:Module:{0}:{1}".format(
-                                    name, revision
-                                ),
+                                id="urn:ngsi-ld:Module:{0}:{1}".format(name, revision),
                                 name={"value": name},
                                 revision={"value": revision},
                                 namespace={"value": namespace},
                                 belongsTo=belongs_to_rel,
                             )
                             logger.info("Creating %s" % module_entity.id)
-                            ngsi_ld_api.batchEntityUpsert(
-                                [module_entity.dict(exclude_none=True)], "update"
+                            module_entities[module_entity.id] = module_entity.dict(
+                                exclude_none=True
                             )
 
                             # Build Submodule entity
@@ -275,22 +300,22 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
 
                                 belongs_to_rel = BelongsTo(
                                     object=module_set_entity.id,
-                                    datasetId=module_set_entity.id
+                                    datasetId=module_set_entity.id,
                                 )
 
                                 submodule_entity = Submodule(
-                                id="urn:ngsi-ld:Submodule:{0}:{1}".format(
-                                    name, revision
-                                ),
-                                name={"value": name},
-                                revision={"value": revision},
-                                isSubmoduleOf={"object": module_entity.id},
-                                belongsTo=belongs_to_rel
-                            )
+                                    id="urn:ngsi-ld:Submodule:{0}:{1}".format(
+                                        name, revision
+                                    ),
+                                    name={"value": name},
+                                    revision={"value": revision},
+                                    isSubmoduleOf={"object": module_entity.id},
+                                    belongsTo=belongs_to_rel,
+                                )
                             logger.info("Creating %s" % submodule_entity.id)
-                            ngsi_ld_api.batchEntityUpsert(
-                                [submodule_entity.dict(exclude_none=True)], "update"
-                            )
+                            module_entities[
+                                submodule_entity.id
+                            ] = submodule_entity.dict(exclude_none=True)
 
                         # Find modules that are only imported
                         module_list = module_set.iterfind("import-only-module", NS)
@@ -304,20 +329,18 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                             belongs_to_rel = BelongsTo(
                                 object=module_set_entity.id,
                                 datasetId=module_set_entity.id,
-                                conformanceType={"value": "import"}
+                                conformanceType={"value": "import"},
                             )
                             module_entity = Module(
-                                id="urn:ngsi-ld:Module:{0}:{1}".format(
-                                    name, revision
-                                ),
+                                id="urn:ngsi-ld:Module:{0}:{1}".format(name, revision),
                                 name={"value": name},
                                 revision={"value": revision},
                                 namespace={"value": namespace},
                                 belongsTo=belongs_to_rel,
                             )
                             logger.info("Creating %s" % module_entity.id)
-                            ngsi_ld_api.batchEntityUpsert(
-                                [module_entity.dict(exclude_none=True)], "update"
+                            module_entities[module_entity.id] = module_entity.dict(
+                                exclude_none=True
                             )
 
                             # Build Submodule entity
@@ -327,7 +350,7 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
 
                                 belongs_to_rel = BelongsTo(
                                     object=module_set_entity.id,
-                                    datasetId=module_set_entity.id
+                                    datasetId=module_set_entity.id,
                                 )
 
                                 submodule_entity = Submodule(
@@ -337,20 +360,25 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                                     name={"value": name},
                                     revision={"value": revision},
                                     isSubmoduleOf={"object": module_entity.id},
-                                    belongsTo=belongs_to_rel
+                                    belongsTo=belongs_to_rel,
                                 )
                                 logger.info("Creating %s" % submodule_entity.id)
-                                ngsi_ld_api.batchEntityUpsert(
-                                    [submodule_entity.dict(exclude_none=True)], "update"
-                                )
+                                module_entities[
+                                    submodule_entity.id
+                                ] = submodule_entity.dict(exclude_none=True)
+
+                        ngsi_ld_api.chunkedEntityUpsert(
+                            module_entities.values(), "update"
+                        )
 
                     modules_discovered = True
 
                 # Check YANG Library first release (RFC 7895)
                 elif nc_module.parameters["revision"] == "2016-06-21":
                     logger.info(
-                        "Supported 2016-06-21 version of YANG Library (RFC 7895)")
-                    #load_yang_library_rfc7895()
+                        "Supported 2016-06-21 version of YANG Library (RFC 7895)"
+                    )
+                    # load_yang_library_rfc7895()
                     filter_path = "netconf_filters/yang-library-rfc7895.xml"
                     yl_filter = open(os.path.join(script_dir, filter_path)).read()
                     netconf_reply = nc.get(yl_filter).xml
@@ -361,15 +389,18 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                     # Produce ModuleSet entity
                     module_set_entity = ModuleSet(
                         id="urn:ngsi-ld:ModuleSet:{0}:{1}".format(
-                            platform_entity.id.split(":")[-1], module_set_id),
+                            platform_entity.id.split(":")[-1], module_set_id
+                        ),
                         name={"value": module_set_id},
                         definedBy={"object": platform_entity.id},
                     )
                     logger.info("Creating %s" % module_set_entity.id)
-                    ngsi_ld_api.batchEntityUpsert(
+                    ngsi_ld_api.upsertEntities(
                         [module_set_entity.dict(exclude_none=True)], "update"
                     )
 
+                    # Module entities are upserted in batches
+                    module_entities = {}
                     module_list = reply_data.iterfind("module", NS)
                     for module in module_list:
                         name = module.find("name", NS).text
@@ -382,9 +413,7 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
 
                         feature = None
                         if feature_list:
-                            feature = {
-                                "value": [feat.text for feat in feature_list]
-                            }
+                            feature = {"value": [feat.text for feat in feature_list]}
 
                         deviation = None
                         if deviation_list:
@@ -399,20 +428,18 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                             deviation=deviation,
                             feature=feature,
                             datasetId=module_set_entity.id,
-                            conformanceType={"value": conformance_type}
+                            conformanceType={"value": conformance_type},
                         )
                         module_entity = Module(
-                            id="urn:ngsi-ld:Module:{0}:{1}".format(
-                                name, revision
-                            ),
+                            id="urn:ngsi-ld:Module:{0}:{1}".format(name, revision),
                             name={"value": name},
                             revision={"value": revision},
                             namespace={"value": namespace},
                             belongsTo=belongs_to_rel,
                         )
                         logger.info("Creating %s" % module_entity.id)
-                        ngsi_ld_api.batchEntityUpsert(
-                            [module_entity.dict(exclude_none=True)], "update"
+                        module_entities[module_entity.id] = module_entity.dict(
+                            exclude_none=True
                         )
 
                         # Build Submodule entity
@@ -422,7 +449,7 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
 
                             belongs_to_rel = BelongsTo(
                                 object=module_set_entity.id,
-                                datasetId=module_set_entity.id
+                                datasetId=module_set_entity.id,
                             )
 
                             submodule_entity = Submodule(
@@ -432,29 +459,41 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
                                 name={"value": name},
                                 revision={"value": revision},
                                 isSubmoduleOf={"object": module_entity.id},
-                                belongsTo=belongs_to_rel
+                                belongsTo=belongs_to_rel,
                             )
                             logger.info("Creating %s" % submodule_entity.id)
-                            ngsi_ld_api.batchEntityUpsert(
-                                [submodule_entity.dict(exclude_none=True)], "update"
-                            )
+                            module_entities[
+                                submodule_entity.id
+                            ] = submodule_entity.dict(exclude_none=True)
+                    ngsi_ld_api.chunkedEntityUpsert(module_entities.values(), "update")
                     modules_discovered = True
                 else:
-                    logger.error("YANG Library {0} release not supported.".format(
-                        nc_module.parameters["revision"]
-                    ))
+                    logger.error(
+                        "YANG Library {0} release not supported.".format(
+                            nc_module.parameters["revision"]
+                        )
+                    )
                 break
 
         # Discover modules through NETCONF capabalities
         if not modules_discovered:
-            logger.info("Collecting modules through legacy NETCONF capabilities mechanism")
+            logger.info(
+                "Collecting modules through legacy NETCONF capabilities mechanism"
+            )
             netconf_legacy_loader(
-                platform=platform_entity,netconf=netconf_entity,
-                credentials=credentials_entity, ngsi_ld_api=ngsi_ld_api)
+                platform=platform_entity,
+                netconf=netconf_entity,
+                credentials=credentials_entity,
+                ngsi_ld_api=ngsi_ld_api,
+            )
             modules_discovered = True
 
     # Check gNMI support
     if registration.gnmi:
+        from pygnmi.client import gNMIclient
+
+        from platform_registry.gnmi_legacy import loader as gnmi_legacy_loader
+
         gnmi = registration.gnmi
         gc = gNMIclient(
             target=(str(gnmi.address), gnmi.port),
@@ -466,20 +505,24 @@ def loader(registration: Registration, ngsi_ld_api: NGSILDAPI) -> None:
         gc.connect()
         capabilities = gc.capabilities()
         gnmi_entity = discover_gnmi_protocol(
-            capabilities, registration.gnmi, platform_entity)
+            capabilities, registration.gnmi, platform_entity
+        )
         logger.info("Creating %s" % gnmi_entity.id)
-        ngsi_ld_api.batchEntityUpsert([gnmi_entity.dict(exclude_none=True)])
+        ngsi_ld_api.upsertEntities([gnmi_entity.dict(exclude_none=True)])
 
         credentials_entity = build_credentials(
-            gnmi.credentials, gnmi_entity, platform_entity)
+            gnmi.credentials, gnmi_entity, platform_entity
+        )
         logger.info("Creating %s" % credentials_entity.id)
-        ngsi_ld_api.batchEntityUpsert([credentials_entity.dict(exclude_none=True)])
+        ngsi_ld_api.upsertEntities([credentials_entity.dict(exclude_none=True)])
 
         # Discover modules through gNMI capabalities
         if not modules_discovered:
             logger.info("Collecting modules through legacy gNMI capabilities mechanism")
             gnmi_legacy_loader(
-                platform=platform_entity,gnmi=gnmi_entity,
-                credentials=credentials_entity,ngsi_ld_api=ngsi_ld_api)
+                platform=platform_entity,
+                gnmi=gnmi_entity,
+                credentials=credentials_entity,
+                ngsi_ld_api=ngsi_ld_api,
+            )
             modules_discovered = True
-